@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agent.llm import invoke_chat, router_model
+from config.loader import CompanyConfig, as_company_config
+from utils.metrics import REGISTRY
+
+
+Fallback = Callable[[CompanyConfig, Dict[str, Any]], Dict[str, Any]]
+
+# Future result for a batch of one: route it with the single-email prompt (not a fallback)
+_SOLO: Dict[str, Any] = {}
+
+_LINE_RE = re.compile(r"(?im)^\s*(?:email\s*)?#?(\d+)\s*[:=\-).]+\s*[\"']?([a-z0-9_\-]+)")
+
+
+def _first_json(text: str) -> Any:
+    """First JSON object or array embedded in `text` (models like to wrap it in prose or ``` fences)."""
+    decoder = json.JSONDecoder()
+    for m in re.finditer(r"[\[{]", text):
+        try:
+            obj, _ = decoder.raw_decode(text, m.start())
+        except ValueError:
+            continue
+        if isinstance(obj, (dict, list)) and obj:
+            return obj
+    return None
+
+
+def parse_batch_reply(text: str, n: int, allowed: Sequence[str]) -> Dict[int, str]:
+    """
+    Map 1-based email numbers to department ids from a batch reply.
+
+    Accepts {"1": "sales", ...}, {"results": [...]}, [{"id": 1, "department_id": "sales"}, ...],
+    ["sales", "billing", ...] (positional) and "1: sales" lines. Unknown ids and
+    out-of-range numbers are dropped, so the caller can fall back per item.
+    """
+    allowed_set = set(allowed)
+    pairs: List[Any] = []
+
+    obj = _first_json(text or "")
+    if isinstance(obj, dict) and len(obj) == 1 and isinstance(next(iter(obj.values())), list):
+        obj = next(iter(obj.values()))
+    if isinstance(obj, dict):
+        pairs = list(obj.items())
+    elif isinstance(obj, list):
+        for pos, entry in enumerate(obj, start=1):
+            if isinstance(entry, dict):
+                idx = entry.get("id", entry.get("email", entry.get("n", pos)))
+                pairs.append((idx, entry.get("department_id") or entry.get("department")))
+            else:
+                pairs.append((pos, entry))
+    else:
+        pairs = [(m.group(1), m.group(2)) for m in _LINE_RE.finditer(text or "")]
+
+    out: Dict[int, str] = {}
+    for idx, dept in pairs:
+        try:
+            i = int(str(idx).strip().lstrip("#"))
+        except ValueError:
+            continue
+        d = str(dept or "").strip().strip("\"'").lower()
+        if 1 <= i <= n and d in allowed_set:
+            out.setdefault(i, d)
+    return out
+
+
+class _Item:
+    __slots__ = ("snap", "email", "future", "deadline")
+
+    def __init__(self, snap: CompanyConfig, email: Dict[str, Any], wait_s: float):
+        self.snap = snap
+        self.email = email
+        self.future: Future = Future()
+        self.deadline = time.monotonic() + wait_s
+
+
+class BatchRouter:
+    """
+    Collects emails that need the LLM router and classifies up to `max_batch`
+    of them in a single request, waiting at most `window_s` after the first
+    one arrives. Callers block in `route()` until their batch is answered.
+    A caller that is the only one routing (serial runs) is sent right away
+    instead of waiting out the window for company that never comes.
+
+    Replies are parsed leniently (`parse_batch_reply`); any email the batch
+    reply does not answer, or every email of a batch whose request failed, is
+    routed on its own with `fallback` (the single-email LLM router).
+    Batches are keyed by config digest, so one request never mixes department lists.
+    """
+
+    def __init__(
+        self,
+        max_batch: int = 8,
+        window_s: float = 0.05,
+        body_chars: int = 1200,
+        parallel: int = 2,
+        invoke: Callable[..., str] = invoke_chat,
+    ):
+        self.max_batch = max(1, int(max_batch))
+        self.window_s = max(0.0, float(window_s))
+        self.body_chars = int(body_chars)
+        self._invoke = invoke
+
+        self._cond = threading.Condition()
+        self._pending: Dict[str, List[_Item]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._active = 0
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(parallel)), thread_name_prefix="batch-router")
+
+        self.requests = 0
+        self.emails = 0
+        self.fallbacks = 0
+
+    # ----------------------------
+    # Public
+    # ----------------------------
+
+    def route(self, cfg: Any, email: Dict[str, Any], fallback: Fallback) -> Dict[str, Any]:
+        snap = as_company_config(cfg)
+        if self.max_batch <= 1 or not snap.dept_ids:
+            return fallback(snap, email)
+
+        with self._cond:
+            self._active += 1
+            item = _Item(snap, email, self.window_s if self._active > 1 else 0.0)
+            self._pending.setdefault(snap.digest, []).append(item)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._collect_loop, name="batch-router-collector", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+        try:
+            result = item.future.result()
+        finally:
+            with self._cond:
+                self._active -= 1
+
+        if result is _SOLO:
+            return fallback(snap, email)
+        if result is None:
+            with self._cond:
+                self.fallbacks += 1
+            REGISTRY.inc("aai_router_batch_fallbacks_total")
+            return fallback(snap, email)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "emails": self.emails,
+                "fallbacks": self.fallbacks,
+                "emails_per_request": (self.emails / self.requests) if self.requests else 0.0,
+            }
+
+    # ----------------------------
+    # Collector
+    # ----------------------------
+
+    def _take_ready(self) -> Optional[List[_Item]]:
+        # caller holds _cond
+        now = time.monotonic()
+        for key, items in list(self._pending.items()):
+            if len(items) >= self.max_batch or now >= items[0].deadline:
+                batch, rest = items[: self.max_batch], items[self.max_batch:]
+                if rest:
+                    self._pending[key] = rest
+                else:
+                    del self._pending[key]
+                return batch
+        return None
+
+    def _next_deadline(self) -> Optional[float]:
+        # caller holds _cond
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        return max(0.0, min(items[0].deadline - now for items in self._pending.values()))
+
+    def _collect_loop(self) -> None:
+        while True:
+            with self._cond:
+                batch = self._take_ready()
+                while batch is None:
+                    self._cond.wait(self._next_deadline())
+                    batch = self._take_ready()
+            self._pool.submit(self._run_batch, batch)
+
+    # ----------------------------
+    # One request
+    # ----------------------------
+
+    def _messages(self, batch: Sequence[_Item]) -> List[Any]:
+        allowed = list(batch[0].snap.dept_ids) + ["needs_review"]
+        system = (
+            "You route incoming emails to a department for ONE company.\n"
+            "You get several numbered emails. For EACH email pick the best department_id from the allowed list.\n"
+            'Return ONLY a JSON object mapping the email number to its department_id, e.g. {"1": "...", "2": "..."}. '
+            "No extra words.\n\n"
+            f"ALLOWED: {allowed}\n"
+        )
+
+        blocks = []
+        for n, item in enumerate(batch, start=1):
+            e = item.email
+            to_val = e.get("to") or e.get("recipient") or e.get("email_to") or ""
+            to_line = " ".join(str(x) for x in to_val) if isinstance(to_val, list) else str(to_val)
+            body = str(e.get("body") or e.get("text") or "")
+            if self.body_chars > 0 and len(body) > self.body_chars:
+                body = body[: self.body_chars] + " [...]"
+            blocks.append(
+                f"### EMAIL {n}\n"
+                f"FROM: {e.get('from') or e.get('sender') or ''}\nTO: {to_line}\n"
+                f"SUBJECT: {e.get('subject') or ''}\nBODY:\n{body}"
+            )
+        return [SystemMessage(content=system), HumanMessage(content="\n\n".join(blocks))]
+
+    def _run_batch(self, batch: List[_Item]) -> None:
+        if len(batch) == 1:
+            # Nothing to amortize: the single-email prompt is cheaper and hits the response cache
+            batch[0].future.set_result(_SOLO)
+            return
+
+        allowed = list(batch[0].snap.dept_ids) + ["needs_review"]
+        try:
+            # Batch compositions never repeat, so there is no point caching them
+            reply = self._invoke(self._messages(batch), model=router_model(), temperature=0.0, use_cache=False)
+            answers = parse_batch_reply(reply, len(batch), allowed)
+        except Exception:
+            answers = {}
+
+        with self._cond:
+            self.requests += 1
+            self.emails += len(batch)
+        REGISTRY.inc("aai_router_batches_total")
+        REGISTRY.inc("aai_router_batched_emails_total", amount=len(batch))
+
+        for n, item in enumerate(batch, start=1):
+            dept = answers.get(n)
+            if dept is None:
+                item.future.set_result(None)
+            else:
+                conf = 0.65 if dept != "needs_review" else 0.45
+                item.future.set_result({"department_id": dept, "confidence": conf, "stage": "llm", "batched": True})
+
+
+# ----------------------------
+# Process-wide instance
+# ----------------------------
+
+_router_lock = threading.Lock()
+_router: Optional[BatchRouter] = None
+_router_pid: Optional[int] = None
+
+
+def batch_size() -> int:
+    return int(os.getenv("AAI_ROUTER_BATCH_SIZE", "8"))
+
+
+def get_batch_router() -> BatchRouter:
+    """Shared router configured from AAI_ROUTER_BATCH_SIZE / AAI_ROUTER_BATCH_WINDOW_MS / AAI_ROUTER_BATCH_BODY_CHARS."""
+    global _router, _router_pid
+    with _router_lock:
+        # Threads do not survive fork(); pool workers build their own
+        if _router is None or _router_pid != os.getpid():
+            _router = BatchRouter(
+                max_batch=batch_size(),
+                window_s=float(os.getenv("AAI_ROUTER_BATCH_WINDOW_MS", "50")) / 1000.0,
+                body_chars=int(os.getenv("AAI_ROUTER_BATCH_BODY_CHARS", "1200")),
+            )
+            _router_pid = os.getpid()
+        return _router
@@ -1,15 +1,12 @@
 # imports
-from langchain_ollama import ChatOllama
-from langchain_core.messages import HumanMessage, SystemMessage
-
-def draft_reply(email, triage_result):
-    # Initialize Ollama LLM (connects to local Ollama instance)
-    # Default model is "llama3.2" - change if you have a different model
-    llm = ChatOllama(
-        model="llama3.2",  # Change to your preferred Ollama model (e.g., "llama2", "mistral", "phi3")
-        temperature=0.2,
-        base_url="http://localhost:11434"  # Default Ollama API endpoint
-    )
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from agent.llm import invoke_chat, stream_chat, draft_model, draft_temperature
+
+_ROLES = {"system": SystemMessage, "human": HumanMessage, "ai": AIMessage}
+
+
+def draft_messages(email, triage_result):
     
     # Extract department from triage_result structure:
     # {
@@ -30,12 +27,26 @@ def draft_reply(email, triage_result):
     # Create prompt with proper string formatting
     draft_prompt = f"Create an answer to the email from the customer. No filler text, just the Mailcontent. Dont make filler content. Use the following Department this email is directed to: {department}. Use the department as a whole team that answers.  Our Company name is TRIAG3."
     
-    messages = [
-        SystemMessage(content=draft_prompt),
-        HumanMessage(content=email_content)
-    ]
-    
-    #llm call
-    response = llm.invoke(messages)
-    # Return plain text content from the response
-    return response.content
+    # (role, content) pairs: plain data, so a conversation can live in the graph state
+    return [("system", draft_prompt), ("human", email_content)]
+
+
+def run_draft(messages, on_token=None, stats=None):
+    # messages: (role, content) pairs from draft_messages(), possibly continued with
+    # ("ai", draft) / ("human", edit instruction) turns for revisions
+    chat = [_ROLES[role](content=content) for role, content in messages]
+
+    #llm call (shared Ollama client + persistent response cache)
+    # Model/base_url come from AAI_DRAFT_MODEL / OLLAMA_BASE_URL (default "llama3.2" on localhost)
+    if on_token is None:
+        return invoke_chat(chat, model=draft_model(), temperature=draft_temperature(), stats=stats)
+
+    # Streaming: on_token gets each chunk as it arrives; timings go into `stats`
+    text, timings = stream_chat(chat, model=draft_model(), temperature=draft_temperature(), on_token=on_token)
+    if stats is not None:
+        stats.update(timings)
+    return text
+
+
+def draft_reply(email, triage_result, on_token=None, stats=None):
+    return run_draft(draft_messages(email, triage_result), on_token=on_token, stats=stats)
@@ -2,28 +2,80 @@ from __future__ import annotations
 
 import os
 import re
-from typing import Any, Dict, Literal
+import sys
+import threading
+from email.utils import parseaddr
+from typing import Any, Dict, List, Literal, Optional, Tuple
 
 from langgraph.graph import StateGraph, END
-from langchain_ollama import ChatOllama
 from langchain_core.messages import SystemMessage, HumanMessage
 
 from agent.state import EmailState
-from agent.draft_agent import draft_reply
-from config.loader import (
-    load_company_config,
-    dept_id_to_name,
-    dept_id_to_tone,
-    alias_to_department,
-    employees_by_department,
-    fallback_employee_email,
+from agent.draft_agent import draft_messages, run_draft
+from agent.batch_router import batch_size, get_batch_router
+from agent.llm import CallBudget, budget_from_env, invoke_chat, router_model
+from agent.triage_agent import triage
+from config.loader import CompanyConfig, as_company_config, load_company_snapshot
+from ingestion.preprocess import estimate_tokens, preprocess_email, truncate_to_tokens
+from memory.threads import ThreadIndex, new_text, open_thread_index
+from memory.store import (
+    MemoryStore,
+    get_sender_owner,
+    match_department,
+    open_memory_store,
+    set_sender_department,
+    set_sender_owner,
 )
+from routing.dedup import NearDuplicateIndex, content_digest, fingerprint_text, minhash
+from routing.knn import KnnIndex, email_text, open_knn_index
+from utils.metrics import REGISTRY, record_routing_stage, timed_node
 
 
 # ----------------------------
 # Helpers
 # ----------------------------
 
+def is_interactive() -> bool:
+    return os.getenv("AAI_INTERACTIVE", "1").strip().lower() not in {"0", "false", "no"}
+
+
+def stream_drafts_enabled() -> bool:
+    return os.getenv("AAI_STREAM_DRAFTS", "1").strip().lower() not in {"0", "false", "no"}
+
+
+def _interactive(state: EmailState) -> bool:
+    interactive = state.get("interactive")
+    return is_interactive() if interactive is None else bool(interactive)
+
+
+def _token_budget(name: str, default: int) -> Optional[int]:
+    """Token budget from env var `name`; 0 (or a negative value) disables it."""
+    try:
+        value = int(os.getenv(name, str(default)))
+    except ValueError:
+        value = default
+    return value if value > 0 else None
+
+
+def prompt_token_budget() -> Optional[int]:
+    return _token_budget("AAI_PROMPT_TOKEN_BUDGET", 3000)
+
+
+def router_token_budget() -> Optional[int]:
+    return _token_budget("AAI_ROUTER_TOKEN_BUDGET", 800)
+
+
+def prompt_token_counts() -> Dict[str, int]:
+    """Body tokens before and after preprocessing, plus truncated emails (merged across pool workers)."""
+    out = {"before": 0, "after": 0, "truncated": 0}
+    for c in REGISTRY.snapshot()["counters"]:
+        if c["name"] == "aai_prompt_tokens_total":
+            out[c["labels"].get("phase", "")] = int(c["value"])
+        elif c["name"] == "aai_prompt_truncated_total":
+            out["truncated"] = int(c["value"])
+    return out
+
+
 def _get_to_addresses(email: Dict[str, Any]) -> str:
     to_val = email.get("to") or email.get("recipient") or email.get("email_to") or ""
     if isinstance(to_val, list):
@@ -31,13 +83,9 @@ def _get_to_addresses(email: Dict[str, Any]) -> str:
     return str(to_val)
 
 
-def llm_route_department(cfg: Dict[str, Any], email: Dict[str, Any]) -> Dict[str, Any]:
-    dept_ids = [
-        str(d.get("id"))
-        for d in (cfg.get("departments", []) or [])
-        if isinstance(d, dict) and d.get("id")
-    ]
-    dept_ids = [d.strip().lower() for d in dept_ids if d and d.strip()]
+def llm_route_department(cfg: Any, email: Dict[str, Any]) -> Dict[str, Any]:
+    snap = as_company_config(cfg)
+    dept_ids = list(snap.dept_ids)
     if not dept_ids:
         return {"department_id": "needs_review", "confidence": 0.40}
 
@@ -47,6 +95,8 @@ def llm_route_department(cfg: Dict[str, Any], email: Dict[str, Any]) -> Dict[str
     body = str(email.get("body") or email.get("text") or "")
     sender = str(email.get("from") or email.get("sender") or "")
     to_line = _get_to_addresses(email)
+    # The department is almost always clear from the opening lines; the draft gets the full budget
+    body, _ = truncate_to_tokens(body, router_token_budget())
 
     blob = f"FROM: {sender}\nTO: {to_line}\nSUBJECT: {subject}\nBODY:\n{body}"
 
@@ -57,68 +107,215 @@ def llm_route_department(cfg: Dict[str, Any], email: Dict[str, Any]) -> Dict[str
     )
 
     try:
-        llm = ChatOllama(
-            model=os.getenv("AAI_ROUTER_MODEL", "llama3.2"),
-            temperature=0.0,
-            base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
-        )
-        resp = llm.invoke([SystemMessage(content=system), HumanMessage(content=blob)])
-        raw = (resp.content or "").strip().strip('"').strip("'").lower()
+        # temperature=0.0 is deterministic, so identical emails are answered from the LLM cache
+        resp = invoke_chat([SystemMessage(content=system), HumanMessage(content=blob)], model=router_model(), temperature=0.0)
+        raw = (resp or "").strip().strip('"').strip("'").lower()
 
         if raw in allowed:
             conf = 0.65 if raw != "needs_review" else 0.45
-            return {"department_id": raw, "confidence": conf}
+            return {"department_id": raw, "confidence": conf, "stage": "llm"}
 
-        return {"department_id": "needs_review", "confidence": 0.45}
+        return {"department_id": "needs_review", "confidence": 0.45, "stage": "llm"}
     except Exception:
-        return {"department_id": "needs_review", "confidence": 0.40}
+        return {"department_id": "needs_review", "confidence": 0.40, "stage": "llm"}
 
 
-def route_department(cfg: Dict[str, Any], email: Dict[str, Any]) -> Dict[str, Any]:
-    # 1) Alias routing
-    dept_map = alias_to_department(cfg)
-    to_text = _get_to_addresses(email).lower()
-    for addr, dep_id in (dept_map or {}).items():
-        if str(addr).lower() in to_text:
-            return {"department_id": str(dep_id).lower(), "confidence": 0.95}
+def _alias_stage(snap: CompanyConfig, email: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Parsed To/Cc/Delivered-To looked up in the alias hash index
+    dep_id = snap.alias_index.route(email)
+    if dep_id:
+        return {"department_id": dep_id, "confidence": 0.95, "stage": "alias"}
+    return None
 
-    # 2) Keyword routing
-    body = (email.get("body") or email.get("text") or "").lower()
-    subject = (email.get("subject") or "").lower()
-    blob = subject + "\n" + body
 
-    rules = (cfg.get("routing_rules", {}) or {}).get("keyword_to_department", []) or []
-    for rule in rules:
-        if not isinstance(rule, dict):
-            continue
-        dep_id = str(rule.get("department_id") or "").strip().lower()
-        if not dep_id:
+def _triage_stage(snap: CompanyConfig, email: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Graded keyword scoring of agent.triage_agent, mapped onto this company's departments
+    result = triage(email)
+    dep_id = snap.triage_department_map.get(str(result.get("department") or "").lower())
+    if not dep_id:
+        return None
+    return {
+        "department_id": dep_id,
+        "confidence": float(result.get("confidence") or 0.0),
+        "triage_tags": list(result.get("tags") or []),
+        "stage": "triage",
+    }
+
+
+def _keyword_stage(snap: CompanyConfig, email: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Company keyword rules (single pass); more distinct hits -> more confidence, a tie -> less
+    body = email.get("body") or email.get("text") or ""
+    subject = email.get("subject") or ""
+    counts = snap.keyword_matcher.counts(subject + "\n" + body)
+    if not counts:
+        return None
+    hits = max(counts.values())
+    # Ties go to the department listed first in the config
+    leaders = [g for g in snap.keyword_matcher.groups if counts.get(g) == hits]
+    dep_id = leaders[0]
+    confidence = 0.65 + 0.05 * min(hits, 4)
+    if len(leaders) > 1:
+        confidence = min(confidence, 0.60)
+    return {"department_id": dep_id, "confidence": round(confidence, 4), "keyword_hits": hits, "stage": "keyword"}
+
+
+def _llm_stage(snap: CompanyConfig, email: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if not routing_budget().acquire():
+        REGISTRY.inc("aai_routing_llm_budget_exhausted_total")
+        return {"department_id": "needs_review", "confidence": 0.30, "stage": "budget"}
+    # Batched with other unresolved emails when AAI_ROUTER_BATCH_SIZE > 1
+    if batch_size() > 1:
+        return get_batch_router().route(snap, email, fallback=llm_route_department)
+    return llm_route_department(snap, email)
+
+
+def _run_stage(stage: str, snap: CompanyConfig, email: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if stage == "alias":
+        return _alias_stage(snap, email)
+    if stage == "triage":
+        return _triage_stage(snap, email)
+    if stage == "keyword":
+        return _keyword_stage(snap, email)
+    if stage == "knn":
+        return knn_route_department(snap, email)
+    if stage == "llm":
+        return _llm_stage(snap, email)
+    return None
+
+
+def route_department(cfg: Any, email: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run the routing cascade (routing_rules.cascade; alias -> keyword -> triage ->
+    knn -> llm by default). The first stage whose confidence reaches its
+    threshold wins. Without the LLM stage the best result seen so far is used.
+    Once the LLM routing budget is spent, emails go to needs_review.
+    """
+    snap = as_company_config(cfg)
+    best: Optional[Dict[str, Any]] = None
+    for stage in snap.routing_stages:
+        routed = _run_stage(stage, snap, email)
+        if routed is None:
             continue
-        for kw in (rule.get("keywords") or []):
-            kw_s = str(kw).strip().lower()
-            if kw_s and kw_s in blob:
-                return {"department_id": dep_id, "confidence": 0.75}
+        if routed["stage"] == "budget" or routed["confidence"] >= snap.stage_thresholds.get(stage, 0.0):
+            return routed
+        if best is None or routed["confidence"] > best["confidence"]:
+            best = routed
+    return best or {"department_id": "needs_review", "confidence": 0.30, "stage": "none"}
+
+
+# ----------------------------
+# LLM routing budget
+# ----------------------------
+
+_budget_lock = threading.Lock()
+_budget: Optional[CallBudget] = None
+_budget_pid: Optional[int] = None
+
+
+def routing_budget() -> CallBudget:
+    """
+    LLM routing calls allowed in this process: AAI_LLM_ROUTING_BUDGET per run
+    and AAI_LLM_ROUTING_PER_MINUTE (unset = no cap). Counted per email, so a
+    batched request uses one unit per email in it.
+    """
+    global _budget, _budget_pid
+    with _budget_lock:
+        if _budget is None or _budget_pid != os.getpid():
+            _budget = budget_from_env("AAI_LLM_ROUTING")
+            _budget_pid = os.getpid()
+        return _budget
+
+
+def reset_routing_budget() -> None:
+    global _budget
+    with _budget_lock:
+        _budget = None
+
+
+def routing_stage_counts() -> Dict[str, int]:
+    """Emails resolved per routing stage so far (merged across pool workers)."""
+    return {
+        c["labels"].get("stage", ""): int(c["value"])
+        for c in REGISTRY.snapshot()["counters"]
+        if c["name"] == "aai_routing_decisions_total"
+    }
+
+
+# ----------------------------
+# Similarity routing
+# ----------------------------
+
+def knn_index() -> Optional[KnnIndex]:
+    """
+    kNN index of routed emails (AAI_KNN_INDEX, default "knn_index" next to the
+    sender memory), or None when AAI_KNN_ROUTER=0.
+    """
+    if os.getenv("AAI_KNN_ROUTER", "1").strip().lower() in {"0", "false", "no"}:
+        return None
+    path = os.getenv("AAI_KNN_INDEX") or os.path.join(
+        os.path.dirname(os.getenv("AAI_MEMORY_PATH", "memory/memory_store.json")) or ".", "knn_index"
+    )
+    return open_knn_index(path)
+
+
+def knn_route_department(cfg: Any, email: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Route by vote of the most similar past emails. Returns None unless at least
+    AAI_KNN_MIN_NEIGHBORS (3) of the AAI_KNN_K (15) nearest agree; the
+    confidence threshold is the cascade's "knn" threshold.
+    """
+    index = knn_index()
+    if index is None or index.count == 0:
+        return None
+    snap = as_company_config(cfg)
+    vote = index.classify(
+        email_text(email),
+        k=int(os.getenv("AAI_KNN_K", "15")),
+        min_similarity=float(os.getenv("AAI_KNN_MIN_SIMILARITY", "0.2")),
+        allowed=snap.dept_ids,
+    )
+    if vote is None:
+        return None
+    if vote["support"] < int(os.getenv("AAI_KNN_MIN_NEIGHBORS", "3")):
+        return None
+    return {
+        "department_id": vote["department_id"],
+        # Below alias/memory: a neighbor vote is evidence, not a rule
+        "confidence": round(min(0.85, vote["confidence"]), 4),
+        "knn_support": vote["support"],
+        "knn_similarity": round(vote["similarity"], 4),
+        "stage": "knn",
+    }
+
+
+# Stages whose unreviewed result is still a rule, not a guess, and may train the kNN index
+_RULE_STAGES = {"alias", "keyword"}
 
-    # 3) LLM fallback
-    return llm_route_department(cfg, email)
 
+def _learn_similar(state: EmailState, reviewed: bool) -> None:
+    """Add a reviewed (or rule-based) routing outcome to the kNN index; model guesses are never learned."""
+    dept_id = state.get("department_id") or "needs_review"
+    if dept_id == "needs_review" or not (reviewed or state.get("routing_stage") in _RULE_STAGES):
+        return
+    index = knn_index()
+    if index is not None:
+        index.add(email_text(state["email"]), dept_id)
 
-def assign_owner(cfg: Dict[str, Any], dept_id: str, rr_state: Dict[str, int]) -> Dict[str, str]:
-    emps_by_dep = employees_by_department(cfg) or {}
-    candidates = emps_by_dep.get(dept_id, []) or []
 
-    # Fallback employee
-    fb = (fallback_employee_email(cfg) or "").strip().lower()
+def assign_owner(cfg: Any, dept_id: str, rr_state: Dict[str, int]) -> Dict[str, str]:
+    snap = as_company_config(cfg)
+    candidates = snap.employees_by_department.get(dept_id, ()) or ()
 
     if not candidates:
-        # Try fallback employee details from cfg["employees"]
+        # Fallback employee
+        fb = snap.fallback_employee_email or ""
         if fb:
-            for emp in (cfg.get("employees") or []):
-                if str(emp.get("email", "")).strip().lower() == fb:
-                    return {
-                        "owner_email": fb,
-                        "signature": str(emp.get("signature") or "").strip(),
-                    }
+            emp = snap.fallback_employee
+            if emp is not None:
+                return {
+                    "owner_email": fb,
+                    "signature": str(emp.get("signature") or "").strip(),
+                }
             return {"owner_email": fb, "signature": ""}
         return {"owner_email": "", "signature": ""}
 
@@ -132,6 +329,235 @@ def assign_owner(cfg: Dict[str, Any], dept_id: str, rr_state: Dict[str, int]) ->
     }
 
 
+def _owner_assignment(snap: CompanyConfig, dept_id: str, owner_email: str) -> Optional[Dict[str, str]]:
+    """Assignment for a specific owner, if they still belong to `dept_id`."""
+    for emp in snap.employees_by_department.get(dept_id, ()) or ():
+        if str(emp.get("email") or "").strip().lower() == owner_email:
+            return {"owner_email": owner_email, "signature": str(emp.get("signature") or "").strip()}
+    return None
+
+
+# ----------------------------
+# Near-duplicates
+# ----------------------------
+
+_dedup_lock = threading.Lock()
+_dedup: Optional[NearDuplicateIndex] = None
+_dedup_pid: Optional[int] = None
+
+# What a near-duplicate takes over from its cluster representative
+# Only the routing decision is shared across a cluster: the fingerprint masks
+# digits, so members can differ in invoice numbers, amounts and customers.
+_CLUSTER_KEYS = ("department_id", "confidence", "owner_email", "signature", "tone")
+
+
+def near_duplicates() -> Optional[NearDuplicateIndex]:
+    """
+    Recent cluster representatives (match at AAI_DEDUP_THRESHOLD estimated Jaccard
+    similarity, default 0.8, within AAI_DEDUP_WINDOW_S seconds, default 3600),
+    or None when AAI_DEDUP=0.
+    """
+    global _dedup, _dedup_pid
+    if os.getenv("AAI_DEDUP", "1").strip().lower() in {"0", "false", "no"}:
+        return None
+    with _dedup_lock:
+        if _dedup is None or _dedup_pid != os.getpid():
+            _dedup = NearDuplicateIndex(
+                threshold=float(os.getenv("AAI_DEDUP_THRESHOLD", "0.8")),
+                window_s=float(os.getenv("AAI_DEDUP_WINDOW_S", "3600")),
+                max_entries=int(os.getenv("AAI_DEDUP_MAX_ENTRIES", "10000")),
+            )
+            _dedup_pid = os.getpid()
+        return _dedup
+
+
+def reset_near_duplicates() -> None:
+    global _dedup
+    with _dedup_lock:
+        _dedup = None
+
+
+def _register_cluster(state: EmailState) -> None:
+    """Make an approved email the representative of its cluster."""
+    index = near_duplicates()
+    sig = state.get("fingerprint")
+    if index is None or sig is None or not state.get("draft"):
+        return
+    if state.get("routing_stage") in {"duplicate", "budget"}:
+        return
+    email = state["email"]
+    rep = str(email.get("id") or email.get("message_id") or "").strip() or f"fp:{sig[:8].hex()}"
+    payload = {k: state.get(k) for k in _CLUSTER_KEYS}
+    # The draft is only reused for a resend of this exact email by the same sender
+    payload["digest"] = content_digest(email)
+    payload["draft"] = state.get("draft")
+    index.add(sig, rep, payload)
+
+
+# ----------------------------
+# Threads
+# ----------------------------
+
+def thread_index() -> Optional[ThreadIndex]:
+    """
+    Conversation index (AAI_THREAD_DB, default "threads.sqlite" next to the sender
+    memory), or None when AAI_THREADS=0.
+    """
+    if os.getenv("AAI_THREADS", "1").strip().lower() in {"0", "false", "no"}:
+        return None
+    path = os.getenv("AAI_THREAD_DB") or os.path.join(
+        os.path.dirname(os.getenv("AAI_MEMORY_PATH", "memory/memory_store.json")) or ".", "threads.sqlite"
+    )
+    return open_thread_index(
+        path,
+        summary_chars=int(os.getenv("AAI_THREAD_SUMMARY_CHARS", "1500")),
+        subject_window_s=float(os.getenv("AAI_THREAD_SUBJECT_WINDOW_DAYS", "14")) * 86400.0,
+    )
+
+
+def _record_thread(state: EmailState) -> None:
+    """Add an approved email and its reply to the conversation index."""
+    index = thread_index()
+    if index is None:
+        return
+    index.record(
+        state["email"],
+        state.get("department_id") or "needs_review",
+        owner_email=state.get("owner_email") or "",
+        reply=state.get("draft") or "",
+    )
+
+
+# ----------------------------
+# Sender memory
+# ----------------------------
+
+_memory_stats_lock = threading.Lock()
+_memory_stats: Dict[str, int] = {"lookups": 0, "hits": 0, "llm_calls_skipped": 0, "learned": 0}
+
+
+def sender_memory() -> Optional[MemoryStore]:
+    """Shared sender memory (AAI_MEMORY_PATH), or None when AAI_SENDER_MEMORY=0."""
+    if os.getenv("AAI_SENDER_MEMORY", "1").strip().lower() in {"0", "false", "no"}:
+        return None
+    return open_memory_store(os.getenv("AAI_MEMORY_PATH", "memory/memory_store.json"))
+
+
+def _sender_memory_min_hits() -> int:
+    return max(1, int(os.getenv("AAI_SENDER_MEMORY_MIN_HITS", "2")))
+
+
+def _sender_address(email: Dict[str, Any]) -> str:
+    return parseaddr(str(email.get("from") or email.get("sender") or ""))[1].strip().lower()
+
+
+def _bump(key: str, n: int = 1) -> None:
+    with _memory_stats_lock:
+        _memory_stats[key] += n
+
+
+def sender_memory_stats() -> Dict[str, Any]:
+    """Fast-path counters for this process: lookups, hits, hit_rate, llm_calls_skipped, learned."""
+    with _memory_stats_lock:
+        stats: Dict[str, Any] = dict(_memory_stats)
+    stats["hit_rate"] = (stats["hits"] / stats["lookups"]) if stats["lookups"] else 0.0
+    return stats
+
+
+def reset_sender_memory_stats() -> None:
+    with _memory_stats_lock:
+        for k in _memory_stats:
+            _memory_stats[k] = 0
+
+
+# Stages that reuse an earlier outcome; unreviewed, they are no new evidence and
+# re-recording them would only reinforce themselves
+_DERIVED_STAGES = {"memory", "thread", "knn", "duplicate"}
+
+
+def _learn_sender(state: EmailState, reviewed: bool) -> None:
+    """Record an approved routing outcome for the sender."""
+    store = sender_memory()
+    sender = _sender_address(state["email"])
+    dept_id = state.get("department_id") or "needs_review"
+    stage = state.get("routing_stage")
+    if store is None or not sender or dept_id == "needs_review":
+        return
+    if stage in _DERIVED_STAGES and not reviewed:
+        return
+
+    snap = _snapshot(state)
+    set_sender_department(store, sender, dept_id, allowed=snap.dept_ids, source=stage, reviewed=reviewed)
+    if state.get("owner_email"):
+        set_sender_owner(store, sender, state["owner_email"])
+    _bump("learned")
+
+
+def _snapshot(state: EmailState) -> CompanyConfig:
+    snap = state.get("config_snapshot")
+    if isinstance(snap, CompanyConfig):
+        return snap
+    return as_company_config(state.get("config") or {})
+
+
+def _dept_name(snap: CompanyConfig, state: EmailState) -> str:
+    return snap.dept_id_to_name.get(state.get("department_id", ""), state.get("department_id", "needs_review"))
+
+
+def _write_token(piece: str) -> None:
+    sys.stdout.write(piece)
+    sys.stdout.flush()
+
+
+def _print_review_header(state: EmailState) -> None:
+    email = state["email"]
+    dept_name = _dept_name(_snapshot(state), state)
+
+    sender = email.get("from") or email.get("sender") or "(unknown sender)"
+    subject = email.get("subject") or "(no subject)"
+
+    print("\n" + "=" * 90)
+    print(f"[CHAT REVIEW] From: {sender}")
+    print(f"[CHAT REVIEW] Subject: {subject}")
+    print(f"[ROUTED] Department: {dept_name} | Owner: {state.get('owner_email','')}")
+    print("-" * 90)
+
+
+def _print_timings(stats: Dict[str, Any]) -> None:
+    if stats.get("cached"):
+        return
+    line = f"[DRAFT] first token {stats.get('ttft_s', 0.0):.2f}s | total {stats.get('total_s', 0.0):.1f}s"
+    if "prefill_tokens" in stats:
+        line += (
+            f" | prefill {stats['prefill_tokens']} tok in {stats['prefill_s']:.2f}s"
+            f" | decode {stats['decode_tokens']} tok at {stats['decode_tokens_per_s']:.1f} tok/s"
+        )
+    else:
+        line += f" | {stats.get('tokens_per_s', 0.0):.1f} tok/s"
+    print(line)
+
+
+def _generate(state: EmailState, messages: List[Tuple[str, str]]) -> str:
+    """
+    Run the draft model on `messages`. Interactive runs stream tokens to the
+    console as they arrive (chat_review then skips reprinting the draft).
+    Timings (TTFT, prefill/decode) are recorded in state["draft_metrics"].
+    """
+    stats: Dict[str, Any] = {}
+    if not (_interactive(state) and stream_drafts_enabled()):
+        text = run_draft(messages, stats=stats)
+        state["draft_streamed"] = False
+    else:
+        _print_review_header(state)
+        text = run_draft(messages, on_token=_write_token, stats=stats)
+        print()
+        print("-" * 90)
+        _print_timings(stats)
+        state["draft_streamed"] = True
+    state["draft_metrics"] = stats
+    return text
+
+
 # ----------------------------
 # Nodes
 # ----------------------------
@@ -139,7 +565,9 @@ def assign_owner(cfg: Dict[str, Any], dept_id: str, rr_state: Dict[str, int]) ->
 def node_load_config(state: EmailState) -> EmailState:
     path = state.get("config_path", "config/company_config.json")
     state["config_path"] = path
-    state["config"] = load_company_config(path)
+    snap = load_company_snapshot(path)
+    state["config_snapshot"] = snap
+    state["config"] = snap.raw
 
     # Defaults (safe)
     state.setdefault("errors", [])
@@ -154,22 +582,156 @@ def node_load_config(state: EmailState) -> EmailState:
     return state
 
 
-def node_route_and_assign(state: EmailState) -> EmailState:
-    cfg = state["config"]
+def node_preprocess(state: EmailState) -> EmailState:
+    """
+    Clean the email once for every later stage (quoted replies, signatures and
+    extra whitespace removed) and cap the body at AAI_PROMPT_TOKEN_BUDGET
+    tokens, keeping its head and tail. Other fields (to, cc, headers) are kept.
+    """
+    email = dict(state["email"])
+    raw_body = str(email.get("body") or email.get("text") or "")
+    clean = preprocess_email(email)
+    body, truncated = truncate_to_tokens(clean["body"], prompt_token_budget())
+
+    email["subject"] = clean["subject"]
+    email["body"] = body
+    state["email"] = email
+
+    before, after = estimate_tokens(raw_body), estimate_tokens(body)
+    state["prompt_tokens"] = {"before": before, "after": after}
+    REGISTRY.inc("aai_prompt_tokens_total", {"phase": "before"}, before)
+    REGISTRY.inc("aai_prompt_tokens_total", {"phase": "after"}, after)
+    if truncated:
+        REGISTRY.inc("aai_prompt_truncated_total")
+    return state
+
+
+def node_dedup(state: EmailState) -> EmailState:
+    """
+    Near-duplicate of a recently approved email (alert storms, list blasts,
+    copy-paste RFPs): take over its routing and owner and tag the ticket. The
+    draft is reused (and drafting skipped) only for an exact resend from the
+    same sender; otherwise a fresh draft is written for this email.
+    """
+    index = near_duplicates()
+    if index is None:
+        return state
+    sig = minhash(fingerprint_text(state["email"]))
+    if sig is None:
+        return state
+    state["fingerprint"] = sig
+
+    found = index.match(sig)
+    if found is None:
+        return state
+    rep, payload, _ = found
+    state.update({k: payload[k] for k in _CLUSTER_KEYS if payload.get(k) is not None})
+    state["routing_stage"] = "duplicate"
+    state["duplicate_of"] = rep
+    state["tags"] = sorted(set(state.get("tags") or []) | {"near_duplicate", f"duplicate_of:{rep}"})
+    if payload.get("draft") and payload.get("digest") == content_digest(state["email"]):
+        state["draft"] = payload["draft"]
+        # route_assign is skipped, so count the decision here
+        record_routing_stage("duplicate")
+    return state
+
+
+def route_after_dedup(state: EmailState) -> Literal["duplicate", "route"]:
+    return "duplicate" if state.get("duplicate_of") and state.get("draft") else "route"
+
+
+def node_thread(state: EmailState) -> EmailState:
+    """
+    Reply in a known conversation: inherit the thread's department and owner
+    (unless the reply went to a department alias), and keep its rolling
+    summary so the draft only needs the new text.
+    """
+    index = thread_index()
+    if index is None:
+        return state
+    thread = index.find(state["email"])
+    if thread is None:
+        return state
+
+    state["thread_id"] = thread["thread_id"]
+    state["thread_summary"] = thread["summary"] or ""
+    snap = _snapshot(state)
+    if "alias" in snap.routing_stages and _alias_stage(snap, state["email"]) is not None:
+        return state  # written to a department alias: that wins over the thread's route
+    dept_id = thread["department_id"] or ""
+    if dept_id and dept_id != "needs_review" and dept_id in snap.dept_ids:
+        state["department_id"] = dept_id
+        state["confidence"] = 0.90
+        state["routing_stage"] = "thread"
+        if thread["owner_email"]:
+            state["owner_email"] = thread["owner_email"]
+    return state
+
+
+def node_memory_route(state: EmailState) -> EmailState:
+    """
+    Fast path for repeat senders: when a reviewer approved the sender's
+    department at least AAI_SENDER_MEMORY_MIN_HITS times in a row, use it and
+    let route_assign skip the keyword/kNN/LLM cascade. An alias match (the
+    sender wrote to e.g. billing@) still wins over memory.
+    """
+    store = sender_memory()
+    snap = _snapshot(state)
     email = state["email"]
+    sender = _sender_address(email)
+    if store is None or not sender or state.get("routing_stage"):
+        return state
+    if "alias" in snap.routing_stages and _alias_stage(snap, email) is not None:
+        return state
+
+    _bump("lookups")
+    prior = store.sender_prior(sender)
+    if prior is None:
+        return state
 
-    routed = route_department(cfg, email)
-    dept_id = str(routed.get("department_id") or "needs_review").strip().lower() or "needs_review"
+    # Only reviewed approvals count: auto-approved guesses must not turn into priors
+    # (priors imported from the legacy JSON memory use names like "Sales", not config ids)
+    dept, _, reviewed, source = prior
+    dept_id = match_department(dept, snap.dept_ids)
+    if reviewed < _sender_memory_min_hits() or dept_id is None:
+        return state
 
     state["department_id"] = dept_id
-    state["confidence"] = float(routed.get("confidence") or 0.0)
+    state["confidence"] = 0.90
+    state["routing_stage"] = "memory"
+    _bump("hits")
+    if source == "llm":
+        _bump("llm_calls_skipped")
+    return state
 
-    tones = dept_id_to_tone(cfg) or {}
-    default_tone = ((cfg.get("company") or {}).get("default_tone") or "").strip()
-    state["tone"] = tones.get(dept_id) or (default_tone if default_tone else None)
+
+def node_route_and_assign(state: EmailState) -> EmailState:
+    snap = _snapshot(state)
+    email = state["email"]
+
+    assigned: Optional[Dict[str, str]] = None
+    if state.get("routing_stage") in {"memory", "thread", "duplicate"}:
+        dept_id = state["department_id"]
+        # Keep the thread's (or cluster's) owner, or the owner the sender had last time, if still in that department
+        owner = state.get("owner_email") if state["routing_stage"] in {"thread", "duplicate"} else None
+        store = sender_memory()
+        if not owner and store is not None:
+            owner = get_sender_owner(store, _sender_address(email))
+        if owner:
+            assigned = _owner_assignment(snap, dept_id, owner)
+    else:
+        routed = route_department(snap, email)
+        dept_id = str(routed.get("department_id") or "needs_review").strip().lower() or "needs_review"
+        state["department_id"] = dept_id
+        state["confidence"] = float(routed.get("confidence") or 0.0)
+        state["routing_stage"] = str(routed.get("stage") or "")
+
+    record_routing_stage(state.get("routing_stage", ""))
+    state["tone"] = snap.dept_id_to_tone.get(dept_id) or snap.default_tone
 
     rr_state = state.get("_rr_state", {}) or {}
-    assigned = assign_owner(cfg, dept_id, rr_state)
+    if assigned is None:
+        assigned = assign_owner(snap, dept_id, rr_state)
 
     state["_rr_state"] = rr_state
     state["owner_email"] = assigned.get("owner_email", "")
@@ -178,9 +740,7 @@ def node_route_and_assign(state: EmailState) -> EmailState:
 
 
 def node_draft(state: EmailState) -> EmailState:
-    cfg = state["config"]
-    dept_names = dept_id_to_name(cfg) or {}
-    dept_name = dept_names.get(state.get("department_id", ""), state.get("department_id", "needs_review"))
+    dept_name = _dept_name(_snapshot(state), state)
 
     email = dict(state["email"])
     tone = state.get("tone")
@@ -196,35 +756,38 @@ def node_draft(state: EmailState) -> EmailState:
     if sig:
         constraints.append("SIGNATURE (use exactly at end):\n" + sig)
 
-    email["body"] = (email.get("body") or "") + "\n\n---\n" + "\n\n".join(constraints) + "\n"
+    body = email.get("body") or ""
+    if state.get("thread_summary"):
+        # The quoted history is already summarized; only the new text is sent
+        body = (
+            "=== CONVERSATION SO FAR (summary) ===\n"
+            f"{state['thread_summary']}\n\n"
+            "=== NEW MESSAGE ===\n"
+            f"{new_text(email)}"
+        )
+    email["body"] = body + "\n\n---\n" + "\n\n".join(constraints) + "\n"
 
-    # draft_reply signature: draft_reply(email, triage_result)
-    state["draft"] = draft_reply(email, {"department": dept_name, "confidence": state.get("confidence", 0.0)})
+    messages = draft_messages(email, {"department": dept_name, "confidence": state.get("confidence", 0.0)})
+    state["draft"] = _generate(state, messages)
+    # Kept as a conversation so revisions only send the edit instruction as new input
+    state["draft_messages"] = messages + [("ai", state["draft"])]
     return state
 
 
 def node_chat_review(state: EmailState) -> EmailState:
-    interactive = os.getenv("AAI_INTERACTIVE", "1").strip().lower() not in {"0", "false", "no"}
-
-    if not interactive:
+    if not _interactive(state):
         state["approved"] = True
+        _learn_sender(state, reviewed=False)
+        _learn_similar(state, reviewed=False)
+        _register_cluster(state)
+        _record_thread(state)
         return state
 
-    email = state["email"]
-    cfg = state["config"]
-    dept_names = dept_id_to_name(cfg) or {}
-    dept_name = dept_names.get(state.get("department_id", ""), state.get("department_id", "needs_review"))
-
-    sender = email.get("from") or email.get("sender") or "(unknown sender)"
-    subject = email.get("subject") or "(no subject)"
-
-    print("\n" + "=" * 90)
-    print(f"[CHAT REVIEW] From: {sender}")
-    print(f"[CHAT REVIEW] Subject: {subject}")
-    print(f"[ROUTED] Department: {dept_name} | Owner: {state.get('owner_email','')}")
-    print("-" * 90)
-    print(state.get("draft", ""))
-    print("-" * 90)
+    if not state.get("draft_streamed"):
+        _print_review_header(state)
+        print(state.get("draft", ""))
+        print("-" * 90)
+    state["draft_streamed"] = False
 
     print("You can review or refine this draft however you like.\n")
     print("• Type 'approve' (or 'a') to accept and move on")
@@ -245,6 +808,10 @@ def node_chat_review(state: EmailState) -> EmailState:
 
         if low in {"approve", "a", "ok", "done"}:
             state["approved"] = True
+            _learn_sender(state, reviewed=True)
+            _learn_similar(state, reviewed=True)
+            _register_cluster(state)
+            _record_thread(state)
             break
         if low in {"skip", "s"}:
             state["skipped"] = True
@@ -272,26 +839,48 @@ def node_apply_feedback(state: EmailState) -> EmailState:
     current = state.get("draft", "")
     sig = state.get("signature", "")
 
-    revision_email = dict(state["email"])
-    revision_email["body"] = (
-        "You are editing an existing email draft.\n"
-        "Return ONLY the revised email text. No commentary.\n\n"
-        "=== CURRENT DRAFT ===\n"
-        f"{current}\n\n"
-        "=== EDIT INSTRUCTIONS (must follow) ===\n"
-        f"{fb}\n\n"
-        "=== REQUIRED SIGNATURE (must be at end) ===\n"
-        f"{sig}\n"
-    )
+    history = list(state.get("draft_messages") or [])
+    if history and history[-1][0] == "ai":
+        # Continue the drafting conversation: the prefix matches the previous request,
+        # so Ollama reuses its prompt cache and only prefills the instruction below
+        history[-1] = ("ai", current)
+        history.append((
+            "human",
+            "Revise your draft above.\n"
+            "Return ONLY the revised email text. No commentary.\n\n"
+            "=== EDIT INSTRUCTIONS (must follow) ===\n"
+            f"{fb}\n\n"
+            "=== REQUIRED SIGNATURE (must be at end) ===\n"
+            f"{sig}\n",
+        ))
+    else:
+        revision_email = dict(state["email"])
+        revision_email["body"] = (
+            "You are editing an existing email draft.\n"
+            "Return ONLY the revised email text. No commentary.\n\n"
+            "=== CURRENT DRAFT ===\n"
+            f"{current}\n\n"
+            "=== EDIT INSTRUCTIONS (must follow) ===\n"
+            f"{fb}\n\n"
+            "=== REQUIRED SIGNATURE (must be at end) ===\n"
+            f"{sig}\n"
+        )
+        history = draft_messages(revision_email, {"department": state.get("department_id", "needs_review")})
 
-    state["draft"] = draft_reply(revision_email, {"department": state.get("department_id", "needs_review")})
+    revised = _generate(state, history)
+    state["draft"] = revised
+    state.setdefault("revision_metrics", []).append(dict(state.get("draft_metrics") or {}))
 
     # Optional hard constraint: enforce max characters if user asks
     m = re.search(r"max(?:imum)?\s*(\d{2,5})\s*char", fb.lower())
     if m:
         limit = int(m.group(1))
         state["draft"] = (state["draft"] or "").strip()[:limit].rstrip()
+        if state["draft"] != revised:
+            # The reviewer saw the untruncated stream; show the final text
+            state["draft_streamed"] = False
 
+    state["draft_messages"] = history + [("ai", state["draft"])]
     state["revision_count"] = int(state.get("revision_count", 0)) + 1
     state["feedback"] = None
     return state
@@ -305,21 +894,60 @@ def route_after_review(state: EmailState) -> Literal["apply_feedback", "end"]:
     return "end"
 
 
+def _add_node(g: StateGraph, name: str, fn: Any) -> None:
+    # Every node is timed (aai_node_seconds{node=...} in utils.metrics)
+    g.add_node(name, timed_node(name, fn))
+
+
+def _add_review_loop(g: StateGraph) -> None:
+    _add_node(g, "draft", node_draft)
+    _add_node(g, "chat_review", node_chat_review)
+    _add_node(g, "apply_feedback", node_apply_feedback)
+
+    g.add_edge("draft", "chat_review")
+    g.add_conditional_edges("chat_review", route_after_review, {"apply_feedback": "apply_feedback", "end": END})
+    # Back to review with the revised draft (re-entering "draft" would regenerate it from scratch)
+    g.add_edge("apply_feedback", "chat_review")
+
+
+def _add_prepare_nodes(g: StateGraph, on_duplicate: str) -> None:
+    _add_node(g, "load_config", node_load_config)
+    _add_node(g, "preprocess", node_preprocess)
+    _add_node(g, "dedup", node_dedup)
+    _add_node(g, "thread", node_thread)
+    _add_node(g, "memory_route", node_memory_route)
+    _add_node(g, "route_assign", node_route_and_assign)
+
+    g.set_entry_point("load_config")
+    g.add_edge("load_config", "preprocess")
+    g.add_edge("preprocess", "dedup")
+    # A near-duplicate already has its route and draft
+    g.add_conditional_edges("dedup", route_after_dedup, {"duplicate": on_duplicate, "route": "thread"})
+    g.add_edge("thread", "memory_route")
+    g.add_edge("memory_route", "route_assign")
+
+
 def build_graph():
     g = StateGraph(EmailState)
+    _add_prepare_nodes(g, on_duplicate="chat_review")
+    _add_review_loop(g)
+    g.add_edge("route_assign", "draft")
+    return g.compile()
 
-    g.add_node("load_config", node_load_config)
-    g.add_node("route_assign", node_route_and_assign)
-    g.add_node("draft", node_draft)
-    g.add_node("chat_review", node_chat_review)
-    g.add_node("apply_feedback", node_apply_feedback)
 
-    g.set_entry_point("load_config")
-    g.add_edge("load_config", "route_assign")
+def build_prepare_graph():
+    """Routing and first draft only (no human input); used to prefetch emails ahead of review."""
+    g = StateGraph(EmailState)
+    _add_prepare_nodes(g, on_duplicate=END)
+    _add_node(g, "draft", node_draft)
     g.add_edge("route_assign", "draft")
-    g.add_edge("draft", "chat_review")
+    g.add_edge("draft", END)
+    return g.compile()
 
-    g.add_conditional_edges("chat_review", route_after_review, {"apply_feedback": "apply_feedback", "end": END})
-    g.add_edge("apply_feedback", "draft")
 
+def build_review_graph():
+    """The review loop of `build_graph`, entered with a state prepared by `build_prepare_graph`."""
+    g = StateGraph(EmailState)
+    _add_review_loop(g)
+    g.set_entry_point("chat_review")
     return g.compile()
@@ -0,0 +1,391 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from langchain_core.messages import BaseMessage
+from langchain_ollama import ChatOllama
+
+from agent.llm_cache import LLMCache, cache_key, cache_sampled, get_llm_cache
+from utils.metrics import record_llm_call, record_llm_error
+
+
+DEFAULT_MODEL = "llama3.2"
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+# (model, base_url, temperature, event-loop id or 0 for sync/threaded callers)
+_ClientKey = Tuple[str, str, float, int]
+
+_lock = threading.Lock()
+_clients: Dict[_ClientKey, ChatOllama] = {}
+# Connection pools of the sync clients, owned here so they can be closed without reaching into ChatOllama
+_transports: Dict[_ClientKey, httpx.HTTPTransport] = {}
+_loops: Dict[int, asyncio.AbstractEventLoop] = {}
+_stats: Dict[str, int] = {"created": 0, "reused": 0, "evicted": 0}
+
+
+# ----------------------------
+# Settings
+# ----------------------------
+
+def ollama_base_url() -> str:
+    return os.getenv("OLLAMA_BASE_URL", DEFAULT_BASE_URL)
+
+
+def router_model() -> str:
+    return os.getenv("AAI_ROUTER_MODEL", DEFAULT_MODEL)
+
+
+def draft_model() -> str:
+    return os.getenv("AAI_DRAFT_MODEL", DEFAULT_MODEL)
+
+
+def draft_temperature() -> float:
+    return float(os.getenv("AAI_DRAFT_TEMPERATURE", "0.2"))
+
+
+def keep_alive() -> Optional[str]:
+    """How long Ollama keeps the model (and its prompt cache) loaded between calls, e.g. "30m"."""
+    return os.getenv("AAI_OLLAMA_KEEP_ALIVE") or None
+
+
+def _http_limits() -> httpx.Limits:
+    size = int(os.getenv("AAI_LLM_POOL_SIZE", "16"))
+    return httpx.Limits(max_connections=size, max_keepalive_connections=size, keepalive_expiry=60.0)
+
+
+def _current_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+# ----------------------------
+# Registry
+# ----------------------------
+
+def get_chat_model(
+    model: Optional[str] = None,
+    base_url: Optional[str] = None,
+    temperature: float = 0.0,
+) -> ChatOllama:
+    """
+    Return the process-wide ChatOllama for (model, base_url, temperature).
+
+    The instance (and its pooled httpx clients) is created once and reused, so
+    repeated calls keep their keep-alive connections to Ollama. The sync httpx
+    client is thread-safe and shared by all threads. httpx async clients are
+    bound to the event loop they were first used on, so callers running inside
+    an event loop get one instance per loop; entries for closed loops are
+    dropped on the next lookup.
+    """
+    model = model or DEFAULT_MODEL
+    base_url = (base_url or ollama_base_url()).rstrip("/")
+    loop = _current_loop()
+    key: _ClientKey = (model, base_url, float(temperature), id(loop) if loop is not None else 0)
+
+    with _lock:
+        if loop is not None:
+            _evict_closed_loops()
+
+        llm = _clients.get(key)
+        if llm is not None:
+            _stats["reused"] += 1
+            return llm
+
+        transport = httpx.HTTPTransport(limits=_http_limits())
+        llm = ChatOllama(
+            model=model,
+            temperature=float(temperature),
+            base_url=base_url,
+            keep_alive=keep_alive(),
+            client_kwargs={
+                "limits": _http_limits(),
+                "timeout": float(os.getenv("AAI_LLM_TIMEOUT", "120")),
+            },
+            sync_client_kwargs={"transport": transport},
+        )
+        _clients[key] = llm
+        _transports[key] = transport
+        if loop is not None:
+            _loops[id(loop)] = loop
+        _stats["created"] += 1
+        return llm
+
+
+def _evict_closed_loops() -> None:
+    # caller holds _lock
+    closed = [lid for lid, loop in _loops.items() if loop.is_closed()]
+    for lid in closed:
+        del _loops[lid]
+        for key in [k for k in _clients if k[3] == lid]:
+            del _clients[key]
+            _transports.pop(key).close()
+            _stats["evicted"] += 1
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Snapshot of the registry: live clients per key plus created/reused counters."""
+    with _lock:
+        return {
+            "clients": len(_clients),
+            "created": _stats["created"],
+            "reused": _stats["reused"],
+            "evicted": _stats["evicted"],
+            "keys": [
+                {"model": k[0], "base_url": k[1], "temperature": k[2], "async_loop": bool(k[3])}
+                for k in _clients
+            ],
+        }
+
+
+def reset_clients() -> None:
+    """Drop all cached clients and close their sync HTTP pools (tests, config reloads)."""
+    with _lock:
+        transports = list(_transports.values())
+        _clients.clear()
+        _transports.clear()
+        _loops.clear()
+        for k in _stats:
+            _stats[k] = 0
+
+    for transport in transports:
+        transport.close()
+
+
+# ----------------------------
+# Budget
+# ----------------------------
+
+class CallBudget:
+    """
+    Caps LLM calls per run (`total`) and per rolling 60 s window (`per_minute`).
+    None means no cap. `acquire()` never blocks: it either books a call or
+    reports that the budget is spent, so callers can degrade instead of queueing.
+    """
+
+    def __init__(
+        self,
+        total: Optional[int] = None,
+        per_minute: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.total = total
+        self.per_minute = per_minute
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._recent: Deque[float] = deque()
+        self.used = 0
+        self.denied = 0
+
+    def acquire(self) -> bool:
+        with self._lock:
+            now = self._clock()
+            while self._recent and now - self._recent[0] >= 60.0:
+                self._recent.popleft()
+            if (self.total is not None and self.used >= self.total) or (
+                self.per_minute is not None and len(self._recent) >= self.per_minute
+            ):
+                self.denied += 1
+                return False
+            self.used += 1
+            if self.per_minute is not None:
+                self._recent.append(now)
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"total": self.total, "per_minute": self.per_minute, "used": self.used, "denied": self.denied}
+
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name, "").strip()
+    return int(value) if value else None
+
+
+def budget_from_env(prefix: str) -> CallBudget:
+    """Budget from <prefix>_BUDGET (calls per run) and <prefix>_PER_MINUTE; unset means no cap."""
+    return CallBudget(total=_optional_int(f"{prefix}_BUDGET"), per_minute=_optional_int(f"{prefix}_PER_MINUTE"))
+
+
+# ----------------------------
+# Calls
+# ----------------------------
+
+def _message_pairs(messages: Sequence[BaseMessage]) -> List[Tuple[str, str]]:
+    return [(m.type, str(m.content)) for m in messages]
+
+
+def ollama_timings(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Prefill/decode split from Ollama's response metadata (durations are in ns).
+    prefill_tokens is the number of prompt tokens that were actually evaluated,
+    so a continued conversation whose prefix is still cached reports only the new ones.
+    """
+    meta = metadata or {}
+    if "eval_count" not in meta and "prompt_eval_count" not in meta:
+        return {}
+    out: Dict[str, Any] = {
+        "prefill_tokens": int(meta.get("prompt_eval_count") or 0),
+        "prefill_s": float(meta.get("prompt_eval_duration") or 0) / 1e9,
+        "decode_tokens": int(meta.get("eval_count") or 0),
+        "decode_s": float(meta.get("eval_duration") or 0) / 1e9,
+        "load_s": float(meta.get("load_duration") or 0) / 1e9,
+    }
+    out["decode_tokens_per_s"] = (out["decode_tokens"] / out["decode_s"]) if out["decode_s"] > 0 else 0.0
+    return out
+
+
+def _response_cache(temperature: float, use_cache: Optional[bool]) -> Optional[LLMCache]:
+    """
+    The LLM cache for this call, or None. `use_cache=None` caches temperature-0
+    calls only: a sampled reply (a draft) replayed from the cache would stop
+    varying, so those need AAI_LLM_CACHE_SAMPLED=1 or an explicit use_cache=True.
+    """
+    if use_cache is None:
+        use_cache = float(temperature) == 0.0 or cache_sampled()
+    return get_llm_cache() if use_cache else None
+
+
+def invoke_chat(
+    messages: Sequence[BaseMessage],
+    model: Optional[str] = None,
+    temperature: float = 0.0,
+    base_url: Optional[str] = None,
+    use_cache: Optional[bool] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Run one chat completion through the shared client and return its text.
+
+    Responses are looked up in / stored to the persistent LLM cache (keyed by
+    model, temperature and the full message list). By default only
+    deterministic calls (temperature 0) are cached; see `_response_cache`.
+    Cache errors never fail the call; they just fall through to the model. When
+    `stats` is given it receives "cached" plus the `ollama_timings` fields.
+    """
+    model = model or DEFAULT_MODEL
+    cache = _response_cache(temperature, use_cache)
+    key = cache_key(model, temperature, _message_pairs(messages)) if cache is not None else None
+    started = time.perf_counter()
+
+    if cache is not None:
+        try:
+            hit = cache.get(key)
+        except Exception:
+            hit = None
+        if hit is not None:
+            record_llm_call(model, time.perf_counter() - started, cached=True)
+            if stats is not None:
+                stats["cached"] = True
+            return hit
+
+    try:
+        resp = get_chat_model(model=model, base_url=base_url, temperature=temperature).invoke(list(messages))
+    except Exception:
+        record_llm_error(model)
+        raise
+    text = str(resp.content or "")
+    usage = getattr(resp, "usage_metadata", None) or {}
+    record_llm_call(model, time.perf_counter() - started, usage.get("input_tokens"), usage.get("output_tokens"))
+    if stats is not None:
+        stats["cached"] = False
+        stats.update(ollama_timings(getattr(resp, "response_metadata", None)))
+
+    if cache is not None and text:
+        try:
+            cache.put(key, text)
+        except Exception:
+            pass
+    return text
+
+
+def stream_chat(
+    messages: Sequence[BaseMessage],
+    model: Optional[str] = None,
+    temperature: float = 0.0,
+    base_url: Optional[str] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    use_cache: Optional[bool] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Like `invoke_chat`, but streams the completion and calls `on_token` with
+    each text chunk as it arrives. Returns (full text, timing stats):
+    ttft_s (time to first token), total_s, tokens, tokens_per_s and cached,
+    plus the `ollama_timings` fields when the server reports them.
+
+    `tokens` is Ollama's eval count when reported, else the number of chunks.
+    A cache hit is delivered as a single chunk.
+    """
+    model = model or DEFAULT_MODEL
+    cache = _response_cache(temperature, use_cache)
+    key = cache_key(model, temperature, _message_pairs(messages)) if cache is not None else None
+    started = time.perf_counter()
+
+    if cache is not None:
+        try:
+            hit = cache.get(key)
+        except Exception:
+            hit = None
+        if hit is not None:
+            if on_token is not None:
+                on_token(hit)
+            elapsed = time.perf_counter() - started
+            record_llm_call(model, elapsed, cached=True)
+            return hit, {"ttft_s": elapsed, "total_s": elapsed, "tokens": 0, "tokens_per_s": 0.0, "cached": True}
+
+    parts: List[str] = []
+    chunks = 0
+    eval_count: Optional[int] = None
+    prompt_count: Optional[int] = None
+    first_at: Optional[float] = None
+    timings: Dict[str, Any] = {}
+
+    llm = get_chat_model(model=model, base_url=base_url, temperature=temperature)
+    try:
+        for chunk in llm.stream(list(messages)):
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage and usage.get("output_tokens"):
+                eval_count = int(usage["output_tokens"])
+                prompt_count = usage.get("input_tokens")
+            timings = ollama_timings(getattr(chunk, "response_metadata", None)) or timings
+
+            piece = chunk.content if isinstance(chunk.content, str) else ""
+            if not piece:
+                continue
+            if first_at is None:
+                first_at = time.perf_counter()
+            chunks += 1
+            parts.append(piece)
+            if on_token is not None:
+                on_token(piece)
+    except Exception:
+        record_llm_error(model)
+        raise
+
+    done = time.perf_counter()
+    text = "".join(parts)
+    tokens = eval_count if eval_count is not None else chunks
+    gen_s = done - first_at if first_at is not None else 0.0
+    stats = {
+        "ttft_s": (first_at - started) if first_at is not None else done - started,
+        "total_s": done - started,
+        "tokens": tokens,
+        "tokens_per_s": (tokens / gen_s) if gen_s > 0 else 0.0,
+        "cached": False,
+    }
+    stats.update(timings)
+    record_llm_call(model, stats["total_s"], prompt_count, eval_count)
+
+    if cache is not None and text:
+        try:
+            cache.put(key, text)
+        except Exception:
+            pass
+    return text, stats
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access);
+"""
+
+
+def cache_key(model: str, temperature: float, messages: Sequence[Tuple[str, str]]) -> str:
+    """Content address for one LLM call: model, temperature and every (role, content) message."""
+    payload = json.dumps(
+        {"model": model, "temperature": float(temperature), "messages": [list(m) for m in messages]},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    SQLite-backed response cache with LRU eviction and a TTL.
+
+    One connection is shared by all threads behind a lock; separate processes
+    share the same file through SQLite's own locking (WAL mode).
+    """
+
+    def __init__(self, path: str, max_entries: int = 20000, ttl_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._puts_since_evict = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            response, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return response
+
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._puts_since_evict += 1
+            # Counting rows on every put would dominate small writes; check periodically
+            if self._puts_since_evict >= max(1, min(100, self.max_entries // 10)):
+                self._evict()
+
+    def _evict(self) -> None:
+        # caller holds _lock
+        self._puts_since_evict = 0
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# ----------------------------
+# Process-wide instance
+# ----------------------------
+
+_cache_lock = threading.Lock()
+_cache: Optional[LLMCache] = None
+_cache_pid: Optional[int] = None
+
+
+def cache_enabled() -> bool:
+    return os.getenv("AAI_LLM_CACHE", "1").strip().lower() not in {"0", "false", "no"}
+
+
+def cache_sampled() -> bool:
+    """Whether calls with temperature > 0 (drafts) are cached too (AAI_LLM_CACHE_SAMPLED, off by default)."""
+    return os.getenv("AAI_LLM_CACHE_SAMPLED", "0").strip().lower() in {"1", "true", "yes"}
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Shared cache configured from AAI_LLM_CACHE_* env vars, or None when disabled."""
+    global _cache, _cache_pid
+    if not cache_enabled():
+        return None
+
+    with _cache_lock:
+        # SQLite connections must not cross fork(); pool workers open their own
+        if _cache is None or _cache_pid != os.getpid():
+            _cache = LLMCache(
+                os.getenv("AAI_LLM_CACHE_PATH", ".cache/llm_cache.sqlite"),
+                max_entries=int(os.getenv("AAI_LLM_CACHE_MAX_ENTRIES", "20000")),
+                ttl_seconds=float(os.getenv("AAI_LLM_CACHE_TTL", str(7 * 24 * 3600))),
+            )
+            _cache_pid = os.getpid()
+        return _cache
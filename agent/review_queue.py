@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+
+# (index, email, prepared state or None, exception raised by prepare or None)
+Prepared = Tuple[int, Dict[str, Any], Optional[Dict[str, Any]], Optional[BaseException]]
+
+
+class ReviewQueue:
+    """
+    Runs `prepare` (routing + first draft) for up to `depth` upcoming emails on
+    background threads while the reviewer works on the current one.
+
+    Iterating yields (index, email, prepared_state, error) strictly in input
+    order, so tickets are written in order. At most `depth + 1` emails are held
+    at once: the one under review plus the prefetched ones. If `prepare`
+    raised, the state is None and the exception is passed along instead.
+    """
+
+    def __init__(
+        self,
+        emails: Iterable[Dict[str, Any]],
+        prepare: Callable[[Dict[str, Any]], Dict[str, Any]],
+        depth: int = 2,
+        workers: int = 0,
+    ):
+        self.depth = max(0, int(depth))
+        self.workers = max(1, int(workers or self.depth or 1))
+        self._emails = enumerate(emails, start=1)
+        self._prepare = prepare
+        self._window: Deque[Tuple[int, Dict[str, Any], Future]] = deque()
+
+        self._lock = threading.Lock()
+        self.ready = 0
+        self.waited = 0
+        self.wait_s = 0.0
+
+    def _fill(self, pool: ThreadPoolExecutor, limit: int) -> None:
+        while len(self._window) < limit:
+            nxt = next(self._emails, None)
+            if nxt is None:
+                return
+            i, email = nxt
+            self._window.append((i, email, pool.submit(self._prepare, email)))
+
+    def __iter__(self) -> Iterator[Prepared]:
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="review-prefetch")
+        try:
+            self._fill(pool, self.depth + 1)
+            while self._window:
+                i, email, fut = self._window.popleft()
+                # Top the window up before blocking, so prefetching continues during review
+                self._fill(pool, self.depth)
+
+                if fut.done():
+                    with self._lock:
+                        self.ready += 1
+                else:
+                    started = time.perf_counter()
+                    wait([fut])
+                    with self._lock:
+                        self.waited += 1
+                        self.wait_s += time.perf_counter() - started
+
+                err = fut.exception()
+                yield i, email, (None if err is not None else fut.result()), err
+        finally:
+            for _, _, fut in self._window:
+                fut.cancel()
+            self._window.clear()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """How often the reviewer found the next draft ready vs. had to wait for it."""
+        with self._lock:
+            return {"depth": self.depth, "ready": self.ready, "waited": self.waited, "wait_s": self.wait_s}
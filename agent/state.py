@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import TypedDict, Optional, List, Dict, Any
+from typing import TypedDict, Optional, List, Dict, Any, Mapping, Tuple
+
+from config.loader import CompanyConfig
 
 
 class EmailState(TypedDict, total=False):
@@ -8,11 +10,19 @@ class EmailState(TypedDict, total=False):
 
     # Company config
     config_path: str
-    config: Dict[str, Any]
+    config: Mapping[str, Any]
+    config_snapshot: CompanyConfig
 
     # Routing result (company-defined)
     department_id: str
     confidence: float
+    routing_stage: str  # duplicate | thread | memory | alias | triage | keyword | knn | llm | budget | none
+    tags: List[str]  # copied into the ticket
+    fingerprint: bytes  # MinHash signature of the cleaned email
+    duplicate_of: str  # id of the cluster representative this email reuses
+    thread_id: str  # known conversation this email replies to
+    thread_summary: str  # rolling summary of that conversation (drafts get it instead of the quoted history)
+    prompt_tokens: Dict[str, int]  # estimated body tokens before and after preprocess (cleaning + truncation)
 
     # Assignment
     owner_email: str
@@ -21,8 +31,13 @@ class EmailState(TypedDict, total=False):
 
     # Drafting
     draft: str
+    draft_streamed: bool  # draft was already printed token by token
+    draft_metrics: Dict[str, Any]  # ttft_s, total_s, tokens, tokens_per_s, cached, prefill_*/decode_*
+    draft_messages: List[Tuple[str, str]]  # (role, content) drafting conversation, continued by revisions
+    revision_metrics: List[Dict[str, Any]]  # draft_metrics of each revision
 
     # Chat loop
+    interactive: bool
     feedback: Optional[str]
     revision_count: int
     max_revisions: int
@@ -1,10 +1,43 @@
 from __future__ import annotations
 
-from typing import Dict, List, Tuple
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
 
 
 DEPARTMENTS = ("Sales", "Support", "Finance", "NeedsReview")
 
+# Keyword lists are module constants so they are built once, not per call.
+SALES_KEYWORDS: Tuple[str, ...] = (
+    "pricing", "price", "enterprise", "quote", "demo", "subscription", "plan", "upgrade",
+    "rfp", "proposal", "procurement", "sla", "security documentation", "security", "compliance",
+    "discount", "student", "non-profit", "nonprofit",
+    "sso", "saml", "scim", "identity provider", "okta", "azure ad",
+    "trial", "pilot", "evaluation", "onboarding timeline",
+    "partnership", "co-marketing", "comarketing",
+)
+
+SUPPORT_KEYWORDS: Tuple[str, ...] = (
+    "bug", "error", "issue", "problem", "cannot", "can't", "cant", "failed", "failure",
+    "login", "log in", "password", "reset password", "password reset", "403", "401", "500",
+    "suspicious", "compromise", "unknown ip", "lock the account", "audit",
+    "slow", "latency", "timeout", "performance", "dashboard", "down", "outage",
+    "webhook", "events", "event", "firing", "stopped",
+    "complaint", "escalated", "escalation", "forwarding",
+    "csv", "export",
+)
+
+FINANCE_KEYWORDS: Tuple[str, ...] = (
+    "invoice", "inv-", "billing", "payment", "refund", "charge", "charged", "receipt",
+    "vat", "iban", "bank",
+    "billing address", "accounts payable", "ap@", "w-9", "w9", "tax", "vendor setup",
+)
+
+# Column order of the batch hit matrix
+_MATRIX_DEPARTMENTS = ("Sales", "Support", "Finance")
+_MATRIX_BASE_CONFIDENCE = np.array([0.70, 0.72, 0.70])
+_MATRIX_KEYWORDS = (SALES_KEYWORDS, SUPPORT_KEYWORDS, FINANCE_KEYWORDS)
+
 
 def _normalize_text(email: Dict) -> str:
     subject = (email.get("subject") or "").lower()
@@ -13,7 +46,7 @@ def _normalize_text(email: Dict) -> str:
     return f"{subject}\n{body}\n{sender}".strip()
 
 
-def _count_hits(text: str, keywords: List[str]) -> int:
+def _count_hits(text: str, keywords: Sequence[str]) -> int:
     return sum(1 for k in keywords if k in text)
 
 
@@ -45,34 +78,9 @@ def triage(email: Dict) -> Dict:
             "tags": ["empty"],
         }
 
-    sales_kw = [
-        "pricing", "price", "enterprise", "quote", "demo", "subscription", "plan", "upgrade",
-        "rfp", "proposal", "procurement", "sla", "security documentation", "security", "compliance",
-        "discount", "student", "non-profit", "nonprofit",
-        "sso", "saml", "scim", "identity provider", "okta", "azure ad",
-        "trial", "pilot", "evaluation", "onboarding timeline",
-        "partnership", "co-marketing", "comarketing",
-    ]
-
-    support_kw = [
-        "bug", "error", "issue", "problem", "cannot", "can't", "cant", "failed", "failure",
-        "login", "log in", "password", "reset password", "password reset", "403", "401", "500",
-        "suspicious", "compromise", "unknown ip", "lock the account", "audit",
-        "slow", "latency", "timeout", "performance", "dashboard", "down", "outage",
-        "webhook", "events", "event", "firing", "stopped",
-        "complaint", "escalated", "escalation", "forwarding",
-        "csv", "export",
-    ]
-
-    finance_kw = [
-        "invoice", "inv-", "billing", "payment", "refund", "charge", "charged", "receipt",
-        "vat", "iban", "bank",
-        "billing address", "accounts payable", "ap@", "w-9", "w9", "tax", "vendor setup",
-    ]
-
-    s_hits = _count_hits(text, sales_kw)
-    sup_hits = _count_hits(text, support_kw)
-    f_hits = _count_hits(text, finance_kw)
+    s_hits = _count_hits(text, SALES_KEYWORDS)
+    sup_hits = _count_hits(text, SUPPORT_KEYWORDS)
+    f_hits = _count_hits(text, FINANCE_KEYWORDS)
 
     tags: List[str] = []
     if s_hits:
@@ -137,3 +145,101 @@ def triage(email: Dict) -> Dict:
         "summary": summary,
         "tags": sorted(set(tags)),
     }
+
+
+# ----------------------------
+# Batch API
+# ----------------------------
+
+def _summary(subject_raw: str, body_raw: str) -> str:
+    return subject_raw or (body_raw[:80] + ("..." if len(body_raw) > 80 else ""))
+
+
+def triage_hit_matrix(texts: Sequence[str]) -> np.ndarray:
+    """
+    (n, 3) int matrix of Sales/Support/Finance keyword hits for normalized texts.
+
+    With ~90 short keywords, C-level substring tests beat a Python automaton
+    scan, so the matrix is filled from one flat generator over the batch.
+    """
+    flat = np.fromiter(
+        (sum(1 for k in kws if k in text) for text in texts for kws in _MATRIX_KEYWORDS),
+        dtype=np.int64,
+        count=len(texts) * len(_MATRIX_KEYWORDS),
+    )
+    return flat.reshape(len(texts), len(_MATRIX_KEYWORDS))
+
+
+def triage_batch(emails: Sequence[Dict]) -> List[Dict]:
+    """
+    Vectorized `triage()` for many emails at once.
+
+    Returns exactly what `[triage(e) for e in emails]` would, but builds the hit
+    matrix in a single pass per email and computes department, confidence and
+    ambiguity for the whole batch with NumPy.
+    """
+    n = len(emails)
+    if n == 0:
+        return []
+
+    texts = [_normalize_text(e) for e in emails]
+    subjects = [(e.get("subject") or "").strip() for e in emails]
+    bodies = [(e.get("body") or "").strip() for e in emails]
+
+    empty = np.array([not s and not b for s, b in zip(subjects, bodies)], dtype=bool)
+    hits = triage_hit_matrix([("" if is_empty else t) for t, is_empty in zip(texts, empty)])
+
+    s_hits, sup_hits, f_hits = hits[:, 0], hits[:, 1], hits[:, 2]
+    matched = hits > 0
+    no_match = ~matched.any(axis=1)
+
+    # Tie-break: Support > Finance > Sales (same rule as triage())
+    is_support = (sup_hits >= np.maximum(f_hits, s_hits)) & (sup_hits > 0)
+    is_finance = ~is_support & (f_hits >= s_hits) & (f_hits > 0)
+    dept_idx = np.where(is_support, 1, np.where(is_finance, 2, 0))
+
+    dept_hits = hits[np.arange(n), dept_idx]
+    confidence = np.clip(_MATRIX_BASE_CONFIDENCE[dept_idx] + 0.06 * np.minimum(dept_hits, 3), 0.0, 0.92)
+
+    ambiguous = matched.sum(axis=1) >= 2
+    confidence = np.where(ambiguous, np.minimum(confidence, 0.75), confidence)
+
+    # "hr" heuristics only matter for rows without any keyword hit
+    hr = np.array(
+        [
+            bool(no_match[i]) and ("reference check" in t or "employment dates" in t or "hr" in t)
+            for i, t in enumerate(texts)
+        ],
+        dtype=bool,
+    )
+    confidence = np.where(no_match, np.where(hr, 0.35, 0.40), confidence)
+    confidence = np.where(empty, 0.20, confidence)
+
+    results: List[Dict] = []
+    for i in range(n):
+        if empty[i]:
+            results.append({"department": "NeedsReview", "confidence": 0.20, "summary": "", "tags": ["empty"]})
+            continue
+
+        summary = _summary(subjects[i], bodies[i])
+        if no_match[i]:
+            results.append({
+                "department": "NeedsReview",
+                "confidence": float(confidence[i]),
+                "summary": summary,
+                "tags": ["hr"] if hr[i] else ["unclear"],
+            })
+            continue
+
+        tags = [name.lower() for name, hit in zip(_MATRIX_DEPARTMENTS, matched[i]) if hit]
+        if ambiguous[i]:
+            tags.append("ambiguous")
+
+        results.append({
+            "department": _MATRIX_DEPARTMENTS[int(dept_idx[i])],
+            "confidence": float(confidence[i]),
+            "summary": summary,
+            "tags": sorted(set(tags)),
+        })
+
+    return results
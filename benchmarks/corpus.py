@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import json
+import random
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from ingestion.loader import load_emails
+
+
+# Text that hits no keyword rule, so routing falls through to the LLM stage
+_NEUTRAL_SUBJECTS = (
+    "Quick question", "Following up", "Hello", "Re: our conversation", "Checking in", "Introduction",
+)
+_NEUTRAL_LINES = (
+    "Hope you are well.",
+    "I wanted to reach out regarding something we discussed last month.",
+    "Could someone from your team get back to me when convenient?",
+    "We are reviewing a few vendors this quarter.",
+    "Looking forward to hearing from you.",
+)
+
+_FIRST = ("anna", "ben", "carla", "dev", "emil", "fatima", "gus", "hana", "ivan", "jo", "kai", "lena", "mo", "nina")
+_DOMAINS = ("acme.com", "globex.com", "initech.io", "umbrella.org", "northwind.io", "hooli.dev", "stark.co")
+
+
+def _keyword_groups(config_path: str) -> Dict[str, List[str]]:
+    cfg = json.loads(Path(config_path).read_text(encoding="utf-8"))
+    rules = (cfg.get("routing_rules") or {}).get("keyword_to_department") or []
+    return {str(r["department_id"]): [str(k) for k in r.get("keywords") or []] for r in rules}
+
+
+def _aliases(config_path: str) -> List[str]:
+    cfg = json.loads(Path(config_path).read_text(encoding="utf-8"))
+    return [str(a["address"]) for a in cfg.get("inbox_aliases") or [] if a.get("address")]
+
+
+def iter_synthetic_emails(
+    n: int,
+    seed: int = 1234,
+    samples_path: str = "data/sample_emails.json",
+    config_path: str = "config/company_config.json",
+    llm_share: float = 0.05,
+    alias_share: float = 0.2,
+    senders: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Deterministic synthetic emails modeled on the sample emails and keyword rules.
+
+    Mix per email: `alias_share` are sent to a department alias, `llm_share`
+    carry neutral text with no keyword hits (LLM fallback), the rest are
+    sample emails with keywords from one department's rules mixed in. Senders
+    are drawn from a pool of `senders` addresses (default n // 10) with a
+    skewed distribution, so repeat senders dominate like in real traffic.
+    """
+    rng = random.Random(seed)
+    samples = load_emails(samples_path)
+    groups = _keyword_groups(config_path)
+    dept_ids = sorted(groups)
+    aliases = _aliases(config_path)
+    pool = max(1, senders if senders is not None else n // 10)
+
+    for i in range(n):
+        # Skewed sender choice: low ids are much more frequent
+        sender_id = int(pool * rng.random() ** 3)
+        sender = f"{_FIRST[sender_id % len(_FIRST)]}.{sender_id}@{_DOMAINS[sender_id % len(_DOMAINS)]}"
+
+        roll = rng.random()
+        if roll < llm_share:
+            subject = rng.choice(_NEUTRAL_SUBJECTS)
+            body = "\n".join(rng.sample(_NEUTRAL_LINES, 3))
+            to = "inbox@example.com"
+        else:
+            base = samples[rng.randrange(len(samples))]
+            dept = rng.choice(dept_ids)
+            words = rng.sample(groups[dept], min(3, len(groups[dept]))) if groups[dept] else []
+            subject = str(base.get("subject") or "")
+            body = str(base.get("body") or "") + "\n\nAlso about: " + ", ".join(words) + "."
+            to = rng.choice(aliases) if aliases and roll < llm_share + alias_share else "inbox@example.com"
+
+        yield {"id": f"syn{i:07d}", "from": sender, "to": to, "subject": subject, "body": body}
+
+
+def write_corpus(path: str, n: int, seed: int = 1234, **kwargs: Any) -> str:
+    """Write `n` synthetic emails as JSONL (or a JSON array for a .json path), streaming."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    as_array = p.suffix.lower() == ".json"
+    with p.open("w", encoding="utf-8") as fh:
+        if as_array:
+            fh.write("[\n")
+        for i, email in enumerate(iter_synthetic_emails(n, seed=seed, **kwargs)):
+            line = json.dumps(email, ensure_ascii=False)
+            if as_array:
+                fh.write(("  " if i == 0 else ", ") + line + "\n")
+            else:
+                fh.write(line + "\n")
+        if as_array:
+            fh.write("]\n")
+    return str(p)
+
+
+def corpus_sizes(spec: str) -> Sequence[int]:
+    """Parse "1k,10k,1m" style size lists."""
+    out = []
+    for part in spec.split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        mult = {"k": 1000, "m": 1000000}.get(part[-1], 1)
+        out.append(int(float(part.rstrip("km")) * mult))
+    return out
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+
+_ALLOWED_RE = re.compile(r"ALLOWED:\s*\[([^\]]*)\]")
+_EMAIL_BLOCK_RE = re.compile(r"(?m)^### EMAIL (\d+)\n")
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+def fake_reply(messages: List[Dict[str, Any]]) -> str:
+    """
+    Deterministic answer for a chat request: routing prompts (with an
+    "ALLOWED: [...]" list) get one of the allowed ids, batched routing prompts
+    ("### EMAIL n" blocks) a JSON object of ids per email number, anything
+    else a short templated draft. The same messages always produce the same text.
+    """
+    system = " ".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+    convo = "\n".join(str(m.get("content") or "") for m in messages)
+    h = _digest(convo)
+
+    m = _ALLOWED_RE.search(system)
+    if m:
+        allowed = [x.strip().strip("'\"") for x in m.group(1).split(",") if x.strip()] or ["needs_review"]
+        user = "\n".join(str(msg.get("content") or "") for msg in messages if msg.get("role") != "system")
+        blocks = _EMAIL_BLOCK_RE.split(user)[1:]
+        if blocks:
+            return json.dumps({n: allowed[_digest(body) % len(allowed)] for n, body in zip(blocks[::2], blocks[1::2])})
+        return allowed[h % len(allowed)]
+
+    return (
+        "Hello,\n\n"
+        f"Thank you for your message. We have looked into your request (ref {h % 100000:05d}) "
+        "and will follow up with the details shortly.\n\n"
+        "Kind regards,\nTRIAG3"
+    )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "FakeOllamaServer"
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # tokens go out as they are produced
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/api/tags"):
+            self._send_json({"models": [{"name": "fake", "model": "fake"}]})
+        elif self.path.startswith("/api/version"):
+            self._send_json({"version": "0.0.0-fake"})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        req = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.startswith("/api/chat"):
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        srv = self.server
+        messages = req.get("messages") or []
+        text = fake_reply(messages)
+        # Whitespace-split "tokens" stand in for real ones
+        pieces = re.findall(r"\S+\s*", text) or [text]
+        prompt_tokens = sum(len(str(m.get("content") or "").split()) for m in messages)
+        srv.count_request()
+
+        time.sleep(srv.latency_s)
+        created = datetime.now(timezone.utc).isoformat()
+        decode_s = len(pieces) / srv.tokens_per_s if srv.tokens_per_s > 0 else 0.0
+        final = {
+            "model": req.get("model", "fake"),
+            "created_at": created,
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((srv.latency_s + decode_s) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(srv.latency_s * 1e9),
+            "eval_count": len(pieces),
+            "eval_duration": int(decode_s * 1e9),
+        }
+
+        if req.get("stream", True) is False:
+            if decode_s:
+                time.sleep(decode_s)
+            final["message"]["content"] = text
+            self._send_json(final)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        delay = 1.0 / srv.tokens_per_s if srv.tokens_per_s > 0 else 0.0
+        for piece in pieces:
+            if delay:
+                time.sleep(delay)
+            self._chunk({"model": req.get("model", "fake"), "created_at": created,
+                         "message": {"role": "assistant", "content": piece}, "done": False})
+        self._chunk(final)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, obj: Dict[str, Any]) -> None:
+        data = json.dumps(obj).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """
+    Local stand-in for Ollama's /api/chat with deterministic replies.
+
+    Every request waits `latency_s` (prefill) and then emits whitespace tokens
+    at `tokens_per_s` (0 = instantly). Use as a context manager; `base_url`
+    is what OLLAMA_BASE_URL should point at.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_s: float = 0.0, tokens_per_s: float = 0.0):
+        super().__init__((host, port), _Handler)
+        self.latency_s = float(latency_s)
+        self.tokens_per_s = float(tokens_per_s)
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self) -> None:
+        with self._count_lock:
+            self.requests += 1
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.fake_ollama", description="Deterministic local Ollama stand-in.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--latency", type=float, default=0.05, help="seconds per request before the first token")
+    ap.add_argument("--tokens-per-s", type=float, default=0.0, help="streaming speed (0 = instant)")
+    args = ap.parse_args(argv)
+
+    srv = FakeOllamaServer(args.host, args.port, args.latency, args.tokens_per_s)
+    print(f"[INFO] Fake Ollama on {srv.base_url} (latency={args.latency}s)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+
+
+if __name__ == "__main__":
+    main()
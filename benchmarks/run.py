@@ -0,0 +1,314 @@
+"""
+Benchmark suite: throughput and memory of the pipeline stages on synthetic corpora.
+
+    python -m benchmarks.run --sizes 1k,10k,100k
+    python -m benchmarks.run --sizes 1k,10k --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --sizes 1k,10k --baseline benchmarks/baseline.json   # exit 1 on regression
+
+LLM calls go to a local deterministic Ollama stand-in (benchmarks.fake_ollama)
+with configurable latency, so results do not depend on a model or GPU.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from benchmarks.corpus import corpus_sizes, write_corpus
+from benchmarks.fake_ollama import FakeOllamaServer
+
+
+ALL_BENCHES = (
+    "iter_emails", "load_emails", "preprocess_email", "triage", "triage_batch",
+    "route_department", "route_jsonl", "route_files", "graph",
+)
+
+CHUNK = 10000
+
+
+def _chunks(path: str, limit: int) -> Iterator[List[Dict[str, Any]]]:
+    from ingestion.loader import iter_emails
+
+    it = islice(iter_emails(path), limit)
+    while True:
+        chunk = list(islice(it, CHUNK))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _per_email(fn: Callable[[Dict[str, Any]], Any]) -> Callable[[List[Dict[str, Any]]], int]:
+    def run(chunk: List[Dict[str, Any]]) -> int:
+        for e in chunk:
+            fn(e)
+        return len(chunk)
+
+    return run
+
+
+# ----------------------------
+# Benches
+# ----------------------------
+
+def _bench_fn(name: str, config_path: str, workdir: str, concurrency: int) -> Callable[[List[Dict[str, Any]]], int]:
+    """Chunk processor for `name`; returns how many emails it handled."""
+    if name == "preprocess_email":
+        from ingestion.preprocess import preprocess_email
+
+        return _per_email(preprocess_email)
+
+    if name == "triage":
+        from agent.triage_agent import triage
+
+        return _per_email(triage)
+
+    if name == "triage_batch":
+        from agent.triage_agent import triage_batch
+
+        return lambda chunk: len(triage_batch(chunk))
+
+    if name == "route_department":
+        from agent.graph import route_department
+        from config.loader import load_company_snapshot
+
+        snap = load_company_snapshot(config_path)
+        return _per_email(lambda e: route_department(snap, e))
+
+    if name in ("route_jsonl", "route_files"):
+        from routing.router import route
+        from routing.sinks import FileTicketSink, JsonlTicketSink
+
+        root = os.path.join(workdir, name)
+        sink = JsonlTicketSink(root, flush_interval=0) if name == "route_jsonl" else FileTicketSink(root)
+        triage_result = {"department": "support", "confidence": 0.75, "summary": "", "tags": []}
+
+        def run(chunk: List[Dict[str, Any]]) -> int:
+            for e in chunk:
+                route(e, triage_result, "draft", sink=sink)
+            sink.flush()
+            return len(chunk)
+
+        return run
+
+    if name == "graph":
+        from agent.graph import build_graph
+        from main import run_batch_async
+
+        graph = build_graph()
+
+        def run(chunk: List[Dict[str, Any]]) -> int:
+            counts: Counter = Counter()
+            # run_batch_async prints one line per email; keep the benchmark output readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                asyncio.run(run_batch_async(graph, chunk, len(chunk), config_path, 0, concurrency, counts, {}))
+            return sum(counts.values())
+
+        return run
+
+    raise ValueError(f"Unknown bench: {name}")
+
+
+def _measure(name: str, path: str, n: int, ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Throughput over `n` emails, then peak traced memory over a smaller pass."""
+    from ingestion.loader import iter_emails, load_emails
+
+    def timed(limit: int) -> Dict[str, Any]:
+        if name == "iter_emails":
+            started = time.perf_counter()
+            count = sum(1 for _ in islice(iter_emails(path), limit))
+            return {"n": count, "seconds": time.perf_counter() - started}
+        if name == "load_emails":
+            # load_emails reads the whole file; the corpus is written at exactly this size
+            started = time.perf_counter()
+            count = len(load_emails(path))
+            return {"n": count, "seconds": time.perf_counter() - started}
+
+        fn = _bench_fn(name, ctx["config_path"], ctx["workdir"], ctx["concurrency"])
+        count, seconds = 0, 0.0
+        for chunk in _chunks(path, limit):
+            started = time.perf_counter()
+            count += fn(chunk)
+            seconds += time.perf_counter() - started
+        return {"n": count, "seconds": seconds}
+
+    limit = n
+    if name in ("route_department", "graph"):
+        limit = min(n, ctx["llm_cap"])
+    elif name == "route_files":
+        limit = min(n, ctx["files_cap"])
+
+    result = timed(limit)
+    result["per_sec"] = (result["n"] / result["seconds"]) if result["seconds"] > 0 else 0.0
+
+    if ctx["memory"]:
+        # tracemalloc is slow, so this pass is capped (load_emails always reads the whole file)
+        tracemalloc.start()
+        try:
+            timed(min(limit, ctx["mem_cap"]))
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+# ----------------------------
+# Baseline comparison
+# ----------------------------
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, mem_tolerance: float) -> List[str]:
+    """Regressions of `current` vs `baseline` results (throughput down or peak memory up beyond tolerance)."""
+    problems: List[str] = []
+    for key, base in (baseline.get("results") or {}).items():
+        cur = (current.get("results") or {}).get(key)
+        if cur is None:
+            continue
+        if base.get("per_sec") and cur["per_sec"] < base["per_sec"] * (1.0 - tolerance):
+            problems.append(f"{key}: {cur['per_sec']:.1f}/s vs baseline {base['per_sec']:.1f}/s")
+        if base.get("peak_mb") and cur.get("peak_mb") is not None and cur["peak_mb"] > base["peak_mb"] * (1.0 + mem_tolerance):
+            problems.append(f"{key}: peak {cur['peak_mb']:.1f} MB vs baseline {base['peak_mb']:.1f} MB")
+    return problems
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_suite(
+    sizes: Iterable[int],
+    benches: Iterable[str],
+    seed: int = 1234,
+    config_path: str = "config/company_config.json",
+    corpus_dir: str = "benchmarks/.corpus",
+    llm_latency: float = 0.005,
+    llm_cap: int = 2000,
+    files_cap: int = 20000,
+    mem_cap: int = 20000,
+    concurrency: int = 4,
+    memory: bool = True,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    benches = list(benches)
+    results: Dict[str, Any] = {}
+
+    with FakeOllamaServer(latency_s=llm_latency) as srv, tempfile.TemporaryDirectory(prefix="aai-bench-") as workdir:
+        # Isolate the run: fake LLM, no response cache, throwaway memory/ticket stores
+        os.environ.update({
+            "OLLAMA_BASE_URL": srv.base_url,
+            "AAI_LLM_CACHE": "0",
+            "AAI_INTERACTIVE": "0",
+            "AAI_MEMORY_PATH": os.path.join(workdir, "memory.sqlite"),
+            "AAI_OUTPUT_DIR": os.path.join(workdir, "outputs"),
+            "AAI_TICKET_SINK": "jsonl",
+        })
+        from agent.llm import reset_clients
+
+        reset_clients()
+        ctx = {
+            "config_path": config_path, "workdir": workdir, "concurrency": concurrency,
+            "llm_cap": llm_cap, "files_cap": files_cap, "mem_cap": mem_cap, "memory": memory,
+        }
+
+        for n in sizes:
+            path = os.path.join(corpus_dir, f"synthetic-{n}-{seed}.jsonl")
+            if not os.path.exists(path):
+                log(f"[INFO] Writing corpus {path}")
+                write_corpus(path, n, seed=seed, config_path=config_path)
+            for name in benches:
+                res = _measure(name, path, n, ctx)
+                results[f"{name}@{n}"] = res
+                peak = f"  peak {res['peak_mb']:.1f} MB" if "peak_mb" in res else ""
+                log(f"[BENCH] {name:<17} n={res['n']:>8}  {res['per_sec']:>12.1f}/s  {res['seconds']:>8.2f}s{peak}")
+
+        reset_clients()
+        from routing.sinks import close_default_sink
+
+        close_default_sink()
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_rev": _git_rev(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": seed,
+            "llm_latency_s": llm_latency,
+            "llm_cap": llm_cap,
+            "concurrency": concurrency,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", default="1k,10k", help="corpus sizes, e.g. 1k,10k,100k,1m (default: %(default)s)")
+    ap.add_argument("--benches", default=",".join(ALL_BENCHES), help="comma-separated subset of: " + ", ".join(ALL_BENCHES))
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--config", default="config/company_config.json")
+    ap.add_argument("--llm-latency", type=float, default=0.005, help="fake Ollama seconds per request")
+    ap.add_argument("--llm-cap", type=int, default=2000, help="max emails for LLM-bound benches")
+    ap.add_argument("--files-cap", type=int, default=20000, help="max emails for the one-file-per-ticket bench")
+    ap.add_argument("--mem-cap", type=int, default=20000, help="emails in the traced-memory pass")
+    ap.add_argument("--concurrency", type=int, default=4, help="in-flight emails for the graph bench")
+    ap.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    ap.add_argument("--out", default="benchmarks/results/latest.json")
+    ap.add_argument("--baseline", help="compare against this results file; exit 1 on regression")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed throughput drop (default: %(default)s)")
+    ap.add_argument("--mem-tolerance", type=float, default=0.25, help="allowed peak memory growth (default: %(default)s)")
+    ap.add_argument("--save-baseline", metavar="PATH", help="also write the results as a new baseline")
+    args = ap.parse_args(argv)
+
+    benches = [b.strip() for b in args.benches.split(",") if b.strip()]
+    unknown = sorted(set(benches) - set(ALL_BENCHES))
+    if unknown:
+        ap.error(f"unknown benches: {', '.join(unknown)}")
+
+    report = run_suite(
+        corpus_sizes(args.sizes),
+        benches,
+        seed=args.seed,
+        config_path=args.config,
+        llm_latency=args.llm_latency,
+        llm_cap=args.llm_cap,
+        files_cap=args.files_cap,
+        mem_cap=args.mem_cap,
+        concurrency=args.concurrency,
+        memory=not args.no_memory,
+    )
+
+    for path in filter(None, (args.out, args.save_baseline)):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"[INFO] Results written to {path}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        problems = compare(report, baseline, args.tolerance, args.mem_tolerance)
+        if problems:
+            print("[FAIL] Regressions against " + args.baseline)
+            for p in problems:
+                print("  - " + p)
+            return 1
+        print(f"[OK] No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,33 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import threading
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from routing.aliases import AliasIndex
+from routing.keywords import KeywordMatcher
+
+
+# Routing cascade (routing_rules.cascade overrides both): stages run in order and
+# the first result at or above its stage's confidence threshold wins
+ROUTING_STAGES: Tuple[str, ...] = ("alias", "keyword", "triage", "knn", "llm")
+DEFAULT_STAGE_THRESHOLDS: Dict[str, float] = {"alias": 0.0, "triage": 0.8, "keyword": 0.7, "knn": 0.7, "llm": 0.0}
+
+# Department names produced by agent.triage_agent.triage
+TRIAGE_DEPARTMENTS: Tuple[str, ...] = ("sales", "support", "finance")
 
 
 def load_company_config(path: str) -> Dict[str, Any]:
     p = Path(path)
     data = json.loads(p.read_text(encoding="utf-8"))
+    return _apply_defaults(data)
+
 
+def _apply_defaults(data: Dict[str, Any]) -> Dict[str, Any]:
     # basic sanity defaults
     data.setdefault("company", {})
     data.setdefault("departments", [])
@@ -64,3 +83,193 @@ def fallback_employee_email(cfg: Dict[str, Any]) -> Optional[str]:
     if isinstance(fb, str) and fb.strip():
         return fb.strip().lower()
     return None
+
+
+# ----------------------------
+# Compiled snapshot
+# ----------------------------
+
+@dataclass(frozen=True)
+class CompanyConfig:
+    """
+    Immutable, pre-indexed view of a company config.
+
+    Built once per config file version by `load_company_snapshot`; graph nodes
+    read the indexes from here instead of rebuilding them for every email.
+    """
+
+    path: str
+    digest: str
+    raw: Mapping[str, Any]
+
+    dept_ids: Tuple[str, ...]
+    dept_id_to_name: Mapping[str, str]
+    dept_id_to_tone: Mapping[str, str]
+    default_tone: Optional[str]
+
+    alias_to_department: Mapping[str, str]
+    alias_index: AliasIndex
+    employees_by_department: Mapping[str, Tuple[Mapping[str, Any], ...]]
+    fallback_employee_email: Optional[str]
+    fallback_employee: Optional[Mapping[str, Any]]
+
+    # ((department_id, (keyword, ...)), ...) - lowercased, stripped, in config order
+    keyword_rules: Tuple[Tuple[str, Tuple[str, ...]], ...]
+    keyword_matcher: KeywordMatcher
+
+    # lowercased triage department ("finance") -> department_id ("billing")
+    triage_department_map: Mapping[str, str]
+    routing_stages: Tuple[str, ...]
+    stage_thresholds: Mapping[str, float]
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _compile_keyword_rules(cfg: Dict[str, Any]) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    out: List[Tuple[str, Tuple[str, ...]]] = []
+    rules = (cfg.get("routing_rules", {}) or {}).get("keyword_to_department", []) or []
+    for rule in rules:
+        if not isinstance(rule, dict):
+            continue
+        dep_id = str(rule.get("department_id") or "").strip().lower()
+        if not dep_id:
+            continue
+        kws = tuple(k for k in (str(kw).strip().lower() for kw in (rule.get("keywords") or [])) if k)
+        if kws:
+            out.append((dep_id, kws))
+    return tuple(out)
+
+
+def _compile_triage_map(cfg: Dict[str, Any], dept_ids: Tuple[str, ...]) -> Dict[str, str]:
+    """
+    routing_rules.triage_department_map, completed by matching triage names
+    against department ids and display names ("Support" -> "support").
+    """
+    out: Dict[str, str] = {}
+    names = {name.strip().lower(): dep for dep, name in dept_id_to_name(cfg).items()}
+    for triage_name in TRIAGE_DEPARTMENTS:
+        if triage_name in dept_ids:
+            out[triage_name] = triage_name
+        elif names.get(triage_name, "").strip().lower() in dept_ids:
+            out[triage_name] = names[triage_name].strip().lower()
+
+    configured = (cfg.get("routing_rules") or {}).get("triage_department_map") or {}
+    if isinstance(configured, dict):
+        for triage_name, dep in configured.items():
+            dep_id = str(dep or "").strip().lower()
+            if dep_id in dept_ids:
+                out[str(triage_name).strip().lower()] = dep_id
+    return out
+
+
+def _compile_cascade(cfg: Dict[str, Any]) -> Tuple[Tuple[str, ...], Dict[str, float]]:
+    cascade = (cfg.get("routing_rules") or {}).get("cascade") or {}
+    stages = tuple(
+        s for s in (str(x).strip().lower() for x in (cascade.get("stages") or ROUTING_STAGES)) if s in ROUTING_STAGES
+    )
+    thresholds = dict(DEFAULT_STAGE_THRESHOLDS)
+    for stage, value in (cascade.get("thresholds") or {}).items():
+        stage = str(stage).strip().lower()
+        if stage in ROUTING_STAGES:
+            thresholds[stage] = float(value)
+    return stages or ROUTING_STAGES, thresholds
+
+
+def compile_company_config(cfg: Dict[str, Any], path: str = "", digest: str = "") -> CompanyConfig:
+    """Build a `CompanyConfig` from an already-loaded config dict."""
+    cfg = _apply_defaults(dict(cfg))
+
+    dept_ids = tuple(
+        d for d in (
+            str(dep.get("id")).strip().lower()
+            for dep in (cfg.get("departments", []) or [])
+            if isinstance(dep, dict) and dep.get("id")
+        ) if d
+    )
+
+    fb = fallback_employee_email(cfg)
+    fb_emp = None
+    if fb:
+        for emp in (cfg.get("employees") or []):
+            if isinstance(emp, dict) and str(emp.get("email", "")).strip().lower() == fb:
+                fb_emp = emp
+                break
+
+    default_tone = ((cfg.get("company") or {}).get("default_tone") or "").strip()
+    keyword_rules = _compile_keyword_rules(cfg)
+    aliases = {addr: str(dep).strip().lower() for addr, dep in alias_to_department(cfg).items()}
+    stages, thresholds = _compile_cascade(cfg)
+
+    return CompanyConfig(
+        path=path,
+        digest=digest,
+        raw=_freeze(cfg),
+        dept_ids=dept_ids,
+        dept_id_to_name=MappingProxyType(dept_id_to_name(cfg)),
+        dept_id_to_tone=MappingProxyType(dept_id_to_tone(cfg)),
+        default_tone=default_tone or None,
+        alias_to_department=MappingProxyType(aliases),
+        alias_index=AliasIndex(aliases),
+        employees_by_department=MappingProxyType(
+            {dep: tuple(_freeze(e) for e in emps) for dep, emps in employees_by_department(cfg).items()}
+        ),
+        fallback_employee_email=fb,
+        fallback_employee=_freeze(fb_emp) if fb_emp is not None else None,
+        keyword_rules=keyword_rules,
+        keyword_matcher=KeywordMatcher(
+            keyword_rules,
+            word_boundary=bool((cfg.get("routing_rules") or {}).get("keyword_word_boundary", False)),
+        ),
+        triage_department_map=MappingProxyType(_compile_triage_map(cfg, dept_ids)),
+        routing_stages=stages,
+        stage_thresholds=MappingProxyType(thresholds),
+    )
+
+
+def as_company_config(cfg: Any) -> CompanyConfig:
+    """Accept either a compiled snapshot or a raw config dict (compiled on the fly)."""
+    if isinstance(cfg, CompanyConfig):
+        return cfg
+    return compile_company_config(dict(cfg or {}))
+
+
+_snapshot_lock = threading.Lock()
+# resolved path -> ((st_mtime_ns, st_size), snapshot)
+_snapshot_cache: Dict[str, Tuple[Tuple[int, int], CompanyConfig]] = {}
+
+
+def load_company_snapshot(path: str) -> CompanyConfig:
+    """
+    Return the compiled snapshot for `path`, cached per file.
+
+    A stat() per call detects edits (mtime/size). When those change, the file is
+    re-read and hashed; the snapshot is only rebuilt if the content hash differs,
+    so touching the file without editing it keeps the cached indexes.
+    """
+    p = Path(path).resolve()
+    key = str(p)
+    st = p.stat()
+    sig = (st.st_mtime_ns, st.st_size)
+
+    with _snapshot_lock:
+        cached = _snapshot_cache.get(key)
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+
+    raw_bytes = p.read_bytes()
+    digest = hashlib.sha256(raw_bytes).hexdigest()
+
+    if cached is not None and cached[1].digest == digest:
+        snap = cached[1]
+    else:
+        snap = compile_company_config(json.loads(raw_bytes.decode("utf-8")), path=key, digest=digest)
+
+    with _snapshot_lock:
+        _snapshot_cache[key] = (sig, snap)
+    return snap
@@ -1,58 +1,328 @@
 import json
+import re
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator, List, Mapping, Optional, TextIO
 
+from ingestion.mailbox import is_maildir, iter_eml, iter_maildir, iter_mbox, looks_like_mbox, mbox_offsets
 
-def load_emails(path: str) -> list[dict]:
+
+# JSON string literal or a // comment start; used to find comments outside strings
+_STRING_OR_COMMENT = re.compile(r'"(?:[^"\\]|\\.)*"|//')
+_QUOTE_OR_COMMENT = re.compile(r'"|//')
+# Contents of a JSON string up to (not including) its closing quote
+_STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+# Characters that open or close a JSON value's nesting, and those that end a bare number or literal
+_STRUCTURE = re.compile(r'[\[\]{}"]')
+_SCALAR_END = re.compile(r"[\s,\]}]")
+
+_JSONL_SUFFIXES = {".jsonl", ".ndjson"}
+
+_CHUNK_CHARS = 64 * 1024
+
+# Guard against reading an entire broken file while waiting for an element to close
+_MAX_ELEMENT_CHARS = 64 * 1024 * 1024
+
+# JSON arrays up to this size are pre-counted for progress output; bigger ones
+# would cost a second full parse
+_COUNT_MAX_BYTES = 16 * 1024 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+def _strip_comment(line: str) -> str:
+    """Remove a trailing // comment that is not inside a JSON string."""
+    if "//" not in line:
+        return line.rstrip()
+    for m in _STRING_OR_COMMENT.finditer(line):
+        if m.group(0) == "//":
+            return line[: m.start()].rstrip()
+    return line.rstrip()
+
+
+class _CommentStripper:
+    """
+    Removes // comments (up to the end of their line) outside JSON strings
+    from text fed in arbitrary chunks. State that straddles a chunk boundary
+    (inside a string or comment, a lone "/" or a trailing backslash) is carried over.
     """
-    Load a list of email objects from a JSON file.
 
-    Expected JSON format:
-    [
-      {"id": "...", "from": "...", "subject": "...", "body": "..."},
-      ...
-    ]
+    def __init__(self) -> None:
+        self.in_string = False
+        self.in_comment = False
+        self.carry = ""
+
+    def feed(self, chunk: str, final: bool = False) -> str:
+        text = self.carry + chunk
+        self.carry = ""
+        out = []
+        pos = 0
+        n = len(text)
+        while pos < n:
+            if self.in_comment:
+                nl = text.find("\n", pos)
+                if nl < 0:
+                    break
+                self.in_comment = False
+                pos = nl  # the newline itself is kept
+            elif self.in_string:
+                end = _STRING_BODY.match(text, pos).end()
+                if end < n and text[end] == '"':
+                    out.append(text[pos : end + 1])
+                    self.in_string = False
+                    pos = end + 1
+                else:
+                    # The string continues in the next chunk; keep a dangling escape with it
+                    if end < n and not final:
+                        self.carry = text[end:]
+                        out.append(text[pos:end])
+                    else:
+                        out.append(text[pos:])
+                    break
+            else:
+                m = _QUOTE_OR_COMMENT.search(text, pos)
+                if m is None:
+                    if text.endswith("/") and not final:
+                        self.carry = "/"
+                        n -= 1
+                    out.append(text[pos:n])
+                    break
+                if m.group(0) == '"':
+                    out.append(text[pos : m.end()])
+                    self.in_string = True
+                else:
+                    out.append(text[pos : m.start()])
+                    self.in_comment = True
+                pos = m.end()
+        return "".join(out)
+
+
+def _skip_separators(buf: str, pos: int) -> int:
+    n = len(buf)
+    while pos < n and buf[pos] in " \t\r\n,":
+        pos += 1
+    return pos
+
+
+class _ValueScanner:
+    """
+    Finds where one JSON value ends without decoding it, so a value that spans
+    many chunks is decoded once instead of being re-parsed on every chunk.
+    Tracks bracket depth and string/escape state across the pieces it is fed.
+    """
+
+    def __init__(self) -> None:
+        self.kind = ""  # "{" / "[" container, '"' string, or "" for a number or literal
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def scan(self, text: str, pos: int) -> int:
+        """Index just past the value's end in `text`, or -1 if it continues in the next piece."""
+        n = len(text)
+        if not self.kind and pos < n and self.depth == 0:
+            c = text[pos]
+            if c in "{[":
+                self.kind, self.depth = c, 1
+                pos += 1
+            elif c == '"':
+                self.kind, self.in_string = c, True
+                pos += 1
+            else:
+                self.depth = -1  # scalar; no nesting to track
+        if self.depth < 0:
+            m = _SCALAR_END.search(text, pos)
+            return m.start() if m else -1
+
+        while pos < n:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                    pos += 1
+                    continue
+                end = _STRING_BODY.match(text, pos).end()
+                if end == n:
+                    return -1
+                if text[end] == "\\":  # only a backslash at the very end is left unmatched
+                    self.escaped = True
+                    pos = end + 1
+                    continue
+                self.in_string = False
+                pos = end + 1
+                if self.kind == '"':
+                    return pos
+                continue
+            m = _STRUCTURE.search(text, pos)
+            if m is None:
+                return -1
+            pos = m.end()
+            c = m.group(0)
+            if c == '"':
+                self.in_string = True
+            elif c in "{[":
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return pos
+        return -1
+
+
+def _iter_json_array(fh: TextIO, where: Path) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array one by one.
+
+    The file is read in fixed-size chunks (minified single-line exports
+    included); only the element currently being decoded is buffered, and it
+    is decoded once it is complete. // comments outside strings are stripped
+    like the old whole-file loader did, and anything after the closing bracket
+    is ignored.
+    """
+    stripper = _CommentStripper()
+    buf = ""
+    pos = 0
+    started = False
+    eof = False
+    scanner: Optional[_ValueScanner] = None
+    pending: List[str] = []  # pieces of an element that spans chunks
+    pending_chars = 0
+
+    while not eof:
+        chunk = fh.read(_CHUNK_CHARS)
+        eof = not chunk
+        text = stripper.feed(chunk, final=eof)
+
+        if scanner is not None:
+            # Only the new text is scanned; the pieces are joined once the element closes
+            if scanner.scan(text, 0) < 0 and not (eof and scanner.depth < 0):
+                pending.append(text)
+                pending_chars += len(text)
+                if eof or pending_chars > _MAX_ELEMENT_CHARS:
+                    raise ValueError(f"Invalid JSON in {where}: unterminated element")
+                continue
+            buf = "".join(pending) + text
+            pending, pending_chars = [], 0
+        else:
+            buf = buf[pos:] + text
+        pos = 0
+
+        if not started:
+            pos = _skip_separators(buf, 0)
+            if pos == len(buf):
+                continue
+            if buf[pos] != "[":
+                raise ValueError("Email data must be a JSON list of email objects")
+            started = True
+            pos += 1
+
+        while True:
+            if scanner is None:
+                pos = _skip_separators(buf, pos)
+                if pos == len(buf):
+                    break
+                if buf[pos] == "]":
+                    return
+                scanner = _ValueScanner()
+                # A number or literal cut at the chunk edge must not decode early
+                if scanner.scan(buf, pos) < 0 and not (eof and scanner.depth < 0):
+                    if eof:
+                        raise ValueError(f"Invalid JSON in {where}: unterminated element")
+                    pending, pending_chars = [buf[pos:]], len(buf) - pos
+                    buf, pos = "", 0
+                    break
+
+            try:
+                item, pos = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON in {where}: {e}") from e
+            scanner = None
+            yield item
+
+    if not started:
+        raise ValueError("Email data must be a JSON list of email objects")
+    raise ValueError(f"Invalid JSON in {where}: missing closing bracket")
+
+
+def _iter_jsonl(fh: TextIO, where: Path) -> Iterator[Any]:
+    for lineno, line in enumerate(fh, start=1):
+        line = _strip_comment(line).strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in {where} line {lineno}: {e}") from e
+
+
+def iter_emails(path: str) -> Iterator[Mapping[str, Any]]:
+    """
+    Stream email objects from a JSON array file, a JSONL file or a mail store.
+
+    Memory use is bounded by the largest single email, so the first email is
+    available right away even for multi-GB exports. JSON arrays may contain
+    // comments (e.g. commented-out emails); .jsonl/.ndjson files hold one
+    email object per line. Maildir directories, mbox files and single .eml
+    files yield lazily parsed emails with the same keys.
     """
     p = Path(path)
 
     if not p.exists():
         raise FileNotFoundError(f"Email data file not found: {p.resolve()}")
 
+    if p.is_dir():
+        if not is_maildir(path):
+            raise ValueError(f"Directory is not a Maildir (no cur/ or new/): {p.resolve()}")
+        yield from iter_maildir(path)
+        return
+    if p.suffix.lower() == ".eml":
+        yield from iter_eml(path)
+        return
+    if looks_like_mbox(path):
+        yield from iter_mbox(path)
+        return
+
+    with p.open("r", encoding="utf-8") as fh:
+        items = _iter_jsonl(fh, p.resolve()) if p.suffix.lower() in _JSONL_SUFFIXES else _iter_json_array(fh, p.resolve())
+
+        # Ensure each item is dict-like
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValueError(f"Email at index {i} is not an object/dict")
+            yield item
+
+
+def count_emails(path: str) -> Optional[int]:
+    """
+    How many emails `path` holds, when that is cheap to find out: mail stores
+    and JSONL files are counted without parsing messages, JSON arrays only up
+    to _COUNT_MAX_BYTES. None means unknown (or unreadable; iterating reports why).
+    """
+    p = Path(path)
     try:
-        # Strip // comments before parsing (allows commented-out emails to remain in file)
-        content = p.read_text(encoding="utf-8")
-        
-        # Find the last closing bracket to determine where JSON ends
-        last_bracket_pos = content.rfind(']')
-        if last_bracket_pos == -1:
-            raise ValueError("No closing bracket found in JSON file")
-        
-        # Only process content up to and including the closing bracket
-        json_content = content[:last_bracket_pos + 1]
-        
-        # Strip // comments from the JSON content
-        lines = []
-        for line in json_content.split('\n'):
-            # Remove // comments but preserve the line structure
-            if '//' in line:
-                comment_pos = line.find('//')
-                # Check if // is inside a string (basic check)
-                before_comment = line[:comment_pos]
-                if before_comment.count('"') % 2 == 0:  # Even number of quotes = // is not in string
-                    line = before_comment.rstrip()
-            lines.append(line.rstrip())
-        
-        cleaned_content = '\n'.join(lines)
-        data: Any = json.loads(cleaned_content)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON in {p.resolve()}: {e}") from e
-
-    if not isinstance(data, list):
-        raise ValueError("Email data must be a JSON list of email objects")
+        if p.is_dir():
+            return sum(1 for _ in iter_maildir(path)) if is_maildir(path) else None
+        if p.suffix.lower() == ".eml":
+            return 1
+        if looks_like_mbox(path):
+            return len(mbox_offsets(path))
+        if p.suffix.lower() in _JSONL_SUFFIXES:
+            with p.open("rb") as fh:
+                return sum(1 for line in fh if line.strip() and not line.lstrip().startswith(b"//"))
+        if p.stat().st_size > _COUNT_MAX_BYTES:
+            return None
+        with p.open("r", encoding="utf-8") as fh:
+            return sum(1 for _ in _iter_json_array(fh, p.resolve()))
+    except (OSError, ValueError):
+        return None
 
-    # Ensure each item is dict-like
-    for i, item in enumerate(data):
-        if not isinstance(item, dict):
-            raise ValueError(f"Email at index {i} is not an object/dict")
 
-    return data
+def load_emails(path: str) -> list[dict]:
+    """
+    Load a list of email objects from a JSON file.
+
+    Expected JSON format:
+    [
+      {"id": "...", "from": "...", "subject": "...", "body": "..."},
+      ...
+    ]
+    """
+    return list(iter_emails(path))
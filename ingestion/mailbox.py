@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import html
+import json
+import mmap
+import os
+import re
+from array import array
+from collections.abc import Mapping
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesHeaderParser, BytesParser
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+_HEADER_PARSER = BytesHeaderParser(policy=policy.default)
+_FULL_PARSER = BytesParser(policy=policy.default)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+_INDEX_SUFFIX = ".aai-idx"
+_INDEX_VERSION = 1
+
+
+def _header_block(raw: bytes) -> bytes:
+    for sep in (b"\r\n\r\n", b"\n\n"):
+        i = raw.find(sep)
+        if i != -1:
+            return raw[: i + len(sep)]
+    return raw
+
+
+def _html_to_text(s: str) -> str:
+    s = re.sub(r"(?is)<(script|style)\b.*?</\1>", "", s)
+    s = re.sub(r"(?i)<br\s*/?>|</p>|</div>", "\n", s)
+    s = html.unescape(_TAG_RE.sub("", s))
+    return _BLANK_LINES_RE.sub("\n\n", s).strip()
+
+
+def _decode_body(raw: bytes) -> str:
+    msg = _FULL_PARSER.parsebytes(raw)
+    if not isinstance(msg, EmailMessage):
+        return ""
+    part = msg.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return ""
+    try:
+        content = part.get_content()
+    except (LookupError, UnicodeDecodeError):
+        payload = part.get_payload(decode=True) or b""
+        content = payload.decode("utf-8", errors="replace")
+    if not isinstance(content, str):
+        return ""
+    if part.get_content_subtype() == "html":
+        return _html_to_text(content)
+    return content
+
+
+class LazyEmail(Mapping):
+    """
+    Email dict backed by raw RFC 822 bytes.
+
+    Headers are parsed on construction (cheap); the MIME body is only decoded
+    the first time "body" is read, so messages that never reach the graph
+    never pay for it. Exposes the same keys as JSON emails (id, from, to,
+    subject, body) plus cc, delivered_to, date, message_id, in_reply_to and
+    references. Pickles as a plain dict (for process pools).
+    """
+
+    __slots__ = ("_load_raw", "_fields", "_body")
+
+    def __init__(self, load_raw: Callable[[], bytes], fallback_id: str):
+        self._load_raw = load_raw
+        self._body: Optional[str] = None
+
+        headers = _HEADER_PARSER.parsebytes(_header_block(load_raw()))
+
+        def h(name: str) -> str:
+            val = headers.get(name)
+            return str(val).strip() if val is not None else ""
+
+        message_id = h("Message-ID")
+        self._fields: Dict[str, Any] = {
+            "id": message_id.strip("<>") or fallback_id,
+            "from": h("From"),
+            "to": h("To"),
+            "cc": h("Cc"),
+            "delivered_to": [str(v) for v in (headers.get_all("Delivered-To") or [])],
+            "subject": h("Subject"),
+            "date": h("Date"),
+            "message_id": message_id,
+            "in_reply_to": h("In-Reply-To"),
+            "references": h("References"),
+        }
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "body":
+            if self._body is None:
+                self._body = _decode_body(self._load_raw())
+            return self._body
+        return self._fields[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._fields
+        yield "body"
+
+    def __len__(self) -> int:
+        return len(self._fields) + 1
+
+    @property
+    def body_decoded(self) -> bool:
+        return self._body is not None
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __repr__(self) -> str:
+        return f"LazyEmail(id={self._fields['id']!r}, subject={self._fields['subject']!r})"
+
+
+# ----------------------------
+# .eml / Maildir
+# ----------------------------
+
+def _file_loader(path: Path) -> Callable[[], bytes]:
+    return lambda: path.read_bytes()
+
+
+def iter_eml(path: str) -> Iterator[LazyEmail]:
+    p = Path(path)
+    yield LazyEmail(_file_loader(p), fallback_id=p.stem)
+
+
+def iter_maildir(path: str) -> Iterator[LazyEmail]:
+    """Messages from a Maildir's new/ and cur/ folders, in file-name (delivery) order."""
+    root = Path(path)
+    for sub in ("new", "cur"):
+        d = root / sub
+        if not d.is_dir():
+            continue
+        for f in sorted(d.iterdir()):
+            if f.is_file() and not f.name.startswith("."):
+                yield LazyEmail(_file_loader(f), fallback_id=f.name.split(":", 1)[0])
+
+
+def is_maildir(path: str) -> bool:
+    p = Path(path)
+    return p.is_dir() and ((p / "cur").is_dir() or (p / "new").is_dir())
+
+
+# ----------------------------
+# mbox
+# ----------------------------
+
+def looks_like_mbox(path: str) -> bool:
+    p = Path(path)
+    if p.suffix.lower() == ".mbox":
+        return True
+    try:
+        with p.open("rb") as fh:
+            return fh.read(5) == b"From "
+    except OSError:
+        return False
+
+
+def _scan_mbox(mm: mmap.mmap, start: int) -> List[int]:
+    """Offsets of every "From " separator line at or after `start`."""
+    out: List[int] = []
+    size = len(mm)
+    if start == 0:
+        if mm[:5] == b"From ":
+            out.append(0)
+        pos = 0
+    else:
+        out.append(start)
+        pos = start + 1
+
+    while True:
+        i = mm.find(b"\nFrom ", pos)
+        if i == -1:
+            break
+        # Separator lines follow a blank line; ">From " escapes and mid-line text never match
+        if mm[i - 1:i] == b"\n" or mm[i - 2:i] == b"\n\r":
+            out.append(i + 1)
+        pos = i + 1
+        if pos >= size:
+            break
+    return out
+
+
+def _index_path(path: Path) -> Path:
+    return path.with_name(path.name + _INDEX_SUFFIX)
+
+
+def _load_index(path: Path, st: os.stat_result) -> Tuple[Optional[array], bool]:
+    """Return (offsets, complete). `complete` is False when the mbox only grew since indexing."""
+    ip = _index_path(path)
+    try:
+        with ip.open("rb") as fh:
+            meta = json.loads(fh.readline())
+            offsets = array("Q")
+            offsets.frombytes(fh.read())
+    except (OSError, ValueError):
+        return None, False
+
+    if meta.get("version") != _INDEX_VERSION or len(offsets) != meta.get("count"):
+        return None, False
+    if meta.get("size") == st.st_size and meta.get("mtime_ns") == st.st_mtime_ns:
+        return offsets, True
+    if st.st_size > int(meta.get("size", 0)) and offsets:
+        # Appended to: keep everything before the last message, rescan from there
+        return offsets, False
+    return None, False
+
+
+def _save_index(path: Path, st: os.stat_result, offsets: array) -> None:
+    meta = {"version": _INDEX_VERSION, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "count": len(offsets)}
+    ip = _index_path(path)
+    tmp = ip.with_name(ip.name + ".tmp")
+    try:
+        with tmp.open("wb") as fh:
+            fh.write(json.dumps(meta).encode("utf-8") + b"\n")
+            fh.write(offsets.tobytes())
+        os.replace(tmp, ip)
+    except OSError:
+        # Read-only spool: run without a persisted index
+        pass
+
+
+def mbox_offsets(path: str) -> array:
+    """
+    Message start offsets for an mbox, using (and refreshing) the persisted
+    `<mbox>.aai-idx` index so re-opening a large spool does not rescan it.
+    """
+    p = Path(path)
+    st = p.stat()
+    offsets, complete = _load_index(p, st)
+    if offsets is not None and complete:
+        return offsets
+
+    with p.open("rb") as fh:
+        if st.st_size == 0:
+            return array("Q")
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if offsets is not None and mm[offsets[-1]:offsets[-1] + 5] == b"From ":
+                last = offsets.pop()
+                offsets.extend(_scan_mbox(mm, last))
+            else:
+                offsets = array("Q", _scan_mbox(mm, 0))
+
+    _save_index(p, st, offsets)
+    return offsets
+
+
+def iter_mbox(path: str) -> Iterator[LazyEmail]:
+    """
+    Messages from an mbox file, read through a shared read-only memory map.
+
+    Each message's bytes are sliced out of the map only when its headers or
+    body are parsed. The map is owned by the yielded emails (not the iterator),
+    so bodies can still be decoded after iteration has finished.
+    """
+    p = Path(path)
+    offsets = mbox_offsets(path)
+    if not offsets:
+        return
+
+    with p.open("rb") as fh:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    size = len(mm)
+    for n, start in enumerate(offsets):
+        end = offsets[n + 1] if n + 1 < len(offsets) else size
+        # Skip the "From sender date" separator line itself
+        body_start = mm.find(b"\n", start, end)
+        body_start = end if body_start == -1 else body_start + 1
+
+        def load_raw(s: int = body_start, e: int = end) -> bytes:
+            return mm[s:e]
+
+        yield LazyEmail(load_raw, fallback_id=f"{p.stem}-{n + 1}")
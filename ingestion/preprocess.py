@@ -1,54 +1,71 @@
 from __future__ import annotations
 
 import re
-from typing import Any
+from typing import Any, Optional, Tuple
 
 
-_SIGNATURE_SPLIT_PATTERNS = [
-    r"\n--\s*\n",          # common signature delimiter
-    r"\nRegards,\n",
-    r"\nBest regards,\n",
-    r"\nSincerely,\n",
+# Compiled once at import. Patterns start at a newline and never scan past the
+# end of a line, so a search stays linear in the body length.
+_SIGNATURE_SPLIT_RES = [
+    re.compile(r"\n--[ \t]*\n"),                        # common signature delimiter
+    re.compile(r"\nRegards,\n", re.IGNORECASE),
+    re.compile(r"\nBest regards,\n", re.IGNORECASE),
+    re.compile(r"\nSincerely,\n", re.IGNORECASE),
 ]
 
-_QUOTED_REPLY_PATTERNS = [
-    r"\nOn .* wrote:\n",   # quoted reply header
-    r"\nFrom: .*",         # forwarded/reply blocks
+_QUOTED_REPLY_RES = [
+    re.compile(r"\nOn [^\n]* wrote:(?:\n|$)", re.IGNORECASE),   # quoted reply header
+    re.compile(r"\nFrom: ", re.IGNORECASE),                      # forwarded/reply blocks
 ]
 
+_TRAILING_SPACE_RE = re.compile(r"[ \t]+$", re.MULTILINE)
+_INLINE_SPACE_RE = re.compile(r"[ \t]{2,}")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+# Rough tokens-per-character ratio of Llama-style BPE vocabularies on English email text
+CHARS_PER_TOKEN = 4
+
 
 def preprocess_email(email: dict[str, Any]) -> dict[str, str]:
     """
     Normalize and clean an email dict to a stable schema:
     {id, from, subject, body}
 
-    - Guarantees keys exist as strings (empty if missing)
-    - Normalizes line breaks
+    - Guarantees keys exist as strings (empty if missing); `text` is the body fallback
+    - Normalizes line breaks and collapses runs of spaces and blank lines
     - Strips leading/trailing whitespace
     - Light cleanup of signatures and quoted replies (basic)
     """
     eid = str(email.get("id") or "").strip()
     sender = str(email.get("from") or "").strip()
     subject = str(email.get("subject") or "").strip()
-    body = str(email.get("body") or "")
+    body = str(email.get("body") or email.get("text") or "")
 
     # Normalize newlines
     body = body.replace("\r\n", "\n").replace("\r", "\n").strip()
 
     # Remove obvious quoted reply sections (basic heuristic)
-    for pat in _QUOTED_REPLY_PATTERNS:
-        m = re.search(pat, body, flags=re.IGNORECASE)
+    for rx in _QUOTED_REPLY_RES:
+        m = rx.search(body)
         if m:
             body = body[: m.start()].strip()
             break
 
     # Remove common signature blocks (basic heuristic)
-    for pat in _SIGNATURE_SPLIT_PATTERNS:
-        parts = re.split(pat, body, maxsplit=1, flags=re.IGNORECASE)
-        if len(parts) > 1:
-            body = parts[0].strip()
+    for rx in _SIGNATURE_SPLIT_RES:
+        m = rx.search(body)
+        if m:
+            body = body[: m.start()].strip()
             break
 
+    # Whitespace only costs prompt tokens (most bodies have none to spare, so check first)
+    if " \n" in body or "\t" in body:
+        body = _TRAILING_SPACE_RE.sub("", body)
+    if "  " in body or "\t" in body:
+        body = _INLINE_SPACE_RE.sub(" ", body)
+    if "\n\n\n" in body:
+        body = _BLANK_LINES_RE.sub("\n\n", body)
+
     # Guarantee schema
     return {
         "id": eid,
@@ -56,3 +73,39 @@ def preprocess_email(email: dict[str, Any]) -> dict[str, str]:
         "subject": subject,
         "body": body,
     }
+
+
+# ----------------------------
+# Token budget
+# ----------------------------
+
+def estimate_tokens(text: str) -> int:
+    """Approximate prompt tokens of `text` (no tokenizer needed; ~4 characters per token)."""
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, budget: Optional[int], head_share: float = 0.7) -> Tuple[str, bool]:
+    """
+    Fit `text` into about `budget` tokens, keeping the head (where the request
+    usually is) and the tail (sign-off, latest lines) around a marker.
+    Returns (text, truncated). A budget of None or <= 0 disables truncation.
+    """
+    text = text or ""
+    if not budget or budget <= 0 or estimate_tokens(text) <= budget:
+        return text, False
+
+    keep = budget * CHARS_PER_TOKEN
+    head_len = int(keep * head_share)
+    tail_len = keep - head_len
+
+    head = text[:head_len]
+    cut = head.rfind(" ")
+    if cut > head_len // 2:
+        head = head[:cut]
+    tail = text[len(text) - tail_len:] if tail_len > 0 else ""
+    cut = tail.find(" ")
+    if 0 <= cut < tail_len // 2:
+        tail = tail[cut + 1:]
+
+    omitted = estimate_tokens(text) - estimate_tokens(head) - estimate_tokens(tail)
+    return f"{head.rstrip()}\n[... {omitted} tokens omitted ...]\n{tail.lstrip()}", True
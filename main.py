@@ -1,14 +1,36 @@
 from __future__ import annotations
 
+import argparse
+import asyncio
+import cProfile
+import multiprocessing
 import os
+import queue
 from collections import Counter
-from typing import Any, Dict, List
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from ingestion.loader import load_emails
+from ingestion.loader import count_emails, iter_emails
 from routing.router import route
+from routing.sinks import close_default_sink
 
-from agent.graph import build_graph
-from config.loader import load_company_config, dept_id_to_name
+from agent.graph import (
+    build_graph,
+    build_prepare_graph,
+    build_review_graph,
+    is_interactive,
+    near_duplicates,
+    prompt_token_counts,
+    routing_budget,
+    routing_stage_counts,
+    sender_memory_stats,
+)
+from agent.review_queue import ReviewQueue
+from agent.llm import pool_stats
+from agent.llm_cache import get_llm_cache
+from config.loader import load_company_snapshot
+from utils.metrics import REGISTRY, write_json_report, write_prometheus
 
 
 def print_department_summary(counts: Counter, dept_id_to_name_map: Dict[str, str]) -> None:
@@ -36,72 +58,452 @@ def print_department_summary(counts: Counter, dept_id_to_name_map: Dict[str, str
     print("=" * 60 + "\n")
 
 
-def main() -> None:
-    data_path = os.getenv("AAI_EMAIL_DATA", "data/sample_emails.json")
-    config_path = os.getenv("AAI_COMPANY_CONFIG", "config/company_config.json")
-    max_revs = int(os.getenv("AAI_MAX_REVISIONS", "3"))
+# ----------------------------
+# Per-email helpers
+# ----------------------------
 
-    emails: List[Dict[str, Any]] = load_emails(data_path)
-    print(f"[INFO] Loaded {len(emails)} raw emails from {data_path}")
-    print(f"[INFO] Using company config from {config_path}")
+def _email_id(email: Dict[str, Any], i: int) -> str:
+    return email.get("id") or email.get("email_id") or f"email_{i:03d}"
 
-    cfg = load_company_config(config_path)
-    dept_map = dept_id_to_name(cfg)
 
-    graph = build_graph()
+def _progress(i: int, total: Optional[int]) -> str:
+    # The total is None when counting the input up front would be too costly
+    return f"{i}/{total}" if total else str(i)
 
-    dept_counts: Counter = Counter()
 
+def _initial_state(
+    email: Dict[str, Any],
+    config_path: str,
+    max_revs: int,
+    interactive: Optional[bool] = None,
+) -> Dict[str, Any]:
+    state: Dict[str, Any] = {
+        "email": email,
+        "config_path": config_path,
+        "max_revisions": max_revs,
+        "revision_count": 0,
+        "feedback": None,
+        "errors": [],
+        "approved": False,
+        "skipped": False,
+    }
+    if interactive is not None:
+        state["interactive"] = interactive
+    return state
+
+
+def _handle_final_state(
+    i: int,
+    total: Optional[int],
+    email: Dict[str, Any],
+    final_state: Dict[str, Any],
+    dept_counts: Counter,
+    dept_map: Dict[str, str],
+) -> None:
+    email_id = _email_id(email, i)
+
+    dept_id = (final_state.get("department_id") or "needs_review").strip().lower()
+    if not dept_id:
+        dept_id = "needs_review"
+
+    dept_label = dept_map.get(dept_id, dept_id)
+
+    triage_result = {
+        # IMPORTANT: use dept_id directly so router creates outputs/<dept_id>/
+        "department": dept_id,
+        "confidence": float(final_state.get("confidence", 0.0)),
+        "summary": final_state.get("summary", ""),
+        "tags": final_state.get("tags", []),
+    }
+
+    draft_text = final_state.get("draft", "")
+    out_path = route(email, triage_result, draft_text)
+
+    # Count only once the ticket exists so the summary matches the [OK] lines
+    dept_counts[dept_id] += 1
+
+    print(
+        f"[OK] ({_progress(i, total)}) {email_id} -> "
+        f"{dept_label} (conf={triage_result['confidence']:.2f}) -> {out_path}"
+    )
+
+    errs = final_state.get("errors") or []
+    if errs:
+        print(f"[WARN] {email_id}: " + " | ".join(errs))
+
+
+# ----------------------------
+# Runners
+# ----------------------------
+
+def run_serial(
+    graph,
+    emails: Iterable[Dict[str, Any]],
+    total: Optional[int],
+    config_path: str,
+    max_revs: int,
+    dept_counts: Counter,
+    dept_map: Dict[str, str],
+) -> None:
+    """Process emails one at a time (required for the interactive review loop)."""
     for i, email in enumerate(emails, start=1):
-        email_id = email.get("id") or email.get("email_id") or f"email_{i:03d}"
-
-        state = {
-            "email": email,
-            "config_path": config_path,
-            "max_revisions": max_revs,
-            "revision_count": 0,
-            "feedback": None,
-            "errors": [],
-            "approved": False,
-            "skipped": False,
-        }
+        try:
+            final_state = graph.invoke(_initial_state(email, config_path, max_revs))
+            _handle_final_state(i, total, email, final_state, dept_counts, dept_map)
+        except Exception as e:
+            print(f"[ERR] ({_progress(i, total)}) {_email_id(email, i)} failed: {e}")
+
+
+def run_review_prefetch(
+    emails: Iterable[Dict[str, Any]],
+    total: Optional[int],
+    config_path: str,
+    max_revs: int,
+    depth: int,
+    dept_counts: Counter,
+    dept_map: Dict[str, str],
+) -> None:
+    """
+    Interactive mode with a prefetching review queue: routing and drafting for
+    the next `depth` emails run in the background while the reviewer works on
+    the current one. Review and ticket writes stay in input order on this thread.
+    """
+    prepare_graph = build_prepare_graph()
+    review_graph = build_review_graph()
 
+    def prepare(email: Dict[str, Any]) -> Dict[str, Any]:
+        # Background drafts are not streamed; the review loop prints them when their turn comes
+        return prepare_graph.invoke(_initial_state(email, config_path, max_revs, interactive=False))
+
+    queue = ReviewQueue(emails, prepare, depth=depth, workers=int(os.getenv("AAI_PREFETCH_WORKERS", "0")))
+    for i, email, state, err in queue:
+        try:
+            if err is not None:
+                raise err
+            state["interactive"] = True
+            final_state = review_graph.invoke(state)
+            _handle_final_state(i, total, email, final_state, dept_counts, dept_map)
+        except Exception as e:
+            print(f"[ERR] ({_progress(i, total)}) {_email_id(email, i)} failed: {e}")
+
+    st = queue.stats()
+    if st["waited"]:
+        print(f"[INFO] Review queue: waited for {st['waited']} draft(s), {st['wait_s']:.1f}s in total")
+
+
+async def run_batch_async(
+    graph,
+    emails: Iterable[Dict[str, Any]],
+    total: Optional[int],
+    config_path: str,
+    max_revs: int,
+    concurrency: int,
+    dept_counts: Counter,
+    dept_map: Dict[str, str],
+) -> None:
+    """
+    Non-interactive batch mode: drive the compiled graph via `ainvoke` with at
+    most `concurrency` emails in flight.
+
+    Emails are pulled from `emails` only when a slot frees up, so at most
+    `concurrency` states are held in memory. Result handling (ticket write,
+    counters, printing) runs on the event loop thread, so the shared Counter
+    needs no locking.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+    pending: set = set()
+
+    async def _one(i: int, email: Dict[str, Any]) -> None:
         try:
-            final_state = graph.invoke(state)
+            final_state = await graph.ainvoke(_initial_state(email, config_path, max_revs, interactive=False))
+            _handle_final_state(i, total, email, final_state, dept_counts, dept_map)
+        except Exception as e:
+            print(f"[ERR] ({_progress(i, total)}) {_email_id(email, i)} failed: {e}")
+        finally:
+            sem.release()
+
+    for i, email in enumerate(emails, start=1):
+        await sem.acquire()
+        task = asyncio.create_task(_one(i, email))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    if pending:
+        await asyncio.gather(*pending)
+
+
+# ----------------------------
+# Process-pool sharding
+# ----------------------------
+
+# Keys shipped back from workers; everything else (config, internal state) stays in the worker.
+_RESULT_KEYS = ("department_id", "confidence", "summary", "tags", "draft", "errors")
 
-            dept_id = (final_state.get("department_id") or "needs_review").strip().lower()
-            if not dept_id:
-                dept_id = "needs_review"
+_WORKER_GRAPH = None
 
-            dept_counts[dept_id] += 1
 
-            dept_label = dept_map.get(dept_id, dept_id)
+def _budget_shares(total: int, workers: int) -> List[int]:
+    """Split `total` over `workers`; the first `total % workers` workers get one extra call."""
+    base, extra = divmod(total, max(1, workers))
+    return [base + (1 if w < extra else 0) for w in range(max(1, workers))]
 
-            triage_result = {
-                # IMPORTANT: use dept_id directly so router creates outputs/<dept_id>/
-                "department": dept_id,
-                "confidence": float(final_state.get("confidence", 0.0)),
-                "summary": final_state.get("summary", ""),
-                "tags": final_state.get("tags", []),
-            }
 
-            draft_text = final_state.get("draft", "")
-            out_path = route(email, triage_result, draft_text)
+def _worker_budgets(total: Optional[int], per_minute: Optional[int], workers: int) -> List[Dict[str, str]]:
+    """Per-worker LLM routing caps (env var -> value); a cap that is unset stays unset."""
+    caps = {"AAI_LLM_ROUTING_BUDGET": total, "AAI_LLM_ROUTING_PER_MINUTE": per_minute}
+    out: List[Dict[str, str]] = [{} for _ in range(max(1, workers))]
+    for name, cap in caps.items():
+        if cap is not None:
+            for share, env in zip(_budget_shares(cap, workers), out):
+                env[name] = str(share)
+    return out
 
-            print(
-                f"[OK] ({i}/{len(emails)}) {email_id} -> "
-                f"{dept_label} (conf={triage_result['confidence']:.2f}) -> {out_path}"
-            )
 
-            errs = final_state.get("errors") or []
-            if errs:
-                print(f"[WARN] {email_id}: " + " | ".join(errs))
+def _init_worker(config_path: str, budget_shares: Any = None) -> None:
+    global _WORKER_GRAPH
+    if budget_shares is not None:
+        # Each worker takes one share of the run's LLM routing caps. A replacement
+        # worker finds the queue empty and gets none (it must not block, nor get a full cap).
+        try:
+            env = budget_shares.get(timeout=5)
+        except queue.Empty:
+            env = {name: "0" for name in ("AAI_LLM_ROUTING_BUDGET", "AAI_LLM_ROUTING_PER_MINUTE") if os.getenv(name)}
+        os.environ.update(env)
+    _WORKER_GRAPH = build_graph()
+    # Warm this worker's compiled config snapshot before the first shard arrives
+    load_company_snapshot(config_path)
+
 
+def _process_shard(
+    shard: List[Tuple[int, Dict[str, Any]]],
+    config_path: str,
+    max_revs: int,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Run one shard inside a worker process; returns compact per-email results and the shard's metrics."""
+    graph = _WORKER_GRAPH if _WORKER_GRAPH is not None else build_graph()
+    REGISTRY.reset()
+    results: List[Dict[str, Any]] = []
+    for i, email in shard:
+        try:
+            final_state = graph.invoke(_initial_state(email, config_path, max_revs, interactive=False))
+            results.append({
+                "index": i,
+                "email": email,
+                "final_state": {k: final_state.get(k) for k in _RESULT_KEYS if k in final_state},
+            })
         except Exception as e:
-            print(f"[ERR] ({i}/{len(emails)}) {email_id} failed: {e}")
+            results.append({"index": i, "email": email, "error": str(e)})
+    return results, REGISTRY.export_state()
+
+
+def _iter_shards(emails: Iterable[Dict[str, Any]], shard_size: int) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    it = enumerate(emails, start=1)
+    while True:
+        shard = list(islice(it, max(1, shard_size)))
+        if not shard:
+            return
+        yield shard
 
+
+def run_sharded(
+    emails: Iterable[Dict[str, Any]],
+    total: Optional[int],
+    config_path: str,
+    max_revs: int,
+    workers: int,
+    shard_size: int,
+    dept_counts: Counter,
+    dept_map: Dict[str, str],
+) -> None:
+    """
+    Offline mode: split the backlog into shards and run them on a process pool.
+
+    Each worker builds its own graph and config snapshot once. Results stream back shard by shard;
+    the parent writes tickets and merges department counts, so only the parent
+    touches outputs/. At most 2 shards per worker are queued at any time.
+    """
+    max_in_flight = max(1, workers) * 2
+    shards = _iter_shards(emails, shard_size)
+
+    budget = routing_budget()
+    shares = None
+    if budget.total is not None or budget.per_minute is not None:
+        shares = multiprocessing.Queue()
+        for env in _worker_budgets(budget.total, budget.per_minute, workers):
+            shares.put(env)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config_path, shares)) as pool:
+        in_flight = set()
+        exhausted = False
+
+        while True:
+            while not exhausted and len(in_flight) < max_in_flight:
+                shard = next(shards, None)
+                if shard is None:
+                    exhausted = True
+                    break
+                in_flight.add(pool.submit(_process_shard, shard, config_path, max_revs))
+
+            if not in_flight:
+                break
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try:
+                    results, shard_metrics = fut.result()
+                except Exception as e:
+                    print(f"[ERR] shard failed: {e}")
+                    continue
+
+                REGISTRY.merge_state(shard_metrics)
+                for r in results:
+                    i, email = r["index"], r["email"]
+                    if "error" in r:
+                        print(f"[ERR] ({_progress(i, total)}) {_email_id(email, i)} failed: {r['error']}")
+                        continue
+                    try:
+                        _handle_final_state(i, total, email, r["final_state"], dept_counts, dept_map)
+                    except Exception as e:
+                        print(f"[ERR] ({_progress(i, total)}) {_email_id(email, i)} failed: {e}")
+
+
+def _print_node_timings() -> None:
+    rows = [h for h in REGISTRY.snapshot()["histograms"] if h["name"] == "aai_node_seconds"]
+    if not rows:
+        return
+    print("[TIMING] node            count     p50      p95      max")
+    for h in sorted(rows, key=lambda r: -r["sum"]):
+        print(
+            f"[TIMING] {h['labels'].get('node', ''):<14} {h['count']:>6}  "
+            f"{h['p50']:>6.2f}s  {h['p95']:>6.2f}s  {h['max']:>6.2f}s"
+        )
+
+
+def _print_routing_stages() -> None:
+    counts = routing_stage_counts()
+    total = sum(counts.values())
+    if not total:
+        return
+    parts = [f"{stage} {n} ({n / total:.0%})" for stage, n in sorted(counts.items(), key=lambda kv: -kv[1])]
+    print("[INFO] Routing stages: " + ", ".join(parts))
+    if counts.get("budget"):
+        print(f"[WARN] LLM routing budget spent: {counts['budget']} email(s) sent to needs_review")
+
+
+def _print_prompt_tokens() -> None:
+    tokens = prompt_token_counts()
+    if not tokens["before"]:
+        return
+    saved = 1.0 - tokens["after"] / tokens["before"]
+    print(
+        f"[INFO] Prompt tokens (body): {tokens['before']} -> {tokens['after']} ({saved:.0%} saved), "
+        f"{tokens['truncated']} email(s) truncated to the budget"
+    )
+
+
+def export_metrics() -> None:
+    """Write the run's metrics to AAI_METRICS_JSON and AAI_METRICS_PROM (empty value disables either)."""
+    json_path = os.getenv("AAI_METRICS_JSON", "outputs/metrics.json")
+    prom_path = os.getenv("AAI_METRICS_PROM", "outputs/metrics.prom")
+
+    extra: Dict[str, Any] = {
+        "llm_pool": pool_stats(),
+        "sender_memory": sender_memory_stats(),
+        "routing_stages": routing_stage_counts(),
+        "prompt_tokens": prompt_token_counts(),
+        "llm_routing_budget": routing_budget().stats(),
+    }
+    dedup = near_duplicates()
+    if dedup is not None:
+        extra["near_duplicates"] = dedup.stats()
+    cache = get_llm_cache()
+    if cache is not None:
+        extra["llm_cache"] = cache.stats()
+
+    if json_path:
+        write_json_report(json_path, extra)
+        print(f"[INFO] Metrics report: {json_path}")
+    if prom_path:
+        write_prometheus(prom_path)
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Route and draft replies for an email backlog.")
+    ap.add_argument(
+        "--profile",
+        nargs="?",
+        const="outputs/profile.pstats",
+        metavar="PATH",
+        help="run under cProfile and dump stats to PATH (default: %(const)s)",
+    )
+    return ap.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+    if not args.profile:
+        run()
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(run)
+    finally:
+        os.makedirs(os.path.dirname(args.profile) or ".", exist_ok=True)
+        profiler.dump_stats(args.profile)
+        print(f"[INFO] cProfile stats: {args.profile} (python -m pstats {args.profile})")
+
+
+def run() -> None:
+    data_path = os.getenv("AAI_EMAIL_DATA", "data/sample_emails.json")
+    config_path = os.getenv("AAI_COMPANY_CONFIG", "config/company_config.json")
+    max_revs = int(os.getenv("AAI_MAX_REVISIONS", "3"))
+    concurrency = int(os.getenv("AAI_CONCURRENCY", "4"))
+    workers = int(os.getenv("AAI_WORKERS", "0"))
+    shard_size = int(os.getenv("AAI_SHARD_SIZE", "32"))
+    prefetch = int(os.getenv("AAI_PREFETCH", "2"))
+
+    # Streamed: the first email reaches the graph before the file is fully read
+    emails: Iterator[Dict[str, Any]] = iter_emails(data_path)
+    total = count_emails(data_path)
+    print(f"[INFO] Streaming {f'{total} ' if total is not None else ''}emails from {data_path}")
+    print(f"[INFO] Using company config from {config_path}")
+
+    dept_map = dict(load_company_snapshot(config_path).dept_id_to_name)
+
+    dept_counts: Counter = Counter()
+
+    if is_interactive() and prefetch > 0:
+        print(f"[INFO] Review mode: prefetching {prefetch} email(s) ahead")
+        run_review_prefetch(emails, total, config_path, max_revs, prefetch, dept_counts, dept_map)
+    elif is_interactive():
+        run_serial(build_graph(), emails, total, config_path, max_revs, dept_counts, dept_map)
+    elif workers > 1:
+        print(f"[INFO] Sharded mode: workers={workers} shard_size={shard_size}")
+        run_sharded(emails, total, config_path, max_revs, workers, shard_size, dept_counts, dept_map)
+    else:
+        graph = build_graph()
+        print(f"[INFO] Batch mode: concurrency={concurrency}")
+        asyncio.run(
+            run_batch_async(graph, emails, total, config_path, max_revs, concurrency, dept_counts, dept_map)
+        )
+
+    # Flush buffered tickets (JSONL sink) before reporting
+    close_default_sink()
     print_department_summary(dept_counts, dept_map)
 
+    _print_node_timings()
+    _print_routing_stages()
+    _print_prompt_tokens()
+    export_metrics()
+
+    mem = sender_memory_stats()
+    if mem["lookups"]:
+        # Counted in this process only (pool workers keep their own counters)
+        print(
+            f"[INFO] Sender memory: {mem['hits']}/{mem['lookups']} hits ({mem['hit_rate']:.0%}), "
+            f"{mem['llm_calls_skipped']} LLM routing calls skipped, {mem['learned']} learned"
+        )
+
 
 if __name__ == "__main__":
     main()
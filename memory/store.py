@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import copy
 import json
+import os
+import sqlite3
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional, List
+from typing import Any, Collection, Dict, Optional, List, Tuple, Union
 
 
 ALLOWED_DEPARTMENTS = {"Sales", "Support", "Finance", "NeedsReview"}
@@ -36,19 +41,25 @@ def _safe_key(s: str) -> str:
     return (s or "").strip().lower()
 
 
+def _default_memory() -> Dict[str, Any]:
+    # Deep copy: callers mutate nested dicts, which must never leak into DEFAULT_MEMORY
+    return copy.deepcopy(DEFAULT_MEMORY)
+
+
 def load_memory(path: str) -> Dict[str, Any]:
     p = Path(path)
     if not p.exists():
         p.parent.mkdir(parents=True, exist_ok=True)
-        save_memory(path, DEFAULT_MEMORY.copy())
-        return DEFAULT_MEMORY.copy()
+        data = _default_memory()
+        save_memory(path, data)
+        return data
 
     try:
         data = json.loads(p.read_text(encoding="utf-8"))
 
         for k, v in DEFAULT_MEMORY.items():
             if k not in data:
-                data[k] = v
+                data[k] = copy.deepcopy(v)
 
         # defensive types
         if not isinstance(data.get("sender_department"), dict):
@@ -56,47 +67,322 @@ def load_memory(path: str) -> Dict[str, Any]:
         if not isinstance(data.get("sender_owner"), dict):
             data["sender_owner"] = {}
         if not isinstance(data.get("department_tone"), dict):
-            data["department_tone"] = DEFAULT_MEMORY["department_tone"].copy()
+            data["department_tone"] = copy.deepcopy(DEFAULT_MEMORY["department_tone"])
         if not isinstance(data.get("department_owners"), dict):
-            data["department_owners"] = DEFAULT_MEMORY["department_owners"].copy()
+            data["department_owners"] = copy.deepcopy(DEFAULT_MEMORY["department_owners"])
         if not isinstance(data.get("rr_index"), dict):
             data["rr_index"] = {d: 0 for d in ALLOWED_DEPARTMENTS}
         if not isinstance(data.get("employees"), dict):
-            data["employees"] = DEFAULT_MEMORY["employees"].copy()
+            data["employees"] = copy.deepcopy(DEFAULT_MEMORY["employees"])
 
         # ensure rr keys exist
         for d in ALLOWED_DEPARTMENTS:
             data["rr_index"].setdefault(d, 0)
-            data["department_owners"].setdefault(d, DEFAULT_MEMORY["department_owners"].get(d, []))
+            data["department_owners"].setdefault(d, list(DEFAULT_MEMORY["department_owners"].get(d, [])))
 
         return data
     except Exception:
-        save_memory(path, DEFAULT_MEMORY.copy())
-        return DEFAULT_MEMORY.copy()
+        data = _default_memory()
+        save_memory(path, data)
+        return data
 
 
-def save_memory(path: str, memory: Dict[str, Any]) -> None:
+def save_memory(path: str, memory: Union[Dict[str, Any], "MemoryStore"]) -> None:
+    """
+    Persist a memory dict as JSON (whole-file rewrite, atomic via rename).
+    A `MemoryStore` persists every update as it happens, so saving one is a no-op.
+    """
+    if isinstance(memory, MemoryStore):
+        return
     p = Path(path)
     p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(json.dumps(memory, indent=2, ensure_ascii=False), encoding="utf-8")
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_text(json.dumps(memory, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+# ----------------------------
+# SQLite-backed store
+# ----------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sender_department (
+    sender TEXT PRIMARY KEY,
+    department TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 1,
+    reviewed INTEGER NOT NULL DEFAULT 0,
+    source TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sender_owner (
+    sender TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rr_index (
+    department TEXT PRIMARY KEY,
+    idx INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Small, rarely-changing sections kept as JSON blobs in `kv`
+_KV_SECTIONS = ("department_tone", "department_owners", "employees")
+
+
+class MemoryStore:
+    """
+    Sender memory in SQLite: every update is a single-row upsert instead of a
+    rewrite of the whole memory file, and lookups only read the row they need.
+
+    Round-robin counters are advanced inside a write transaction, so several
+    processes sharing one database never hand out the same slot twice. The
+    tone/owner/employee sections are small and cached after the first read.
+    A legacy JSON memory file is imported once when the database is created.
+    """
+
+    def __init__(self, path: str, legacy_json: Optional[str] = None):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+        self._sections: Dict[str, Any] = {}
+        self._init_sections(legacy_json)
+
+    def _migrate(self) -> None:
+        cols = {r[1] for r in self._conn.execute("PRAGMA table_info(sender_department)")}
+        if "source" not in cols:
+            self._conn.execute("ALTER TABLE sender_department ADD COLUMN source TEXT")
+        if "reviewed" not in cols:
+            self._conn.execute("ALTER TABLE sender_department ADD COLUMN reviewed INTEGER NOT NULL DEFAULT 0")
+
+    def _init_sections(self, legacy_json: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._conn.execute("SELECT 1 FROM kv WHERE key = 'department_tone'").fetchone() is None:
+                    data = _default_memory()
+                    if legacy_json and Path(legacy_json).exists():
+                        data = load_memory(legacy_json)
+                    self._import_locked(data)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _import_locked(self, data: Dict[str, Any]) -> None:
+        now = time.time()
+        for key in _KV_SECTIONS:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv(key, value) VALUES (?, ?)",
+                (key, json.dumps(data.get(key, DEFAULT_MEMORY[key]), ensure_ascii=False)),
+            )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO sender_department(sender, department, hits, updated_at) VALUES (?, ?, 1, ?)",
+            # Legacy names ("Sales") are stored as lowercase department ids ("sales"), like the graph writes them
+            [(_safe_key(k), v.strip().lower(), now) for k, v in (data.get("sender_department") or {}).items()
+             if match_department(v, ALLOWED_DEPARTMENTS)],
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO sender_owner(sender, owner, updated_at) VALUES (?, ?, ?)",
+            [(_safe_key(k), _safe_key(v), now) for k, v in (data.get("sender_owner") or {}).items() if isinstance(v, str)],
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO rr_index(department, idx) VALUES (?, ?)",
+            [(d, int(i)) for d, i in (data.get("rr_index") or {}).items() if str(i).isdigit()],
+        )
+
+    def section(self, key: str) -> Dict[str, Any]:
+        """One of the small config-like sections (department_tone, department_owners, employees)."""
+        if key not in self._sections:
+            with self._lock:
+                row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = json.loads(row[0]) if row else copy.deepcopy(DEFAULT_MEMORY.get(key, {}))
+            self._sections[key] = value if isinstance(value, dict) else {}
+        return self._sections[key]
+
+    def set_section(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv(key, value) VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False))
+            )
+        self._sections[key] = value
+
+    def get_sender_department(self, sender: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT department FROM sender_department WHERE sender = ?", (_safe_key(sender),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def sender_department_hits(self, sender: str) -> int:
+        """How many times this sender's current department has been recorded."""
+        prior = self.sender_prior(sender)
+        return prior[1] if prior else 0
+
+    def sender_prior(self, sender: str) -> Optional[Tuple[str, int, int, Optional[str]]]:
+        """
+        (department, hits, reviewed, source) for a sender: `reviewed` counts the
+        hits a human approved, `source` is the routing stage it was learned from.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT department, hits, reviewed, source FROM sender_department WHERE sender = ?", (_safe_key(sender),)
+            ).fetchone()
+        return (row[0], int(row[1]), int(row[2]), row[3]) if row else None
+
+    def set_sender_department(
+        self, sender: str, department: str, source: Optional[str] = None, reviewed: bool = False
+    ) -> None:
+        with self._lock:
+            # Re-recording the same department strengthens it; a new department starts over.
+            # An unreviewed result never replaces a department a human has approved.
+            self._conn.execute(
+                "INSERT INTO sender_department(sender, department, hits, reviewed, source, updated_at) "
+                "VALUES (?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT(sender) DO UPDATE SET "
+                "hits = CASE WHEN department = excluded.department COLLATE NOCASE THEN hits + 1 ELSE 1 END, "
+                "reviewed = CASE WHEN department = excluded.department COLLATE NOCASE "
+                "THEN reviewed + excluded.reviewed ELSE excluded.reviewed END, "
+                "source = CASE WHEN department = excluded.department COLLATE NOCASE "
+                "THEN COALESCE(source, excluded.source) ELSE excluded.source END, "
+                "department = excluded.department, updated_at = excluded.updated_at "
+                "WHERE department = excluded.department COLLATE NOCASE OR excluded.reviewed > 0 OR reviewed = 0",
+                (_safe_key(sender), department, int(reviewed), source, time.time()),
+            )
+
+    def get_sender_owner(self, sender: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT owner FROM sender_owner WHERE sender = ?", (_safe_key(sender),)).fetchone()
+        return row[0] if row else None
+
+    def set_sender_owner(self, sender: str, owner_email: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sender_owner(sender, owner, updated_at) VALUES (?, ?, ?)",
+                (_safe_key(sender), _safe_key(owner_email), time.time()),
+            )
+
+    def next_rr_index(self, department: str, modulo: int) -> int:
+        """Atomically return the current round-robin slot for `department` and advance it."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT idx FROM rr_index WHERE department = ?", (department,)).fetchone()
+                idx = int(row[0]) if row else 0
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rr_index(department, idx) VALUES (?, ?)",
+                    (department, (idx + 1) % modulo),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return idx
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            (depts,) = self._conn.execute("SELECT COUNT(*) FROM sender_department").fetchone()
+            (owners,) = self._conn.execute("SELECT COUNT(*) FROM sender_owner").fetchone()
+        return {"sender_department": int(depts), "sender_owner": int(owners)}
+
+    def export(self) -> Dict[str, Any]:
+        """The whole memory as a plain dict in the legacy JSON layout."""
+        with self._lock:
+            depts = dict(self._conn.execute("SELECT sender, department FROM sender_department").fetchall())
+            owners = dict(self._conn.execute("SELECT sender, owner FROM sender_owner").fetchall())
+            rr = dict(self._conn.execute("SELECT department, idx FROM rr_index").fetchall())
+        out = {"sender_department": depts, "sender_owner": owners, "rr_index": rr}
+        for key in _KV_SECTIONS:
+            out[key] = copy.deepcopy(self.section(key))
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # Read-only dict-style access, so code written against the JSON dict keeps working
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _KV_SECTIONS:
+            return self.section(key)
+        return default
+
+
+_stores_lock = threading.Lock()
+_stores: Dict[tuple, MemoryStore] = {}
+
+
+def open_memory_store(path: str) -> MemoryStore:
+    """
+    Shared `MemoryStore` for `path`, one per process.
+
+    A ".json" path is treated as the legacy memory file: the database lives
+    next to it (same name, ".sqlite" suffix) and is seeded from it once.
+    """
+    p = Path(path)
+    legacy = str(p) if p.suffix.lower() == ".json" else None
+    db = str(p.with_suffix(".sqlite")) if legacy else str(p)
+
+    key = (os.path.abspath(db), os.getpid())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = MemoryStore(db, legacy_json=legacy)
+        return store
 
 
 # ----------------------------
 # Sender -> Department memory
 # ----------------------------
 
-def get_sender_department(memory: Dict[str, Any], sender: str) -> Optional[str]:
-    key = _safe_key(sender)
-    dept = (memory.get("sender_department") or {}).get(key)
-    if dept in ALLOWED_DEPARTMENTS:
-        return dept
-    return None
+Memory = Union[Dict[str, Any], MemoryStore]
 
 
-def set_sender_department(memory: Dict[str, Any], sender: str, department: str) -> None:
+def match_department(department: Any, allowed: Collection[str]) -> Optional[str]:
+    """The entry of `allowed` that `department` names, compared case-insensitively ("Sales" -> "sales")."""
+    if not isinstance(department, str) or not department.strip():
+        return None
+    if department in allowed:
+        return department
+    wanted = department.strip().lower()
+    return next((a for a in allowed if a.lower() == wanted), None)
+
+
+def get_sender_department(
+    memory: Memory,
+    sender: str,
+    allowed: Optional[Collection[str]] = None,
+) -> Optional[str]:
+    """Remembered department for `sender`; `allowed` defaults to ALLOWED_DEPARTMENTS (e.g. pass config dept ids)."""
     key = _safe_key(sender)
-    dept = (department or "").strip()
-    if not key or dept not in ALLOWED_DEPARTMENTS:
+    if isinstance(memory, MemoryStore):
+        dept = memory.get_sender_department(key)
+    else:
+        dept = (memory.get("sender_department") or {}).get(key)
+    return match_department(dept, ALLOWED_DEPARTMENTS if allowed is None else allowed)
+
+
+def set_sender_department(
+    memory: Memory,
+    sender: str,
+    department: str,
+    allowed: Optional[Collection[str]] = None,
+    source: Optional[str] = None,
+    reviewed: bool = False,
+) -> None:
+    key = _safe_key(sender)
+    dept = match_department(department, ALLOWED_DEPARTMENTS if allowed is None else allowed)
+    if not key or dept is None:
+        return
+    if isinstance(memory, MemoryStore):
+        memory.set_sender_department(key, dept, source=source, reviewed=reviewed)
         return
     memory.setdefault("sender_department", {})
     memory["sender_department"][key] = dept
@@ -106,19 +392,25 @@ def set_sender_department(memory: Dict[str, Any], sender: str, department: str)
 # Sender -> Owner memory
 # ----------------------------
 
-def get_sender_owner(memory: Dict[str, Any], sender: str) -> Optional[str]:
+def get_sender_owner(memory: Memory, sender: str) -> Optional[str]:
     key = _safe_key(sender)
-    owner = (memory.get("sender_owner") or {}).get(key)
+    if isinstance(memory, MemoryStore):
+        owner = memory.get_sender_owner(key)
+    else:
+        owner = (memory.get("sender_owner") or {}).get(key)
     if isinstance(owner, str) and owner.strip():
         return owner.strip().lower()
     return None
 
 
-def set_sender_owner(memory: Dict[str, Any], sender: str, owner_email: str) -> None:
+def set_sender_owner(memory: Memory, sender: str, owner_email: str) -> None:
     key = _safe_key(sender)
     owner = _safe_key(owner_email)
     if not key or not owner:
         return
+    if isinstance(memory, MemoryStore):
+        memory.set_sender_owner(key, owner)
+        return
     memory.setdefault("sender_owner", {})
     memory["sender_owner"][key] = owner
 
@@ -127,7 +419,7 @@ def set_sender_owner(memory: Dict[str, Any], sender: str, owner_email: str) -> N
 # Tone by department
 # ----------------------------
 
-def get_department_tone(memory: Dict[str, Any], department: str) -> Optional[str]:
+def get_department_tone(memory: Memory, department: str) -> Optional[str]:
     tone = (memory.get("department_tone") or {}).get(department)
     if isinstance(tone, str) and tone.strip():
         return tone.strip()
@@ -138,18 +430,21 @@ def get_department_tone(memory: Dict[str, Any], department: str) -> Optional[str
 # Owners + signatures
 # ----------------------------
 
-def get_department_owners(memory: Dict[str, Any], department: str) -> List[str]:
+def get_department_owners(memory: Memory, department: str) -> List[str]:
     owners = (memory.get("department_owners") or {}).get(department, [])
     if not isinstance(owners, list):
         return []
     return [_safe_key(x) for x in owners if isinstance(x, str) and x.strip()]
 
 
-def choose_owner_round_robin(memory: Dict[str, Any], department: str) -> Optional[str]:
+def choose_owner_round_robin(memory: Memory, department: str) -> Optional[str]:
     owners = get_department_owners(memory, department)
     if not owners:
         return None
 
+    if isinstance(memory, MemoryStore):
+        return owners[memory.next_rr_index(department, len(owners)) % len(owners)]
+
     rr = memory.setdefault("rr_index", {})
     idx = int(rr.get(department, 0)) if str(rr.get(department, "0")).isdigit() else 0
     owner = owners[idx % len(owners)]
@@ -157,7 +452,7 @@ def choose_owner_round_robin(memory: Dict[str, Any], department: str) -> Optiona
     return owner
 
 
-def employee_signature(memory: Dict[str, Any], owner_email: str) -> Optional[str]:
+def employee_signature(memory: Memory, owner_email: str) -> Optional[str]:
     owner = _safe_key(owner_email)
     emp = (memory.get("employees") or {}).get(owner)
     if isinstance(emp, dict):
@@ -167,6 +462,6 @@ def employee_signature(memory: Dict[str, Any], owner_email: str) -> Optional[str
     return None
 
 
-def employee_exists(memory: Dict[str, Any], owner_email: str) -> bool:
+def employee_exists(memory: Memory, owner_email: str) -> bool:
     owner = _safe_key(owner_email)
     return owner in (memory.get("employees") or {})
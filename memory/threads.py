@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from email.utils import parseaddr
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ingestion.preprocess import preprocess_email
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    subject_key TEXT,
+    department_id TEXT,
+    owner_email TEXT,
+    summary TEXT NOT NULL DEFAULT '',
+    messages INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_threads_subject ON threads(subject_key, updated_at);
+CREATE TABLE IF NOT EXISTS thread_messages (
+    message_id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL
+);
+"""
+
+_MSGID_RE = re.compile(r"<([^<>\s]+)>")
+_REPLY_PREFIX_RE = re.compile(r"^\s*((re|fw|fwd|aw|wg|sv|vs|antw|tr)\s*(\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+# Outermost prefix only: "Re: Fwd: ..." is a reply, "Fwd: Re: ..." a forward
+_RE_PREFIX_RE = re.compile(r"^\s*(re|aw|sv|vs|antw)\s*(\[\d+\])?\s*:", re.IGNORECASE)
+_FWD_PREFIX_RE = re.compile(r"^\s*(fw|fwd|wg|tr)\s*(\[\d+\])?\s*:", re.IGNORECASE)
+_QUOTED_LINE_RE = re.compile(r"^\s*>.*$\n?", re.MULTILINE)
+_QUOTE_HEADER_RE = re.compile(r"^\s*On\b.*\bwrote:\s*$", re.MULTILINE | re.IGNORECASE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+# ----------------------------
+# Email helpers
+# ----------------------------
+
+def _message_ids(value: Any) -> List[str]:
+    s = str(value or "")
+    ids = _MSGID_RE.findall(s)
+    if not ids and s.strip():
+        ids = s.split()
+    return [i.strip("<>").strip().lower() for i in ids if i.strip("<>").strip()]
+
+
+def message_id(email: Dict[str, Any]) -> str:
+    ids = _message_ids(email.get("message_id"))
+    return ids[0] if ids else ""
+
+
+def parent_ids(email: Dict[str, Any]) -> List[str]:
+    """In-Reply-To first, then References newest-first (the order that finds the thread fastest)."""
+    out: List[str] = []
+    for mid in _message_ids(email.get("in_reply_to")) + list(reversed(_message_ids(email.get("references")))):
+        if mid not in out:
+            out.append(mid)
+    return out
+
+
+def is_forward(email: Dict[str, Any]) -> bool:
+    return bool(_FWD_PREFIX_RE.match(str(email.get("subject") or "")))
+
+
+def is_reply(email: Dict[str, Any]) -> bool:
+    """A forward usually goes to someone new, so it starts its own thread even when it carries References."""
+    if is_forward(email):
+        return False
+    return bool(parent_ids(email)) or bool(_RE_PREFIX_RE.match(str(email.get("subject") or "")))
+
+
+def subject_key(email: Dict[str, Any]) -> str:
+    """
+    Normalized subject (reply/forward prefixes stripped) scoped to the exact
+    sender address: two customers on one domain (gmail.com) never share a key.
+    """
+    subject = _REPLY_PREFIX_RE.sub("", str(email.get("subject") or ""))
+    subject = " ".join(subject.lower().split())
+    sender = parseaddr(str(email.get("from") or email.get("sender") or ""))[1].lower()
+    if not subject or not sender:
+        return ""
+    return f"{sender}|{subject}"
+
+
+def new_text(email: Dict[str, Any]) -> str:
+    """The message's own text: quoted ("> ...") lines, quoted replies and the signature removed."""
+    body = _QUOTED_LINE_RE.sub("", str(email.get("body") or email.get("text") or ""))
+    # Once the quotes are gone, the "On ... wrote:" header is usually the last line
+    m = _QUOTE_HEADER_RE.search(body)
+    if m:
+        body = body[: m.start()]
+    return preprocess_email({"body": body})["body"]
+
+
+def _gist(text: str, limit: int = 240) -> str:
+    """First sentence or two of `text`, on one line."""
+    flat = " ".join(str(text or "").split())
+    out = ""
+    for sentence in _SENTENCE_RE.split(flat):
+        if out and len(out) + len(sentence) + 1 > limit:
+            break
+        out = f"{out} {sentence}".strip()
+    return out[:limit]
+
+
+# ----------------------------
+# Store
+# ----------------------------
+
+class ThreadIndex:
+    """
+    Conversation index in SQLite: Message-ID -> thread, plus per thread the
+    routing decision, owner and a rolling extractive summary.
+
+    A message joins a thread through In-Reply-To / References; a "Re:" reply
+    whose headers point nowhere known falls back to its normalized subject from
+    the same sender address, within `subject_window_s`. Forwards start new threads.
+    """
+
+    def __init__(self, path: str, summary_chars: int = 1500, subject_window_s: float = 14 * 86400.0):
+        self.path = path
+        self.summary_chars = int(summary_chars)
+        self.subject_window_s = float(subject_window_s)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _thread_locked(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT * FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def _find_locked(self, email: Dict[str, Any], include_self: bool) -> Optional[Dict[str, Any]]:
+        mid = message_id(email)
+        candidates = [mid] if mid and include_self else []
+        if not is_forward(email):
+            candidates += [p for p in parent_ids(email) if p != mid]
+        for candidate in candidates:
+            row = self._conn.execute(
+                "SELECT thread_id FROM thread_messages WHERE message_id = ?", (candidate,)
+            ).fetchone()
+            if row is not None:
+                return self._thread_locked(row[0])
+
+        key = subject_key(email)
+        if key and _RE_PREFIX_RE.match(str(email.get("subject") or "")):
+            row = self._conn.execute(
+                "SELECT * FROM threads WHERE subject_key = ? AND updated_at >= ? ORDER BY updated_at DESC LIMIT 1",
+                (key, time.time() - self.subject_window_s),
+            ).fetchone()
+            if row is not None:
+                return dict(row)
+        return None
+
+    def find(self, email: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        The thread `email` replies to (thread_id, department_id, owner_email,
+        summary, messages), if known. The message's own earlier entry does not
+        count, so reprocessing an email does not turn it into a reply.
+        """
+        with self._lock:
+            return self._find_locked(email, include_self=False)
+
+    def record(
+        self,
+        email: Dict[str, Any],
+        department_id: str,
+        owner_email: str = "",
+        reply: str = "",
+    ) -> str:
+        """
+        Add `email` (and our `reply` to it) to its thread, creating the thread if
+        needed; returns the thread id. The summary keeps one line per message and
+        drops the oldest lines beyond `summary_chars`.
+        """
+        sender = parseaddr(str(email.get("from") or email.get("sender") or ""))[1].lower() or "sender"
+        lines = [f"- {sender}: {_gist(new_text(email))}"]
+        if reply:
+            lines.append(f"- {owner_email or 'us'}: {_gist(reply)}")
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                thread = self._find_locked(email, include_self=True)
+                if thread is None:
+                    thread_id = message_id(email) or uuid.uuid4().hex
+                    summary = ""
+                    messages = 0
+                else:
+                    thread_id = thread["thread_id"]
+                    summary = thread["summary"] or ""
+                    messages = int(thread["messages"])
+
+                summary = "\n".join(x for x in [summary] + lines if x)
+                while len(summary) > self.summary_chars and "\n" in summary:
+                    summary = summary.split("\n", 1)[1]
+
+                self._conn.execute(
+                    "INSERT INTO threads(thread_id, subject_key, department_id, owner_email, summary, messages, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(thread_id) DO UPDATE SET subject_key = excluded.subject_key, "
+                    "department_id = excluded.department_id, owner_email = excluded.owner_email, "
+                    "summary = excluded.summary, messages = excluded.messages, updated_at = excluded.updated_at",
+                    (thread_id, subject_key(email), department_id, owner_email, summary, messages + 1, now),
+                )
+                ids = [i for i in [message_id(email)] + parent_ids(email) if i]
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO thread_messages(message_id, thread_id) VALUES (?, ?)",
+                    [(i, thread_id) for i in ids],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return thread_id
+
+    def counts(self) -> Tuple[int, int]:
+        """(threads, known message ids)."""
+        with self._lock:
+            (threads,) = self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()
+            (messages,) = self._conn.execute("SELECT COUNT(*) FROM thread_messages").fetchone()
+        return int(threads), int(messages)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_indexes_lock = threading.Lock()
+_indexes: Dict[Tuple[str, int], ThreadIndex] = {}
+
+
+def open_thread_index(path: str, **kwargs: Any) -> ThreadIndex:
+    """Shared `ThreadIndex` for `path`, one per process."""
+    key = (os.path.abspath(path), os.getpid())
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = ThreadIndex(path, **kwargs)
+        return index
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from email.utils import getaddresses
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+
+# Header fields checked for recipients, in priority order. Each entry lists the
+# dict keys that may carry that header.
+_RECIPIENT_FIELDS = (
+    ("to", "recipient", "email_to"),
+    ("cc",),
+    ("delivered_to", "delivered-to"),
+)
+
+
+def normalize_address(addr: Any) -> str:
+    """
+    Lowercase an address and strip plus-addressing ("sales+eu@x.com" -> "sales@x.com").
+    Returns "" for anything that does not look like local@domain.
+    """
+    a = str(addr or "").strip().strip("<>").strip().lower()
+    local, sep, domain = a.rpartition("@")
+    if not sep or not local or not domain:
+        return ""
+    local = local.split("+", 1)[0]
+    return f"{local}@{domain}" if local else ""
+
+
+def _field_values(email: Mapping[str, Any], keys: Iterable[str]) -> List[str]:
+    out: List[str] = []
+    for k in keys:
+        val = email.get(k)
+        if not val:
+            continue
+        if isinstance(val, (list, tuple)):
+            out.extend(str(x) for x in val if x)
+        else:
+            out.append(str(val))
+    return out
+
+
+def recipient_addresses(email: Mapping[str, Any]) -> List[str]:
+    """Normalized, de-duplicated recipient addresses: To first, then Cc, then Delivered-To."""
+    seen = set()
+    out: List[str] = []
+    for keys in _RECIPIENT_FIELDS:
+        for _, addr in getaddresses(_field_values(email, keys)):
+            norm = normalize_address(addr)
+            if norm and norm not in seen:
+                seen.add(norm)
+                out.append(norm)
+    return out
+
+
+class AliasIndex:
+    """
+    Hash index over inbox aliases.
+
+    Exact aliases are keyed by normalized address. An alias written as
+    "*@support.example.com" (or "@support.example.com") matches every address
+    in that domain; exact aliases always win over domain wildcards.
+    """
+
+    def __init__(self, aliases: Mapping[str, str]):
+        self.exact: Dict[str, str] = {}
+        self.domains: Dict[str, str] = {}
+
+        for addr, dep_id in aliases.items():
+            a = str(addr).strip().lower()
+            dep = str(dep_id).strip().lower()
+            if not a or not dep:
+                continue
+            if a.startswith("*@") or a.startswith("@"):
+                domain = a.split("@", 1)[1]
+                if domain:
+                    self.domains.setdefault(domain, dep)
+                continue
+            norm = normalize_address(a)
+            if norm:
+                self.exact.setdefault(norm, dep)
+
+    def __len__(self) -> int:
+        return len(self.exact) + len(self.domains)
+
+    def lookup(self, addresses: Iterable[str]) -> Optional[str]:
+        """Department for the first recipient with an exact alias, else the first domain match."""
+        addresses = list(addresses)
+        for a in addresses:
+            dep = self.exact.get(a)
+            if dep:
+                return dep
+        if self.domains:
+            for a in addresses:
+                dep = self.domains.get(a.rpartition("@")[2])
+                if dep:
+                    return dep
+        return None
+
+    def route(self, email: Mapping[str, Any]) -> Optional[str]:
+        if not self:
+            return None
+        return self.lookup(recipient_addresses(email))
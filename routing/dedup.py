@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ingestion.preprocess import preprocess_email
+
+
+NUM_PERM = 64
+BANDS = 16  # LSH: 16 bands of 4 rows; pairs at Jaccard 0.8 become candidates with p > 0.999
+SHINGLE = 2
+MIN_TOKENS = 8
+
+_TOKEN_RE = re.compile(r"\w+")
+_DIGITS_RE = re.compile(r"\d+")
+
+# Multiply-shift hash family (odd multipliers, arithmetic mod 2^64), fixed so signatures are stable
+_rng = np.random.default_rng(0x5EED)
+_MULT = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_ADD = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+
+
+# ----------------------------
+# Fingerprints
+# ----------------------------
+
+def fingerprint_text(email: Dict[str, Any]) -> str:
+    """Subject + cleaned body (quotes and signatures removed), digits masked so alert counters and ids do not matter."""
+    clean = preprocess_email(email)
+    return _DIGITS_RE.sub("0", f"{clean['subject']}\n{clean['body']}".lower())
+
+
+def content_digest(email: Dict[str, Any]) -> str:
+    """Digest of the sender plus the exact cleaned subject and body (nothing masked)."""
+    clean = preprocess_email(email)
+    key = f"{clean['from'].lower()}\n{clean['subject']}\n{clean['body']}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def minhash(text: str) -> Optional[bytes]:
+    """
+    MinHash signature (NUM_PERM x uint32) over word bigrams, or None for texts
+    under MIN_TOKENS words (too short to tell a duplicate from a coincidence).
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if len(tokens) < MIN_TOKENS:
+        return None
+
+    shingles = {" ".join(tokens[i : i + SHINGLE]) for i in range(len(tokens) - SHINGLE + 1)}
+    base = np.frombuffer(
+        b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in shingles), dtype=np.uint64
+    )
+    with np.errstate(over="ignore"):
+        hashed = (base[:, None] * _MULT[None, :] + _ADD[None, :]) >> np.uint64(32)
+    return hashed.min(axis=0).astype(np.uint32).tobytes()
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(np.frombuffer(a, dtype=np.uint32) == np.frombuffer(b, dtype=np.uint32)))
+
+
+def _band_keys(sig: bytes) -> List[Tuple[int, bytes]]:
+    width = len(sig) // BANDS
+    return [(i, sig[i * width : (i + 1) * width]) for i in range(BANDS)]
+
+
+# ----------------------------
+# Index
+# ----------------------------
+
+class _Cluster:
+    __slots__ = ("signature", "representative", "payload", "created", "hits")
+
+    def __init__(self, signature: bytes, representative: str, payload: Dict[str, Any], created: float):
+        self.signature = signature
+        self.representative = representative
+        self.payload = payload
+        self.created = created
+        self.hits = 0
+
+
+class NearDuplicateIndex:
+    """
+    Recent MinHash signatures with the outcome of their cluster representative.
+
+    `match()` returns the most similar live representative whose estimated
+    Jaccard similarity reaches `threshold`. Signatures are bucketed by LSH band,
+    so only emails sharing a band are compared. Clusters expire `window_s`
+    after the representative was added and at most `max_entries` are kept
+    (oldest dropped first).
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        window_s: float = 3600.0,
+        max_entries: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.threshold = float(threshold)
+        self.window_s = float(window_s)
+        self.max_entries = max(1, int(max_entries))
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._clusters: "OrderedDict[int, _Cluster]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+
+        self.lookups = 0
+        self.hits = 0
+
+    def _expire(self, now: float) -> None:
+        # caller holds _lock
+        while self._clusters:
+            cid, cluster = next(iter(self._clusters.items()))
+            if now - cluster.created < self.window_s and len(self._clusters) <= self.max_entries:
+                break
+            self._clusters.popitem(last=False)
+            for key in _band_keys(cluster.signature):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.remove(cid)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def _closest(self, sig: bytes) -> Optional[Tuple[float, int]]:
+        # caller holds _lock
+        seen = set()
+        best: Optional[Tuple[float, int]] = None
+        for key in _band_keys(sig):
+            for cid in self._buckets.get(key, ()):
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                sim = similarity(sig, self._clusters[cid].signature)
+                if sim >= self.threshold and (best is None or sim > best[0]):
+                    best = (sim, cid)
+        return best
+
+    def match(self, sig: bytes) -> Optional[Tuple[str, Dict[str, Any], float]]:
+        """(representative id, payload, similarity) of the closest live cluster, if any."""
+        with self._lock:
+            self.lookups += 1
+            self._expire(self._clock())
+            best = self._closest(sig)
+            if best is None:
+                return None
+            cluster = self._clusters[best[1]]
+            cluster.hits += 1
+            self.hits += 1
+            return cluster.representative, dict(cluster.payload), best[0]
+
+    def add(self, sig: bytes, representative: str, payload: Dict[str, Any]) -> None:
+        """Start a cluster at `sig` (a no-op if a similar cluster is already live)."""
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            if self._closest(sig) is not None:
+                return
+            self._seq += 1
+            self._clusters[self._seq] = _Cluster(sig, representative, dict(payload), now)
+            for key in _band_keys(sig):
+                self._buckets.setdefault(key, []).append(self._seq)
+            self._expire(now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "clusters": len(self._clusters),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": (self.hits / self.lookups) if self.lookups else 0.0,
+            }
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over grouped keywords (e.g. department -> keywords).
+
+    The automaton is built once; `counts()` scans a text a single time and
+    returns, per group, how many of that group's keywords occur in it. A keyword
+    counts once no matter how often it appears, which matches the
+    `sum(kw in text for kw in keywords)` semantics used elsewhere in the repo.
+
+    Matching is case-insensitive. With `word_boundary=True` a keyword only
+    matches if it is not glued to other word characters (regex `\\b` semantics:
+    the check is only applied at keyword edges that are themselves word chars).
+    """
+
+    def __init__(self, groups: Iterable[Tuple[str, Iterable[str]]], word_boundary: bool = False):
+        self.word_boundary = word_boundary
+        self.groups: Tuple[str, ...] = ()
+
+        group_names: List[str] = []
+        group_index: Dict[str, int] = {}
+
+        # pattern id -> (length, first char is word, last char is word, group indexes)
+        self._patterns: List[Tuple[int, bool, bool, List[int]]] = []
+        pattern_ids: Dict[str, int] = {}
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        own_out: List[List[int]] = [[]]
+
+        for group, keywords in groups:
+            if group not in group_index:
+                group_index[group] = len(group_names)
+                group_names.append(group)
+            g = group_index[group]
+
+            for kw in keywords:
+                kw = str(kw).strip().lower()
+                if not kw:
+                    continue
+
+                pid = pattern_ids.get(kw)
+                if pid is not None:
+                    # Same keyword listed again (possibly for another group): count it for each entry
+                    self._patterns[pid][3].append(g)
+                    continue
+
+                pid = len(self._patterns)
+                pattern_ids[kw] = pid
+                self._patterns.append((len(kw), _is_word_char(kw[0]), _is_word_char(kw[-1]), [g]))
+
+                node = 0
+                for ch in kw:
+                    nxt = self._goto[node].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[node][ch] = nxt
+                        self._goto.append({})
+                        self._fail.append(0)
+                        own_out.append([])
+                    node = nxt
+                own_out[node].append(pid)
+
+        self.groups = tuple(group_names)
+        self._alphabet: Set[str] = set()
+        for trans in self._goto:
+            self._alphabet.update(trans)
+
+        self._build_failure_links(own_out)
+
+    def _build_failure_links(self, own_out: List[List[int]]) -> None:
+        self._out = [tuple(o) for o in own_out]
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+
+                # Inherit every pattern that ends at the failure state (suffix matches)
+                if self._out[self._fail[nxt]]:
+                    self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def _boundary_ok(self, text: str, end: int, pid: int) -> bool:
+        length, starts_word, ends_word, _ = self._patterns[pid]
+        start = end - length + 1
+        if starts_word and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if ends_word and end + 1 < len(text) and _is_word_char(text[end + 1]):
+            return False
+        return True
+
+    def matched_patterns(self, text: str) -> Set[int]:
+        """Return the ids of all distinct keywords found in `text` (single pass)."""
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        alphabet = self._alphabet
+        check_boundary = self.word_boundary
+        remaining = len(self._patterns)
+
+        found: Set[int] = set()
+        state = 0
+        for pos, ch in enumerate(text):
+            if ch not in alphabet:
+                # No keyword contains this character, so no match can span it
+                state = 0
+                continue
+
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+
+            for pid in out[state]:
+                if pid in found:
+                    continue
+                if check_boundary and not self._boundary_ok(text, pos, pid):
+                    continue
+                found.add(pid)
+                remaining -= 1
+
+            if not remaining:
+                break
+
+        return found
+
+    def counts(self, text: str) -> Dict[str, int]:
+        """Per-group count of distinct keywords found in `text` (groups without hits are omitted)."""
+        hits = [0] * len(self.groups)
+        for pid in self.matched_patterns(text):
+            for g in self._patterns[pid][3]:
+                hits[g] += 1
+        return {self.groups[g]: n for g, n in enumerate(hits) if n}
+
+    def best(self, text: str) -> Optional[Tuple[str, int]]:
+        """
+        Group with the most keyword hits, or None if nothing matched.
+        Ties go to the group that was listed first.
+        """
+        counts = self.counts(text)
+        if not counts:
+            return None
+        top = max(counts.values())
+        for group in self.groups:
+            if counts.get(group) == top:
+                return group, top
+        return None
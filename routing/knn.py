@@ -0,0 +1,553 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:  # cross-process append lock; other platforms only get the in-process lock
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+
+DEFAULT_DIM = 512
+DEFAULT_K = 15
+DEFAULT_MIN_SIMILARITY = 0.2
+MAX_TEXT_CHARS = 4000
+
+_INITIAL_CAPACITY = 1024
+_QUERY_CHUNK = 65536
+_CALIBRATION_BINS = 10
+# Automatic recalibration: first at this many rows, then whenever the index has doubled
+_AUTO_CALIBRATE_ROWS = 50
+_AUTO_CALIBRATE_SAMPLE = 500
+
+_TOKEN_RE = re.compile(r"[a-z0-9]{2,}")
+
+# Departments that carry no routing signal
+_SKIP_LABELS = {"", "needs_review", "needsreview"}
+
+
+# ----------------------------
+# Features
+# ----------------------------
+
+def email_text(email: Dict[str, Any]) -> str:
+    return f"{email.get('subject') or ''}\n{email.get('body') or email.get('text') or email.get('raw_body') or ''}"
+
+
+def hash_features(text: str, dim: int = DEFAULT_DIM) -> np.ndarray:
+    """
+    Signed hashed term frequencies (words and word bigrams) with sublinear scaling.
+
+    crc32 is used instead of hash(): it is stable across processes, so an index
+    built by one run is readable by the next.
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    words = _TOKEN_RE.findall(str(text or "")[:MAX_TEXT_CHARS].lower())
+    if not words:
+        return vec
+
+    feats = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    h = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in feats), dtype=np.uint32, count=len(feats))
+    sign = np.where(h & np.uint32(0x80000000), -1.0, 1.0).astype(np.float32)
+    np.add.at(vec, (h % np.uint32(dim)).astype(np.intp), sign)
+    return np.sign(vec) * np.log1p(np.abs(vec))
+
+
+# ----------------------------
+# Index
+# ----------------------------
+
+class KnnIndex:
+    """
+    Hashed TF-IDF vectors of routed emails with their department, for k-nearest-neighbor routing.
+
+    Stored as raw arrays in one directory and memory-mapped, so opening an index
+    of any size is instant and pages are only read when a query touches them:
+
+        meta.json    dim, count, capacity, labels, calibration
+        vectors.f32  (capacity, dim) term frequencies
+        norms.f32    (capacity,) TF-IDF norm of each row
+        labels.i16   (capacity,) index into meta["labels"]
+        df.i32       (dim,) document frequency per hashed feature
+
+    Rows are appended in place (files grow by doubling), so learning one ticket
+    costs one row write. IDF is applied at query time; row norms are recomputed
+    whenever the document count has grown by a quarter since the last refresh,
+    and confidence is recalibrated whenever it has doubled.
+    Appends from several processes are serialized with a file lock, and readers
+    pick up other processes' rows when meta.json changes.
+    """
+
+    def __init__(self, path: str, dim: int = DEFAULT_DIM):
+        self.path = Path(path)
+        self.dim = int(dim)
+        self._lock = threading.RLock()
+        self._meta: Dict[str, Any] = {}
+        self._meta_mtime: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._norms: Optional[np.memmap] = None
+        self._labels: Optional[np.memmap] = None
+        self._df: Optional[np.memmap] = None
+        self._sync()
+
+    # ----------------------------
+    # Storage
+    # ----------------------------
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self._file("meta.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self) -> None:
+        tmp = self._file("meta.json.tmp")
+        tmp.write_text(json.dumps(self._meta), encoding="utf-8")
+        os.replace(tmp, self._file("meta.json"))
+        self._meta_mtime = os.stat(self._file("meta.json")).st_mtime_ns
+
+    def _map(self) -> None:
+        cap = int(self._meta["capacity"])
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(cap, self.dim))
+        self._norms = np.memmap(self._file("norms.f32"), dtype=np.float32, mode="r+", shape=(cap,))
+        self._labels = np.memmap(self._file("labels.i16"), dtype=np.int16, mode="r+", shape=(cap,))
+        self._df = np.memmap(self._file("df.i32"), dtype=np.int32, mode="r+", shape=(self.dim,))
+
+    def _sync(self) -> None:
+        """Reload meta (and remap on growth) if another process changed it."""
+        with self._lock:
+            try:
+                mtime = os.stat(self._file("meta.json")).st_mtime_ns
+            except FileNotFoundError:
+                return
+            if mtime == self._meta_mtime:
+                return
+            meta = self._read_meta()
+            if meta is None:
+                return
+            self.dim = int(meta["dim"])
+            remap = self._vectors is None or meta["capacity"] != self._meta.get("capacity")
+            self._meta = meta
+            self._meta_mtime = mtime
+            if remap:
+                self._map()
+
+    def _create(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._meta = {
+            "version": 1, "dim": self.dim, "count": 0, "capacity": 0,
+            "labels": [], "norms_at": 0, "calibration": None,
+        }
+        self._grow(_INITIAL_CAPACITY)
+        self._file("df.i32").write_bytes(b"\0" * (4 * self.dim))
+        self._map()
+        self._write_meta()
+
+    def _grow(self, capacity: int) -> None:
+        old = int(self._meta.get("capacity") or 0)
+        for name, row_bytes in (("vectors.f32", 4 * self.dim), ("norms.f32", 4), ("labels.i16", 2)):
+            with open(self._file(name), "ab") as fh:
+                fh.truncate(capacity * row_bytes)
+        self._meta["capacity"] = capacity
+        if old:
+            self._map()
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self._file(".lock"), "a") as lock_fh:
+                if fcntl is not None:
+                    fcntl.flock(lock_fh, fcntl.LOCK_EX)
+                try:
+                    self._meta_mtime = None  # re-read whatever other writers appended
+                    self._sync()
+                    if not self._meta:
+                        self._create()
+                    yield
+                    # Shared mappings are coherent through the page cache; no msync per append
+                    self._write_meta()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    def flush(self) -> None:
+        """Write mapped pages to disk (the OS does so lazily otherwise)."""
+        with self._lock:
+            for arr in (self._vectors, self._norms, self._labels, self._df):
+                if arr is not None:
+                    arr.flush()
+
+    # ----------------------------
+    # Writes
+    # ----------------------------
+
+    @property
+    def count(self) -> int:
+        self._sync()
+        return int(self._meta.get("count") or 0)
+
+    @property
+    def labels(self) -> List[str]:
+        self._sync()
+        return list(self._meta.get("labels") or [])
+
+    def _idf(self) -> np.ndarray:
+        n = int(self._meta.get("count") or 0)
+        return (np.log((1.0 + n) / (1.0 + self._df.astype(np.float32))) + 1.0).astype(np.float32)
+
+    def add(self, text: str, label: str) -> bool:
+        return self.add_many([(label, text)]) == 1
+
+    def add_many(self, examples: Iterable[Tuple[str, str]], calibrate: bool = True) -> int:
+        """
+        Append (label, text) examples; returns how many were stored. With
+        `calibrate`, an index that has doubled since its last calibration (or
+        reached _AUTO_CALIBRATE_ROWS uncalibrated) is recalibrated afterwards.
+        """
+        rows: List[np.ndarray] = []
+        names: List[str] = []
+        for label, text in examples:
+            label = str(label or "").strip().lower()
+            vec = hash_features(text, self.dim)
+            if label in _SKIP_LABELS or not vec.any():
+                continue
+            rows.append(vec)
+            names.append(label)
+        if not rows:
+            return 0
+
+        with self._writing():
+            meta = self._meta
+            n = int(meta["count"])
+            if n + len(rows) > int(meta["capacity"]):
+                cap = int(meta["capacity"])
+                while cap < n + len(rows):
+                    cap *= 2
+                self._grow(cap)
+
+            label_ids = {name: i for i, name in enumerate(meta["labels"])}
+            codes = []
+            for name in names:
+                if name not in label_ids:
+                    label_ids[name] = len(meta["labels"])
+                    meta["labels"].append(name)
+                codes.append(label_ids[name])
+
+            block = np.vstack(rows)
+            self._vectors[n : n + len(rows)] = block
+            self._labels[n : n + len(rows)] = np.asarray(codes, dtype=np.int16)
+            self._df += (block != 0).sum(axis=0).astype(np.int32)
+            meta["count"] = n + len(rows)
+
+            idf = self._idf()
+            if meta["count"] >= 1.25 * max(1, int(meta.get("norms_at") or 0)):
+                self._refresh_norms(idf)
+            else:
+                self._norms[n : n + len(rows)] = np.linalg.norm(block * idf, axis=1)
+            cal = meta.get("calibration") or {}
+            stale = meta["count"] >= max(_AUTO_CALIBRATE_ROWS, 2 * int(cal.get("rows") or 0))
+        if calibrate and stale:
+            self.calibrate(sample=_AUTO_CALIBRATE_SAMPLE)
+        return len(rows)
+
+    def _refresh_norms(self, idf: np.ndarray) -> None:
+        n = int(self._meta["count"])
+        for start in range(0, n, _QUERY_CHUNK):
+            stop = min(n, start + _QUERY_CHUNK)
+            self._norms[start:stop] = np.linalg.norm(self._vectors[start:stop] * idf, axis=1)
+        self._meta["norms_at"] = n
+
+    # ----------------------------
+    # Queries
+    # ----------------------------
+
+    def _similarities(self, vec: np.ndarray, n: int, idf: np.ndarray) -> np.ndarray:
+        weighted = vec * idf
+        qnorm = float(np.linalg.norm(weighted))
+        if qnorm == 0.0:
+            return np.zeros(n, dtype=np.float32)
+        q = weighted * idf / qnorm
+        sims = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _QUERY_CHUNK):
+            stop = min(n, start + _QUERY_CHUNK)
+            sims[start:stop] = self._vectors[start:stop] @ q
+        norms = np.asarray(self._norms[:n])
+        return np.divide(sims, norms, out=np.zeros_like(sims), where=norms > 0)
+
+    def _vote(
+        self, sims: np.ndarray, k: int, min_similarity: float, allowed: Optional[Collection[str]]
+    ) -> Optional[Dict[str, Any]]:
+        k = max(1, min(int(k), sims.shape[0]))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[sims[top] >= min_similarity]
+        if top.size == 0:
+            return None
+
+        names = self._meta["labels"]
+        weights: Dict[str, float] = {}
+        support: Dict[str, int] = {}
+        best_sim: Dict[str, float] = {}
+        for i in top:
+            name = names[int(self._labels[i])]
+            if allowed is not None and name not in allowed:
+                continue
+            s = float(sims[i])
+            weights[name] = weights.get(name, 0.0) + s
+            support[name] = support.get(name, 0) + 1
+            best_sim[name] = max(best_sim.get(name, 0.0), s)
+        if not weights:
+            return None
+
+        label = max(weights, key=weights.__getitem__)
+        raw = weights[label] / sum(weights.values()) * best_sim[label]
+        return {"department_id": label, "raw": raw, "support": support[label], "similarity": best_sim[label]}
+
+    def classify(
+        self,
+        text: str,
+        k: int = DEFAULT_K,
+        min_similarity: float = DEFAULT_MIN_SIMILARITY,
+        allowed: Optional[Collection[str]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Similarity-weighted vote of the `k` nearest stored emails.
+
+        Returns department_id, confidence (calibrated when `calibrate()` has run),
+        raw score, support (neighbors voting for the winner) and top similarity,
+        or None when the index is empty or nothing is similar enough.
+        """
+        self._sync()
+        with self._lock:
+            n = int(self._meta.get("count") or 0)
+            if n == 0:
+                return None
+            idf = self._idf()
+            vote = self._vote(self._similarities(hash_features(text, self.dim), n, idf), k, min_similarity, allowed)
+        if vote is not None:
+            vote["confidence"] = self.confidence(vote["raw"])
+        return vote
+
+    # ----------------------------
+    # Calibration
+    # ----------------------------
+
+    def confidence(self, raw: float) -> float:
+        """Raw vote score -> estimated accuracy from the last calibration (raw score while the index is small)."""
+        cal = self._meta.get("calibration")
+        if not cal:
+            return float(raw)
+        b = min(_CALIBRATION_BINS - 1, max(0, int(raw * _CALIBRATION_BINS)))
+        return float(cal["accuracy"][b])
+
+    def calibrate(
+        self, sample: int = 2000, k: int = DEFAULT_K, min_similarity: float = DEFAULT_MIN_SIMILARITY
+    ) -> Dict[str, Any]:
+        """
+        Leave-one-out accuracy of the vote per raw-score bin, over up to `sample`
+        stored rows. Bins are smoothed ((correct + 1) / (n + 2)) and made
+        non-decreasing, then stored in meta.json and used by `confidence()`.
+        """
+        with self._writing():
+            n = int(self._meta["count"])
+            idf = self._idf()
+            correct = np.zeros(_CALIBRATION_BINS)
+            seen = np.zeros(_CALIBRATION_BINS)
+            for i in np.unique(np.linspace(0, n - 1, num=min(n, sample)).astype(np.intp)):
+                sims = self._similarities(np.asarray(self._vectors[i]), n, idf)
+                sims[i] = -1.0  # leave the row itself out
+                vote = self._vote(sims, k, min_similarity, None)
+                if vote is None:
+                    continue
+                b = min(_CALIBRATION_BINS - 1, int(vote["raw"] * _CALIBRATION_BINS))
+                seen[b] += 1
+                correct[b] += vote["department_id"] == self._meta["labels"][int(self._labels[i])]
+
+            accuracy = np.maximum.accumulate((correct + 1.0) / (seen + 2.0))
+            self._meta["calibration"] = {
+                "rows": n,
+                "samples": int(seen.sum()),
+                "accuracy": [round(float(a), 4) for a in accuracy],
+            }
+            self.flush()
+            return dict(self._meta["calibration"])
+
+    def stats(self) -> Dict[str, Any]:
+        self._sync()
+        with self._lock:
+            n = int(self._meta.get("count") or 0)
+            per_label: Dict[str, int] = {}
+            if n:
+                names = self._meta["labels"]
+                codes, counts = np.unique(np.asarray(self._labels[:n]), return_counts=True)
+                per_label = {names[int(c)]: int(m) for c, m in zip(codes, counts)}
+            return {
+                "path": str(self.path),
+                "count": n,
+                "dim": self.dim,
+                "labels": per_label,
+                "calibration": self._meta.get("calibration"),
+            }
+
+
+# ----------------------------
+# Process-wide instances
+# ----------------------------
+
+_open_lock = threading.Lock()
+_open: Dict[Tuple[str, int], KnnIndex] = {}
+
+
+def open_knn_index(path: str, dim: int = DEFAULT_DIM) -> KnnIndex:
+    """Shared index per path (one per process; memmaps do not survive fork() safely)."""
+    key = (os.path.abspath(path), os.getpid())
+    with _open_lock:
+        index = _open.get(key)
+        if index is None:
+            index = _open[key] = KnnIndex(path, dim=dim)
+        return index
+
+
+# ----------------------------
+# Building from past tickets
+# ----------------------------
+
+def _ticket_example(ticket: Dict[str, Any]) -> Tuple[str, str]:
+    return str(ticket.get("department") or ""), f"{ticket.get('subject') or ''}\n{ticket.get('raw_body') or ''}"
+
+
+def iter_ticket_examples(source: str) -> Iterator[Tuple[str, str]]:
+    """
+    (department, text) pairs from written tickets: a ticket directory (classic
+    <dept>/*.json files and JSONL segments, gzipped or not), a single JSONL
+    file, or a SQLite ticket store.
+    """
+    p = Path(source)
+    if p.is_dir():
+        for f in sorted(p.rglob("*")):
+            if f.is_file() and (f.suffix in {".json", ".jsonl", ".sqlite"} or f.name.endswith(".jsonl.gz")):
+                yield from iter_ticket_examples(str(f))
+        return
+
+    if p.suffix == ".sqlite":
+        conn = sqlite3.connect(f"file:{p}?mode=ro", uri=True)
+        try:
+            for dept, subject, body in conn.execute("SELECT department, subject, raw_body FROM tickets"):
+                yield str(dept or ""), f"{subject or ''}\n{body or ''}"
+        except sqlite3.DatabaseError:
+            return
+        finally:
+            conn.close()
+        return
+
+    if p.suffix == ".json":
+        try:
+            ticket = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if isinstance(ticket, dict) and "department" in ticket:
+            yield _ticket_example(ticket)
+        return
+
+    opener = gzip.open if p.name.endswith(".gz") else open
+    with opener(p, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                ticket = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(ticket, dict):
+                yield _ticket_example(ticket)
+
+
+def build_index(
+    index: KnnIndex,
+    sources: Sequence[str],
+    allowed: Optional[Collection[str]] = None,
+    batch: int = 5000,
+) -> int:
+    """Add every ticket from `sources` (optionally only departments in `allowed`); returns rows added."""
+    added = 0
+    chunk: List[Tuple[str, str]] = []
+    for source in sources:
+        for dept, text in iter_ticket_examples(source):
+            if allowed is not None and dept not in allowed:
+                continue
+            chunk.append((dept, text))
+            if len(chunk) >= batch:
+                added += index.add_many(chunk, calibrate=False)
+                chunk = []
+    # Calibrated once at the end (the build CLI) or by the next add() that finds it stale
+    added += index.add_many(chunk, calibrate=False)
+    index.flush()
+    return added
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def _build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m routing.knn", description="Build or inspect the kNN routing index.")
+    ap.add_argument("--index", default="memory/knn_index", help="index directory (default: %(default)s)")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("build", help="add past tickets to the index, then calibrate")
+    b.add_argument("sources", nargs="+", help="ticket directories, JSONL segments or ticket SQLite files")
+    b.add_argument("--config", help="only keep departments of this company config")
+    b.add_argument("--dim", type=int, default=DEFAULT_DIM, help="hashed feature size of a new index")
+
+    sub.add_parser("stats", help="rows per department and calibration")
+
+    q = sub.add_parser("query", help="route a text")
+    q.add_argument("text")
+    q.add_argument("-k", type=int, default=DEFAULT_K)
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _build_parser().parse_args(argv)
+    index = KnnIndex(args.index, dim=getattr(args, "dim", DEFAULT_DIM))
+
+    if args.command == "build":
+        allowed = None
+        if args.config:
+            from config.loader import load_company_snapshot
+
+            allowed = set(load_company_snapshot(args.config).dept_ids)
+        added = build_index(index, args.sources, allowed=allowed)
+        print(f"[INFO] Added {added} tickets ({index.count} total)")
+        if index.count:
+            cal = index.calibrate()
+            print(f"[INFO] Calibrated on {cal['samples']} rows: accuracy by score bin {cal['accuracy']}")
+        return 0
+
+    if args.command == "stats":
+        print(json.dumps(index.stats(), indent=2))
+        return 0
+
+    print(json.dumps(index.classify(args.text, k=args.k), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,9 @@
 from __future__ import annotations
 
-import json
-from dataclasses import dataclass
 from datetime import datetime, timezone
-from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+
+from routing.sinks import TicketSink, default_sink, new_ticket_id
 
 
 def _utc_now_iso() -> str:
@@ -18,20 +17,10 @@ def _safe_department(name: Any) -> str:
     return dept if dept else "NeedsReview"
 
 
-def route(email: Dict[str, Any], triage_result: Dict[str, Any], draft_result: Any) -> str:
-    """
-    Create a ticket JSON file and save it into outputs/<department>/.
-
-    Returns:
-      str path to created ticket file
-    """
+def build_ticket(email: Dict[str, Any], triage_result: Dict[str, Any], draft_result: Any) -> Dict[str, Any]:
     dept = _safe_department(triage_result.get("department"))
-    out_dir = Path("outputs") / dept
-    out_dir.mkdir(parents=True, exist_ok=True)
 
     email_id = str(email.get("id") or "unknown").strip() or "unknown"
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
-    ticket_id = f"{email_id}_{ts}"
 
     # Support both simple string draft results and dict-style results
     if isinstance(draft_result, str):
@@ -39,8 +28,8 @@ def route(email: Dict[str, Any], triage_result: Dict[str, Any], draft_result: An
     else:
         draft_text = (draft_result or {}).get("draft_reply")
 
-    ticket = {
-        "ticket_id": ticket_id,
+    return {
+        "ticket_id": new_ticket_id(email_id),
         "created_at": _utc_now_iso(),
         "department": dept,
         "confidence": triage_result.get("confidence"),
@@ -52,7 +41,21 @@ def route(email: Dict[str, Any], triage_result: Dict[str, Any], draft_result: An
         "raw_body": email.get("body"),
     }
 
-    out_path = out_dir / f"{ticket_id}.json"
-    out_path.write_text(json.dumps(ticket, indent=2, ensure_ascii=False), encoding="utf-8")
-    return str(out_path)
-#newcode
\ No newline at end of file
+
+def route(
+    email: Dict[str, Any],
+    triage_result: Dict[str, Any],
+    draft_result: Any,
+    sink: Optional[TicketSink] = None,
+) -> str:
+    """
+    Build a ticket and hand it to a ticket sink.
+
+    The default sink (AAI_TICKET_SINK, "files" unless configured) saves it
+    into outputs/<department>/<ticket_id>.json.
+
+    Returns:
+      str path the ticket was written to (file or JSONL segment)
+    """
+    ticket = build_ticket(email, triage_result, draft_result)
+    return (sink or default_sink()).write(ticket)
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, IO, List, Optional, Set
+
+
+def new_ticket_id(email_id: str) -> str:
+    """
+    Collision-free ticket id: "<email_id>_<UTC timestamp with microseconds>_<random suffix>".
+    Concurrent runs (threads, pool workers, separate processes) never produce the same id.
+    """
+    ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+    return f"{email_id}_{ts}_{uuid.uuid4().hex[:8]}"
+
+
+class TicketSink:
+    """Destination for finished tickets. `write` returns where the ticket went."""
+
+    def write(self, ticket: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class FileTicketSink(TicketSink):
+    """One pretty-printed JSON file per ticket under <root>/<department>/ (the classic layout)."""
+
+    def __init__(self, root: str = "outputs"):
+        self.root = Path(root)
+        self._dirs: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def _dir_for(self, dept: str) -> Path:
+        out_dir = self.root / dept
+        # Keyed by absolute path: a relative root follows the current working directory
+        key = os.path.abspath(out_dir)
+        if key not in self._dirs:
+            out_dir.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                self._dirs.add(key)
+        return out_dir
+
+    def write(self, ticket: Dict[str, Any]) -> str:
+        out_path = self._dir_for(ticket["department"]) / f"{ticket['ticket_id']}.json"
+        out_path.write_text(json.dumps(ticket, indent=2, ensure_ascii=False), encoding="utf-8")
+        return str(out_path)
+
+
+class _Segment:
+    __slots__ = ("path", "fh", "bytes_written")
+
+    def __init__(self, path: Path, fh: IO[str]):
+        self.path = path
+        self.fh = fh
+        self.bytes_written = 0
+
+
+class JsonlTicketSink(TicketSink):
+    """
+    Buffered, append-only JSONL segments per department.
+
+    Tickets are buffered in memory and written every `flush_every` tickets or
+    `flush_interval` seconds (a daemon thread flushes idle buffers). Each
+    department gets segment files named
+    "tickets-<UTC start>-<pid>-<seq>.jsonl[.gz]"; a segment is rotated once it
+    reaches `rotate_bytes` (uncompressed). The pid in the name keeps concurrent
+    runs from ever appending to the same file.
+    """
+
+    def __init__(
+        self,
+        root: str = "outputs",
+        flush_every: int = 100,
+        flush_interval: float = 5.0,
+        rotate_bytes: int = 64 * 1024 * 1024,
+        compress: bool = False,
+    ):
+        self.root = Path(root)
+        self.flush_every = max(1, int(flush_every))
+        self.flush_interval = float(flush_interval)
+        self.rotate_bytes = int(rotate_bytes)
+        self.compress = compress
+
+        self._lock = threading.RLock()
+        self._buffers: Dict[str, List[str]] = {}
+        self._buffered = 0
+        self._segments: Dict[str, _Segment] = {}
+        self._seq = 0
+        self._last_flush = time.monotonic()
+        self._closed = False
+
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if self.flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="jsonl-ticket-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                if self._buffered and time.monotonic() - self._last_flush >= self.flush_interval:
+                    self._flush_locked()
+
+    def _open_segment(self, dept: str) -> _Segment:
+        out_dir = self.root / dept
+        out_dir.mkdir(parents=True, exist_ok=True)
+        self._seq += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        name = f"tickets-{stamp}-{os.getpid()}-{self._seq:04d}.jsonl"
+        if self.compress:
+            path = out_dir / (name + ".gz")
+            fh: IO[str] = gzip.open(path, "at", encoding="utf-8")
+        else:
+            path = out_dir / name
+            fh = path.open("a", encoding="utf-8")
+        seg = _Segment(path, fh)
+        self._segments[dept] = seg
+        return seg
+
+    def _segment(self, dept: str) -> _Segment:
+        seg = self._segments.get(dept)
+        if seg is None:
+            seg = self._open_segment(dept)
+        return seg
+
+    def write(self, ticket: Dict[str, Any]) -> str:
+        line = json.dumps(ticket, ensure_ascii=False, separators=(",", ":")) + "\n"
+        dept = ticket["department"]
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ticket sink is closed")
+            path = self._segment(dept).path
+            self._buffers.setdefault(dept, []).append(line)
+            self._buffered += 1
+
+            if self._buffered >= self.flush_every or (
+                self.flush_interval > 0 and time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self._flush_locked()
+        return str(path)
+
+    def _flush_locked(self) -> None:
+        for dept, lines in self._buffers.items():
+            if not lines:
+                continue
+            seg = self._segment(dept)
+            data = "".join(lines)
+            seg.fh.write(data)
+            seg.fh.flush()
+            seg.bytes_written += len(data.encode("utf-8"))
+            if self.rotate_bytes > 0 and seg.bytes_written >= self.rotate_bytes:
+                seg.fh.close()
+                del self._segments[dept]
+        self._buffers.clear()
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_locked()
+            for seg in self._segments.values():
+                seg.fh.close()
+            self._segments.clear()
+            self._closed = True
+
+
+# ----------------------------
+# Process-wide default sink
+# ----------------------------
+
+_default_lock = threading.Lock()
+_default_sink: Optional[TicketSink] = None
+
+
+def sink_from_env() -> TicketSink:
+    """
+    Build the sink selected by AAI_TICKET_SINK ("files" by default, "jsonl" or "sqlite").
+    Output root comes from AAI_OUTPUT_DIR (default "outputs").
+    """
+    kind = os.getenv("AAI_TICKET_SINK", "files").strip().lower()
+    root = os.getenv("AAI_OUTPUT_DIR", "outputs")
+
+    if kind == "files":
+        return FileTicketSink(root)
+    if kind == "jsonl":
+        return JsonlTicketSink(
+            root,
+            flush_every=int(os.getenv("AAI_TICKET_FLUSH_EVERY", "100")),
+            flush_interval=float(os.getenv("AAI_TICKET_FLUSH_SECONDS", "5")),
+            rotate_bytes=int(float(os.getenv("AAI_TICKET_ROTATE_MB", "64")) * 1024 * 1024),
+            compress=os.getenv("AAI_TICKET_GZIP", "0").strip().lower() in {"1", "true", "yes"},
+        )
+    if kind == "sqlite":
+        # imported here: ticket_store builds on this module
+        from routing.ticket_store import SqliteTicketSink
+
+        return SqliteTicketSink(
+            os.getenv("AAI_TICKET_DB", os.path.join(root, "tickets.sqlite")),
+            batch_size=int(os.getenv("AAI_TICKET_FLUSH_EVERY", "100")),
+            flush_interval=float(os.getenv("AAI_TICKET_FLUSH_SECONDS", "5")),
+        )
+    raise ValueError(f"Unknown AAI_TICKET_SINK: {kind!r}")
+
+
+def default_sink() -> TicketSink:
+    global _default_sink
+    with _default_lock:
+        if _default_sink is None:
+            _default_sink = sink_from_env()
+            atexit.register(close_default_sink)
+        return _default_sink
+
+
+def close_default_sink() -> None:
+    """Flush and close the default sink; the next `default_sink()` call builds a new one."""
+    global _default_sink
+    with _default_lock:
+        sink, _default_sink = _default_sink, None
+    if sink is not None:
+        sink.close()
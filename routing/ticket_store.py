@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parseaddr
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from routing.sinks import TicketSink
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    created_ts REAL NOT NULL,
+    department TEXT NOT NULL,
+    sender TEXT,
+    sender_address TEXT,
+    subject TEXT,
+    confidence REAL,
+    summary TEXT,
+    tags TEXT,
+    draft_reply TEXT,
+    raw_body TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_department ON tickets(department, created_ts);
+CREATE INDEX IF NOT EXISTS idx_tickets_sender ON tickets(sender_address, created_ts);
+CREATE INDEX IF NOT EXISTS idx_tickets_created ON tickets(created_ts);
+CREATE INDEX IF NOT EXISTS idx_tickets_confidence ON tickets(confidence);
+"""
+
+_COLUMNS = (
+    "ticket_id", "created_at", "created_ts", "department", "sender", "sender_address",
+    "subject", "confidence", "summary", "tags", "draft_reply", "raw_body",
+)
+
+TimeArg = Union[None, float, int, str, datetime]
+
+
+def _sender_address(sender: Any) -> str:
+    return parseaddr(str(sender or ""))[1].strip().lower()
+
+
+def _to_ts(value: TimeArg) -> Optional[float]:
+    """Accept a unix timestamp, a datetime, an ISO string or a relative age like "1h", "30m", "2d"."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        dt = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+
+    s = str(value).strip()
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([smhdw])", s.lower())
+    if m:
+        unit = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}[m.group(2)]
+        return time.time() - float(m.group(1)) * unit
+    return _to_ts(datetime.fromisoformat(s))
+
+
+def _row(ticket: Dict[str, Any]) -> Tuple[Any, ...]:
+    created_at = str(ticket.get("created_at") or datetime.now(timezone.utc).isoformat())
+    try:
+        created_ts = datetime.fromisoformat(created_at).timestamp()
+    except ValueError:
+        created_ts = time.time()
+    return (
+        ticket["ticket_id"],
+        created_at,
+        created_ts,
+        ticket["department"],
+        ticket.get("from"),
+        _sender_address(ticket.get("from")),
+        ticket.get("subject"),
+        ticket.get("confidence"),
+        ticket.get("summary"),
+        json.dumps(ticket.get("tags") or [], ensure_ascii=False),
+        ticket.get("draft_reply"),
+        ticket.get("raw_body"),
+    )
+
+
+class TicketStore:
+    """
+    SQLite-backed ticket store with indexes on department, sender, created_at
+    and confidence. One connection per store, shared across threads behind a lock.
+    """
+
+    def __init__(self, path: str = "outputs/tickets.sqlite"):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def insert_many(self, tickets: Iterable[Dict[str, Any]]) -> int:
+        """Insert tickets in a single transaction; returns how many were written."""
+        rows = [_row(t) for t in tickets]
+        if not rows:
+            return 0
+        placeholders = ",".join("?" for _ in _COLUMNS)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO tickets({','.join(_COLUMNS)}) VALUES ({placeholders})", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def _where(
+        self,
+        department: Optional[str],
+        sender: Optional[str],
+        since: TimeArg,
+        until: TimeArg,
+        min_confidence: Optional[float],
+        max_confidence: Optional[float],
+    ) -> Tuple[str, List[Any]]:
+        clauses: List[str] = []
+        params: List[Any] = []
+        if department:
+            clauses.append("department = ?")
+            params.append(department)
+        if sender:
+            clauses.append("sender_address = ?")
+            params.append(_sender_address(sender) or str(sender).strip().lower())
+        since_ts, until_ts = _to_ts(since), _to_ts(until)
+        if since_ts is not None:
+            clauses.append("created_ts >= ?")
+            params.append(since_ts)
+        if until_ts is not None:
+            clauses.append("created_ts < ?")
+            params.append(until_ts)
+        if min_confidence is not None:
+            clauses.append("confidence >= ?")
+            params.append(float(min_confidence))
+        if max_confidence is not None:
+            clauses.append("confidence <= ?")
+            params.append(float(max_confidence))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(
+        self,
+        department: Optional[str] = None,
+        sender: Optional[str] = None,
+        since: TimeArg = None,
+        until: TimeArg = None,
+        min_confidence: Optional[float] = None,
+        max_confidence: Optional[float] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Newest-first tickets matching every given filter."""
+        where, params = self._where(department, sender, since, until, min_confidence, max_confidence)
+        sql = f"SELECT * FROM tickets{where} ORDER BY created_ts DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, params + [int(limit)]).fetchall()
+
+        out: List[Dict[str, Any]] = []
+        for r in rows:
+            t = dict(r)
+            t["tags"] = json.loads(t.get("tags") or "[]")
+            t.pop("created_ts", None)
+            out.append(t)
+        return out
+
+    def count(
+        self,
+        department: Optional[str] = None,
+        sender: Optional[str] = None,
+        since: TimeArg = None,
+        until: TimeArg = None,
+        min_confidence: Optional[float] = None,
+        max_confidence: Optional[float] = None,
+    ) -> int:
+        where, params = self._where(department, sender, since, until, min_confidence, max_confidence)
+        with self._lock:
+            (n,) = self._conn.execute(f"SELECT COUNT(*) FROM tickets{where}", params).fetchone()
+        return int(n)
+
+    def department_counts(self, since: TimeArg = None) -> Dict[str, int]:
+        where, params = self._where(None, None, since, None, None, None)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT department, COUNT(*) FROM tickets{where} GROUP BY department ORDER BY 2 DESC", params
+            ).fetchall()
+        return {r[0]: int(r[1]) for r in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> TicketStore:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class SqliteTicketSink(TicketSink):
+    """
+    Buffers tickets and inserts them into a `TicketStore` in batched
+    transactions: every `batch_size` tickets or `flush_interval` seconds
+    (a daemon thread flushes idle buffers).
+    """
+
+    def __init__(self, path: str = "outputs/tickets.sqlite", batch_size: int = 100, flush_interval: float = 5.0):
+        self.store = TicketStore(path)
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._last_flush = time.monotonic()
+
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if self.flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="sqlite-ticket-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                due = bool(self._buffer) and time.monotonic() - self._last_flush >= self.flush_interval
+            if due:
+                self.flush()
+
+    def write(self, ticket: Dict[str, Any]) -> str:
+        with self._lock:
+            self._buffer.append(ticket)
+            due = len(self._buffer) >= self.batch_size or (
+                self.flush_interval > 0 and time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+        return f"{self.store.path}#{ticket['ticket_id']}"
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+        self.store.insert_many(batch)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._flusher is not None:
+            # Let an in-flight timed flush finish before the connection goes away
+            self._flusher.join()
+        self.flush()
+        self.store.close()
+
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def _build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(prog="python -m routing.ticket_store", description="Query the SQLite ticket store.")
+    ap.add_argument("--db", default="outputs/tickets.sqlite", help="ticket database (default: %(default)s)")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    def add_filters(p: argparse.ArgumentParser) -> None:
+        p.add_argument("--department", help="department id, e.g. needs_review")
+        p.add_argument("--sender", help="sender address")
+        p.add_argument("--since", help="ISO time or age like 1h, 30m, 2d")
+        p.add_argument("--until", help="ISO time or age like 1h, 30m, 2d")
+        p.add_argument("--min-confidence", type=float)
+        p.add_argument("--max-confidence", type=float)
+
+    q = sub.add_parser("query", help="list matching tickets (newest first)")
+    add_filters(q)
+    q.add_argument("--limit", type=int, default=50)
+    q.add_argument("--json", action="store_true", help="print full tickets as JSON lines")
+
+    c = sub.add_parser("count", help="count matching tickets")
+    add_filters(c)
+
+    s = sub.add_parser("summary", help="tickets per department")
+    s.add_argument("--since", help="ISO time or age like 1h, 30m, 2d")
+    return ap
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _build_parser().parse_args(argv)
+    store = TicketStore(args.db)
+    try:
+        if args.command == "summary":
+            for dept, n in store.department_counts(since=args.since).items():
+                print(f"{dept:<20} {n:>8}")
+            return 0
+
+        filters = dict(
+            department=args.department,
+            sender=args.sender,
+            since=args.since,
+            until=args.until,
+            min_confidence=args.min_confidence,
+            max_confidence=args.max_confidence,
+        )
+        if args.command == "count":
+            print(store.count(**filters))
+            return 0
+
+        for t in store.query(limit=args.limit, **filters):
+            if args.json:
+                print(json.dumps(t, ensure_ascii=False))
+            else:
+                conf = t.get("confidence")
+                conf_s = f"{conf:.2f}" if isinstance(conf, (int, float)) else "-"
+                print(f"{t['created_at']}  {t['department']:<14} {conf_s:>5}  {t.get('sender') or ''}  {t.get('subject') or ''}")
+        return 0
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
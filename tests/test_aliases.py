@@ -0,0 +1,24 @@
+"""Tests for recipient parsing and the alias index."""
+from routing.aliases import AliasIndex, normalize_address, recipient_addresses
+
+
+def test_recipient_addresses_parses_and_normalizes():
+    email = {
+        "to": "Sales Team <Sales+EU@Example.com>, other@example.com",
+        "cc": ["support@example.com"],
+        "delivered_to": "sales@example.com",
+    }
+
+    assert recipient_addresses(email) == ["sales@example.com", "other@example.com", "support@example.com"]
+    assert normalize_address("not-an-address") == ""
+
+
+def test_alias_index_exact_beats_domain_and_no_substring_match():
+    idx = AliasIndex({
+        "sales@example.com": "sales",
+        "*@billing.example.com": "billing",
+    })
+
+    assert idx.route({"to": "presales@example.com"}) is None
+    assert idx.route({"to": "ap@billing.example.com, sales@example.com"}) == "sales"
+    assert idx.route({"cc": "ap@billing.example.com"}) == "billing"
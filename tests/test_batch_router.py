@@ -0,0 +1,62 @@
+"""Tests for the batching LLM router."""
+import threading
+
+from agent.batch_router import BatchRouter, parse_batch_reply
+from config.loader import load_company_snapshot
+
+
+ALLOWED = ["sales", "support", "billing", "needs_review"]
+
+
+def test_parse_batch_reply_formats():
+    assert parse_batch_reply('Sure!\n```json\n{"1": "sales", "2": "Billing", "3": "nope"}\n```', 3, ALLOWED) == {
+        1: "sales",
+        2: "billing",
+    }
+    assert parse_batch_reply('{"results": [{"id": 2, "department_id": "support"}]}', 2, ALLOWED) == {2: "support"}
+    assert parse_batch_reply('["sales", "support"]', 2, ALLOWED) == {1: "sales", 2: "support"}
+    assert parse_batch_reply("1: sales\nEmail #2 - billing\n9: sales", 2, ALLOWED) == {1: "sales", 2: "billing"}
+    assert parse_batch_reply("no idea", 2, ALLOWED) == {}
+
+
+def test_batches_requests_and_falls_back_per_item():
+    snap = load_company_snapshot("config/company_config.json")
+    calls = []
+
+    def fake_invoke(messages, **kwargs):
+        calls.append(messages[1].content)
+        return '{"1": "sales", "2": "billing", "3": "support"}'  # email 4 is left out
+
+    fallbacks = []
+
+    def fallback(cfg, email):
+        fallbacks.append(email["id"])
+        return {"department_id": "needs_review", "confidence": 0.45, "stage": "llm"}
+
+    router = BatchRouter(max_batch=4, window_s=5.0, invoke=fake_invoke)
+    router._active = 1  # another email is already being routed, so arrivals wait for company
+    results = {}
+
+    def worker(i):
+        results[i] = router.route(snap, {"id": i, "from": "x@y.z", "subject": f"s{i}", "body": "b"}, fallback)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=10)
+
+    assert len(calls) == 1 and calls[0].count("### EMAIL") == 4
+    assert len(fallbacks) == 1
+    assert sorted(r["department_id"] for r in results.values()) == ["billing", "needs_review", "sales", "support"]
+    assert router.stats() == {"requests": 1, "emails": 4, "fallbacks": 1, "emails_per_request": 4.0}
+
+
+def test_lone_caller_is_not_delayed():
+    snap = load_company_snapshot("config/company_config.json")
+    router = BatchRouter(max_batch=8, window_s=30.0, invoke=lambda *a, **k: "{}")
+
+    routed = router.route(snap, {"id": 1}, lambda cfg, email: {"department_id": "sales", "confidence": 0.65})
+
+    assert routed["department_id"] == "sales"
+    assert router.stats()["requests"] == 0  # a batch of one uses the single-email prompt
@@ -0,0 +1,44 @@
+"""Tests for the benchmark corpus, the fake Ollama server and baseline comparison."""
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agent.llm import invoke_chat, reset_clients
+from benchmarks.corpus import corpus_sizes, iter_synthetic_emails, write_corpus
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.run import compare
+from ingestion.loader import load_emails
+
+
+def test_corpus_is_deterministic_and_loadable(tmp_path):
+    first = list(iter_synthetic_emails(50, seed=7))
+    assert first == list(iter_synthetic_emails(50, seed=7))
+    assert first != list(iter_synthetic_emails(50, seed=8))
+
+    for name in ("c.jsonl", "c.json"):
+        path = write_corpus(str(tmp_path / name), 50, seed=7)
+        assert load_emails(path) == first
+
+    assert corpus_sizes("1k, 10k,1m,500") == [1000, 10000, 1000000, 500]
+
+
+def test_fake_ollama_answers_routing_prompts(monkeypatch):
+    monkeypatch.setenv("AAI_LLM_CACHE", "0")
+    reset_clients()
+    try:
+        with FakeOllamaServer() as srv:
+            messages = [SystemMessage(content="ALLOWED: ['sales', 'billing']"), HumanMessage(content="hello")]
+            answer = invoke_chat(messages, model="fake", base_url=srv.base_url)
+
+            assert answer in {"sales", "billing"}
+            assert invoke_chat(messages, model="fake", base_url=srv.base_url) == answer
+            assert srv.requests == 2
+    finally:
+        reset_clients()
+
+
+def test_compare_flags_throughput_and_memory_regressions():
+    baseline = {"results": {"triage@1000": {"per_sec": 1000.0, "peak_mb": 10.0}, "gone@1": {"per_sec": 1.0}}}
+
+    assert compare({"results": {"triage@1000": {"per_sec": 800.0, "peak_mb": 12.0}}}, baseline, 0.25, 0.25) == []
+
+    problems = compare({"results": {"triage@1000": {"per_sec": 700.0, "peak_mb": 13.0}}}, baseline, 0.25, 0.25)
+    assert len(problems) == 2 and all(p.startswith("triage@1000") for p in problems)
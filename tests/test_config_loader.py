@@ -0,0 +1,70 @@
+"""Tests for the compiled company-config snapshot."""
+import json
+import os
+
+import pytest
+
+from config.loader import load_company_snapshot
+
+
+def _write(path, cfg):
+    path.write_text(json.dumps(cfg), encoding="utf-8")
+
+
+def _cfg(tone="friendly"):
+    return {
+        "company": {"default_tone": "neutral"},
+        "departments": [{"id": "Sales", "name": "Sales Team", "tone": tone}],
+        "inbox_aliases": [{"address": "Sales@Example.com", "department_id": "Sales"}],
+        "employees": [{"email": "a@example.com", "department_ids": ["sales"]}],
+        "routing_rules": {"keyword_to_department": [{"department_id": "Sales", "keywords": [" Pricing ", ""]}]},
+    }
+
+
+def test_snapshot_indexes(tmp_path):
+    p = tmp_path / "cfg.json"
+    _write(p, _cfg())
+
+    snap = load_company_snapshot(str(p))
+
+    assert snap.dept_ids == ("sales",)
+    assert snap.alias_to_department == {"sales@example.com": "sales"}
+    assert snap.keyword_rules == (("sales", ("pricing",)),)
+    assert snap.default_tone == "neutral"
+    assert [e["email"] for e in snap.employees_by_department["sales"]] == ["a@example.com"]
+
+    with pytest.raises(TypeError):
+        snap.dept_id_to_tone["Sales"] = "other"
+
+
+def test_snapshot_cached_and_invalidated(tmp_path):
+    p = tmp_path / "cfg.json"
+    _write(p, _cfg())
+
+    first = load_company_snapshot(str(p))
+    assert load_company_snapshot(str(p)) is first
+
+    # Same content, new mtime -> hash matches, snapshot is kept
+    st = os.stat(p)
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert load_company_snapshot(str(p)) is first
+
+    _write(p, _cfg(tone="formal, very precise"))
+    second = load_company_snapshot(str(p))
+    assert second is not first
+    assert second.dept_id_to_tone["Sales"] == "formal, very precise"
+
+
+def test_triage_map_and_cascade(tmp_path):
+    p = tmp_path / "cfg.json"
+    cfg = _cfg()
+    cfg["departments"].append({"id": "accounts", "name": "Finance"})
+    cfg["routing_rules"]["cascade"] = {"stages": ["keyword", "LLM", "bogus"], "thresholds": {"keyword": "0.5"}}
+    _write(p, cfg)
+
+    snap = load_company_snapshot(str(p))
+
+    # Matched by id (sales) and by display name (Finance -> accounts); no support department
+    assert dict(snap.triage_department_map) == {"sales": "sales", "finance": "accounts"}
+    assert snap.routing_stages == ("keyword", "llm")
+    assert snap.stage_thresholds["keyword"] == 0.5 and snap.stage_thresholds["triage"] == 0.8
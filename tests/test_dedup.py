@@ -0,0 +1,90 @@
+"""Tests for near-duplicate detection."""
+import agent.graph as graph
+from routing.dedup import NearDuplicateIndex, fingerprint_text, minhash, similarity
+
+
+ALERT = (
+    "ALERT: disk usage on host db-{n} reached {p}% at 03:{n:02d} UTC. The volume /var/lib/data is almost full "
+    "and writes will start failing soon. Please free space or extend the volume."
+)
+
+
+def _alert(n, p=91):
+    return {"id": f"a{n}", "from": "monitor@ops.example.com", "subject": f"[ALERT] Disk usage {p}% on db-{n}",
+            "body": ALERT.format(n=n, p=p) + "\n--\nMonitoring bot\n"}
+
+
+def test_minhash_is_similar_for_near_duplicates_only():
+    a, b = minhash(fingerprint_text(_alert(1))), minhash(fingerprint_text(_alert(7, p=95)))
+    other = minhash("Could you send me a quote for fifty seats of the enterprise plan with annual billing?")
+
+    assert a == b  # numbers are masked, the signature is dropped
+    assert similarity(a, minhash(fingerprint_text(_alert(1)) + " please hurry")) >= 0.8
+    assert similarity(a, other) < 0.2
+    assert minhash("thanks a lot") is None
+
+
+def test_index_matches_within_threshold_and_window():
+    now = [0.0]
+    index = NearDuplicateIndex(threshold=0.8, window_s=60, clock=lambda: now[0])
+    text = fingerprint_text(_alert(1))
+
+    index.add(minhash(text), "rep", {"department_id": "support"})
+    rep, payload, sim = index.match(minhash(text + " please hurry"))
+    assert (rep, payload) == ("rep", {"department_id": "support"}) and sim >= 0.8
+    assert index.match(minhash("the volume is full, the disk is full, and the host is down again today")) is None
+
+    now[0] = 61.0
+    assert index.match(minhash(text)) is None
+    assert index.stats()["clusters"] == 0
+
+
+def _run_graph(monkeypatch, emails):
+    monkeypatch.setenv("AAI_SENDER_MEMORY", "0")
+    monkeypatch.setenv("AAI_KNN_ROUTER", "0")
+    monkeypatch.setenv("AAI_THREADS", "0")
+    monkeypatch.setenv("AAI_ROUTER_BATCH_SIZE", "1")
+    monkeypatch.setenv("AAI_LLM_CACHE", "0")
+    monkeypatch.setattr(graph, "llm_route_department", lambda cfg, email: {"department_id": "billing", "confidence": 0.65, "stage": "llm"})
+    graph.reset_near_duplicates()
+
+    drafts = []
+
+    def fake_run_draft(messages, on_token=None, stats=None):
+        drafts.append(messages)
+        return f"Reply {len(drafts)}"
+
+    monkeypatch.setattr(graph, "run_draft", fake_run_draft)
+    g = graph.build_graph()
+    states = [g.invoke({"email": e, "config_path": "config/company_config.json", "interactive": False}) for e in emails]
+    graph.reset_near_duplicates()
+    return states, drafts
+
+
+def test_alert_storm_reuses_the_route_and_only_redrafts_changed_alerts(monkeypatch):
+    resend = dict(_alert(0), id="a0-resend")
+    states, drafts = _run_graph(monkeypatch, [_alert(0), _alert(1), resend, _alert(2)])
+
+    assert len(drafts) == 3  # the exact resend reuses the first draft
+    assert [s.get("duplicate_of") for s in states] == [None, "a0", "a0", "a0"]
+    assert all(s["department_id"] == states[0]["department_id"] for s in states)
+    assert states[2]["draft"] == states[0]["draft"] == "Reply 1"
+    assert states[1]["draft"] == "Reply 2"
+    assert "near_duplicate" in states[1]["tags"] and states[2]["routing_stage"] == "duplicate"
+
+
+def test_draft_is_not_shared_between_customers(monkeypatch):
+    # Same template, different customer, invoice and amount: identical fingerprints
+    template = (
+        "Hello, we received invoice {inv} for {amount} EUR but our contract says the monthly fee is lower. "
+        "Could you please check the invoice and send a corrected one?"
+    )
+    alice = {"id": "m1", "from": "alice@acme.com", "subject": "Invoice 1234", "body": template.format(inv=1234, amount=480)}
+    bob = {"id": "m2", "from": "bob@globex.com", "subject": "Invoice 9876", "body": template.format(inv=9876, amount=120)}
+    assert minhash(fingerprint_text(alice)) == minhash(fingerprint_text(bob))
+
+    (first, second), drafts = _run_graph(monkeypatch, [alice, bob])
+    assert len(drafts) == 2
+    assert second["duplicate_of"] == "m1" and second["department_id"] == first["department_id"]
+    assert second["draft"] == "Reply 2" != first["draft"]
+    assert "480" not in str(drafts[1]) and "9876" in str(drafts[1])
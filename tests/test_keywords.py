@@ -0,0 +1,32 @@
+"""Tests for the Aho-Corasick keyword matcher."""
+from routing.keywords import KeywordMatcher
+
+
+RULES = [
+    ("sales", ["price", "pricing", "demo"]),
+    ("support", ["error", "login", "reset password", "password"]),
+    ("billing", ["invoice", "price"]),
+]
+
+
+def test_counts_match_substring_semantics():
+    m = KeywordMatcher(RULES)
+    text = "Pricing and price question: login ERROR after password reset password"
+
+    assert m.counts(text) == {"sales": 2, "support": 4, "billing": 1}
+    assert m.best(text) == ("support", 4)
+
+
+def test_best_prefers_first_group_on_tie_and_none_without_hits():
+    m = KeywordMatcher(RULES)
+
+    assert m.best("the price is right") == ("sales", 1)
+    assert m.best("nothing relevant here") is None
+
+
+def test_word_boundary():
+    m = KeywordMatcher([("sales", ["demo", "inv-"])], word_boundary=True)
+
+    assert m.counts("see the demonstration") == {}
+    assert m.counts("book a demo, please") == {"sales": 1}
+    assert m.counts("ref inv-2024") == {"sales": 1}
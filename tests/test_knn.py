@@ -0,0 +1,101 @@
+"""Tests for the kNN routing index."""
+import json
+
+import agent.graph as graph
+from routing.knn import KnnIndex, build_index, iter_ticket_examples
+from routing.sinks import FileTicketSink, JsonlTicketSink
+
+
+def _ticket(i, dept, subject, body):
+    return {"ticket_id": f"t{i}", "department": dept, "subject": subject, "raw_body": body}
+
+
+BILLING = "Invoice {n} was charged twice on our card, please refund the duplicate payment"
+SUPPORT = "The export job {n} fails with a timeout error when opening the dashboard"
+# No configured routing keyword in here, so only the LLM or the index can route it
+SHIPMENT = "Our shipment of widgets to warehouse {n} arrived with dented crates and missing pallets"
+
+
+def test_build_classify_and_reopen(tmp_path):
+    files, jsonl = FileTicketSink(str(tmp_path / "out")), JsonlTicketSink(str(tmp_path / "out"), flush_interval=0)
+    for i in range(20):
+        files.write(_ticket(i, "billing", f"Invoice INV-{i}", BILLING.format(n=i)))
+        jsonl.write(_ticket(100 + i, "support", f"Export broken #{i}", SUPPORT.format(n=i)))
+        jsonl.write(_ticket(200 + i, "needs_review", "?", "no signal here"))
+    jsonl.close()
+
+    assert len(list(iter_ticket_examples(str(tmp_path / "out")))) == 60
+
+    index = KnnIndex(str(tmp_path / "idx"), dim=256)
+    assert build_index(index, [str(tmp_path / "out")]) == 40  # needs_review carries no signal
+    cal = index.calibrate()
+    assert cal["samples"] == 40
+
+    reopened = KnnIndex(str(tmp_path / "idx"))
+    assert reopened.count == 40 and reopened.dim == 256
+    vote = reopened.classify("Invoice INV-77\n" + BILLING.format(n=77))
+    assert vote["department_id"] == "billing" and vote["support"] >= 3
+    assert 0.5 < vote["confidence"] <= 1.0
+    assert reopened.classify("export job fails with timeout", allowed={"billing"})["department_id"] == "billing"
+
+
+def test_index_grows_past_initial_capacity(tmp_path):
+    index = KnnIndex(str(tmp_path / "idx"), dim=64)
+    assert index.add_many(("sales" if i % 2 else "support", f"message number {i} about topic {i % 7}") for i in range(1500)) == 1500
+
+    meta = json.loads((tmp_path / "idx" / "meta.json").read_text())
+    assert meta["count"] == 1500 and meta["capacity"] == 2048
+    assert KnnIndex(str(tmp_path / "idx")).stats()["labels"] == {"sales": 750, "support": 750}
+
+
+def test_graph_learns_only_reviewed_routes(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("AAI_MEMORY_PATH", str(tmp_path / "memory.sqlite"))
+    monkeypatch.setenv("AAI_SENDER_MEMORY", "0")
+    monkeypatch.setenv("AAI_THREADS", "0")
+    monkeypatch.setenv("AAI_ROUTER_BATCH_SIZE", "1")
+    monkeypatch.setattr("builtins.input", lambda prompt="": "approve")
+
+    llm_calls = []
+
+    def fake_llm(cfg, email):
+        llm_calls.append(email["id"])
+        return {"department_id": "billing", "confidence": 0.65, "stage": "llm"}
+
+    monkeypatch.setattr(graph, "llm_route_department", fake_llm)
+
+    def run(i, body, reviewed):
+        email = {"id": f"e{i}", "from": f"c{i}@client.io", "to": "inbox@example.com",
+                 "subject": f"Note {i}", "body": body.format(n=i)}
+        state = graph.node_load_config({"email": email, "config_path": "config/company_config.json", "interactive": reviewed})
+        state = graph.node_route_and_assign(state)
+        graph.node_chat_review(state)
+        return state["routing_stage"]
+
+    # Past reviewed tickets; the index calibrates itself once it is big enough
+    index = graph.knn_index()
+    index.add_many([("billing", SHIPMENT.format(n=i)) for i in range(30)] + [("support", SUPPORT.format(n=i)) for i in range(30)])
+    assert index.stats()["calibration"]["rows"] == 60
+
+    parking = "Please renew the parking permits for building {n} before the end of the month"
+    assert run(1, parking, reviewed=False) == "llm"
+    assert run(2, SHIPMENT, reviewed=False) == "knn"
+    assert index.count == 60  # neither the model's guess nor the kNN's own route was learned
+    assert run(3, parking, reviewed=True) == "llm"
+    assert index.count == 61
+    assert llm_calls == ["e1", "e3"]
+
+
+def test_index_recalibrates_as_it_grows_and_clamps_k(tmp_path):
+    index = KnnIndex(str(tmp_path / "idx"), dim=256)
+    index.add_many(("billing", BILLING.format(n=i)) for i in range(30))
+    assert index.stats()["calibration"] is None  # too small: raw scores
+
+    index.add_many(("support", SUPPORT.format(n=i)) for i in range(30))
+    assert index.stats()["calibration"]["rows"] == 60
+    for i in range(60):
+        index.add(SUPPORT.format(n=100 + i), "support")
+    assert index.stats()["calibration"]["rows"] == 120
+
+    vote = index.classify(SUPPORT.format(n=999), k=0)
+    assert vote["department_id"] == "support" and vote["support"] == 1
+    assert index.classify(BILLING.format(n=999))["confidence"] >= 0.7
@@ -0,0 +1,114 @@
+"""Tests for the shared LLM client registry."""
+import asyncio
+
+import httpx
+from langchain_core.messages import AIMessageChunk, HumanMessage
+
+import agent.llm as llm
+from agent.llm import get_chat_model, pool_stats, reset_clients
+
+
+def test_get_chat_model_reuses_instances():
+    reset_clients()
+    try:
+        a = get_chat_model("test-model", base_url="http://localhost:11434", temperature=0.0)
+        b = get_chat_model("test-model", base_url="http://localhost:11434/", temperature=0.0)
+        c = get_chat_model("test-model", base_url="http://localhost:11434", temperature=0.2)
+
+        assert a is b
+        assert a is not c
+
+        stats = pool_stats()
+        assert stats["clients"] == 2
+        assert stats["created"] == 2
+        assert stats["reused"] == 1
+    finally:
+        reset_clients()
+
+
+def test_reset_clients_closes_the_sync_pools(monkeypatch):
+    reset_clients()
+    closed = []
+    monkeypatch.setattr(httpx.HTTPTransport, "close", lambda self: closed.append(self))
+
+    a = get_chat_model("test-model", temperature=0.0)
+    get_chat_model("test-model", temperature=0.2)
+    pools = list(llm._transports.values())
+    assert len(pools) == 2 and a._client._client._transport is pools[0]
+
+    reset_clients()
+    assert closed == pools and not llm._transports
+    assert get_chat_model("test-model") is not a
+    reset_clients()
+
+
+def test_async_callers_get_per_loop_instances():
+    reset_clients()
+    try:
+        sync_llm = get_chat_model("test-model")
+
+        async def _get():
+            return get_chat_model("test-model")
+
+        first = asyncio.run(_get())
+        second = asyncio.run(_get())
+
+        assert first is not sync_llm
+        assert second is not first
+        assert pool_stats()["evicted"] == 1
+    finally:
+        reset_clients()
+
+
+def test_stream_chat_assembles_text_and_timings(monkeypatch):
+    class FakeModel:
+        def stream(self, messages):
+            for piece in ("Hel", "lo", " there"):
+                yield AIMessageChunk(content=piece)
+            yield AIMessageChunk(content="", usage_metadata={"input_tokens": 5, "output_tokens": 4, "total_tokens": 9})
+
+    monkeypatch.setenv("AAI_LLM_CACHE", "0")
+    monkeypatch.setattr(llm, "get_chat_model", lambda **kwargs: FakeModel())
+
+    seen = []
+    text, stats = llm.stream_chat([HumanMessage(content="hi")], model="m", on_token=seen.append)
+
+    assert text == "Hello there"
+    assert seen == ["Hel", "lo", " there"]
+    assert stats["tokens"] == 4 and stats["cached"] is False
+    assert 0.0 <= stats["ttft_s"] <= stats["total_s"]
+
+
+def test_only_deterministic_calls_are_cached_by_default(tmp_path, monkeypatch):
+    calls = []
+
+    class FakeModel:
+        def invoke(self, messages):
+            calls.append(messages)
+            return AIMessageChunk(content=f"reply {len(calls)}")
+
+    monkeypatch.setenv("AAI_LLM_CACHE_PATH", str(tmp_path / "c.sqlite"))
+    monkeypatch.setattr(llm, "get_chat_model", lambda **kwargs: FakeModel())
+    monkeypatch.setattr("agent.llm_cache._cache", None)
+    msgs = [HumanMessage(content="hi")]
+
+    assert llm.invoke_chat(msgs, model="m") == llm.invoke_chat(msgs, model="m") == "reply 1"
+    # A sampled draft (temperature > 0) is regenerated each time...
+    assert [llm.invoke_chat(msgs, model="m", temperature=0.2) for _ in range(2)] == ["reply 2", "reply 3"]
+    # ... unless sampled replies are explicitly cached
+    monkeypatch.setenv("AAI_LLM_CACHE_SAMPLED", "1")
+    assert [llm.invoke_chat(msgs, model="m", temperature=0.2) for _ in range(2)] == ["reply 4", "reply 4"]
+    assert llm.invoke_chat(msgs, model="m", temperature=0.2, use_cache=False) == "reply 5"
+    llm.get_llm_cache().close()
+
+
+def test_call_budget_caps_run_and_rolling_minute():
+    now = [0.0]
+    budget = llm.CallBudget(total=5, per_minute=2, clock=lambda: now[0])
+
+    assert [budget.acquire() for _ in range(3)] == [True, True, False]
+    now[0] = 60.0
+    assert [budget.acquire() for _ in range(3)] == [True, True, False]
+    now[0] = 120.0
+    assert [budget.acquire() for _ in range(2)] == [True, False]  # run total reached
+    assert budget.stats() == {"total": 5, "per_minute": 2, "used": 5, "denied": 3}
@@ -0,0 +1,51 @@
+"""Tests for the persistent LLM response cache."""
+import time
+
+from agent.llm_cache import LLMCache, cache_key
+
+
+def test_cache_key_depends_on_all_inputs():
+    base = cache_key("m", 0.0, [("system", "s"), ("human", "u")])
+
+    assert base == cache_key("m", 0.0, [("system", "s"), ("human", "u")])
+    assert base != cache_key("m2", 0.0, [("system", "s"), ("human", "u")])
+    assert base != cache_key("m", 0.2, [("system", "s"), ("human", "u")])
+    assert base != cache_key("m", 0.0, [("system", "s2"), ("human", "u")])
+
+
+def test_get_put_lru_eviction_and_ttl(tmp_path):
+    cache = LLMCache(str(tmp_path / "c.sqlite"), max_entries=2, ttl_seconds=3600)
+    try:
+        assert cache.get("a") is None
+        cache.put("a", "A")
+        cache.put("b", "B")
+        time.sleep(0.01)
+        assert cache.get("a") == "A"  # "b" is now least recently used
+
+        cache.put("c", "C")
+        stats = cache.stats()
+        assert stats["entries"] == 2
+        assert cache.get("b") is None
+        assert cache.get("c") == "C"
+        assert stats["hits"] == 1 and stats["evictions"] == 1
+    finally:
+        cache.close()
+
+    expired = LLMCache(str(tmp_path / "c.sqlite"), max_entries=10, ttl_seconds=0.001)
+    try:
+        time.sleep(0.01)
+        assert expired.get("a") is None
+        assert expired.stats()["expired"] == 1
+    finally:
+        expired.close()
+
+
+def test_stats_only_reads(tmp_path):
+    cache = LLMCache(str(tmp_path / "c.sqlite"), max_entries=100, ttl_seconds=3600)
+    try:
+        cache.put("a", "A")
+        cache.put("b", "B")
+        cache.max_entries = 1  # over the cap now, but eviction only runs from put()
+        assert cache.stats()["entries"] == 2 and cache.evictions == 0
+    finally:
+        cache.close()
@@ -0,0 +1,99 @@
+"""Tests for the streaming email loader."""
+import io
+import json
+
+import pytest
+
+import ingestion.loader as loader
+from ingestion.loader import _iter_json_array, count_emails, iter_emails, load_emails
+
+
+def test_iter_emails_streams_commented_json_array(tmp_path):
+    p = tmp_path / "emails.json"
+    p.write_text(
+        '[\n'
+        '  {"id": "a", "body": "see http://example.com"}, // first\n'
+        '  // {"id": "skipped"},\n'
+        '  {\n    "id": "b",\n    "subject": "multi-line"\n  }\n'
+        ']\n'
+        'trailing notes are ignored\n',
+        encoding="utf-8",
+    )
+
+    it = iter_emails(str(p))
+    assert next(it) == {"id": "a", "body": "see http://example.com"}
+    assert [e["id"] for e in it] == ["b"]
+
+
+def test_single_line_array_yields_before_the_whole_file_is_read(tmp_path):
+    emails = [{"id": str(i), "body": "see http://example.com/" + "x" * 500} for i in range(2000)]
+    text = json.dumps(emails)  # minified: one line
+    assert "\n" not in text
+
+    class CountingReader(io.StringIO):
+        chars = 0
+
+        def read(self, size=-1):
+            out = super().read(size)
+            self.chars += len(out)
+            return out
+
+    fh = CountingReader(text)
+    it = _iter_json_array(fh, "emails.json")
+    assert next(it) == emails[0]
+    assert fh.chars < len(text) // 4
+    assert list(it) == emails[1:]
+
+    p = tmp_path / "emails.json"
+    p.write_text(text[:-1] + ', // trailing comment\n]', encoding="utf-8")
+    assert len(load_emails(str(p))) == len(emails)
+
+
+def test_large_element_is_decoded_once(monkeypatch):
+    decoder = loader._decoder
+    calls = []
+
+    class CountingDecoder:
+        def raw_decode(self, s, idx=0):
+            calls.append(idx)
+            return decoder.raw_decode(s, idx)
+
+    monkeypatch.setattr(loader, "_decoder", CountingDecoder())
+    monkeypatch.setattr(loader, "_CHUNK_CHARS", 7)
+    emails = [{"id": "big", "body": 'a "quoted" \\ {[' * 50, "tags": [1, [2, {"x": None}]]}, {"id": 12345}, 6789]
+    assert list(_iter_json_array(io.StringIO(json.dumps(emails)), "emails.json")) == emails
+    assert len(calls) == 3  # one decode per element, however many chunks each spans
+
+
+def test_iter_emails_jsonl_and_errors(tmp_path):
+    p = tmp_path / "emails.jsonl"
+    p.write_text('{"id": "a"}\n\n{"id": "b"}\n', encoding="utf-8")
+    assert [e["id"] for e in iter_emails(str(p))] == ["a", "b"]
+
+    bad = tmp_path / "bad.json"
+    bad.write_text('[{"id": "a"}, 3]', encoding="utf-8")
+    with pytest.raises(ValueError, match="index 1"):
+        load_emails(str(bad))
+
+    unterminated = tmp_path / "open.json"
+    unterminated.write_text('[{"id": "a"}', encoding="utf-8")
+    with pytest.raises(ValueError, match="Invalid JSON"):
+        load_emails(str(unterminated))
+
+
+def test_count_emails_when_it_is_cheap(tmp_path, monkeypatch):
+    arr = tmp_path / "emails.json"
+    arr.write_text('[{"id": "a"}, // first\n {"id": "b"}]', encoding="utf-8")
+    lines = tmp_path / "emails.jsonl"
+    lines.write_text('{"id": "a"}\n\n// {"id": "skipped"}\n{"id": "b"}\n{"id": "c"}\n', encoding="utf-8")
+    eml = tmp_path / "one.eml"
+    eml.write_text("Subject: hi\n\nbody\n", encoding="utf-8")
+
+    assert count_emails(str(arr)) == 2
+    assert count_emails(str(lines)) == 3
+    assert count_emails(str(eml)) == 1
+    assert count_emails(str(tmp_path / "missing.json")) is None
+
+    # Large JSON arrays are not parsed twice just to show a total
+    monkeypatch.setattr(loader, "_COUNT_MAX_BYTES", 8)
+    assert count_emails(str(arr)) is None
@@ -0,0 +1,71 @@
+"""Tests for mbox / Maildir / .eml ingestion."""
+import pickle
+
+from ingestion.loader import iter_emails
+from ingestion.mailbox import iter_mbox, mbox_offsets
+
+
+MSG_1 = (
+    "From alice@example.com Mon Jan  1 00:00:00 2024\n"
+    "Message-ID: <m1@example.com>\n"
+    "From: Alice <alice@example.com>\n"
+    "To: sales@example.com\n"
+    "Subject: Pricing\n"
+    "\n"
+    "Hi, what does it cost?\n"
+    ">From here on we quote.\n"
+    "\n"
+)
+
+MSG_2 = (
+    "From bob@example.com Mon Jan  1 00:01:00 2024\n"
+    "From: bob@example.com\n"
+    "To: support@example.com\n"
+    "Cc: ops@example.com\n"
+    "Subject: Broken\n"
+    "MIME-Version: 1.0\n"
+    "Content-Type: text/html; charset=utf-8\n"
+    "\n"
+    "<p>Login <b>fails</b> &amp; times out</p>\n"
+)
+
+
+def test_mbox_lazy_parsing_and_index(tmp_path):
+    p = tmp_path / "inbox.mbox"
+    p.write_text(MSG_1, encoding="utf-8")
+
+    emails = list(iter_emails(str(p)))
+    assert [e["id"] for e in emails] == ["m1@example.com"]
+    assert not emails[0].body_decoded
+    assert emails[0]["from"] == "Alice <alice@example.com>"
+    assert "what does it cost" in emails[0]["body"]
+    assert emails[0].body_decoded
+
+    # Appending mail reuses the persisted index and only scans the new tail
+    with p.open("a", encoding="utf-8") as fh:
+        fh.write(MSG_2)
+    assert list(mbox_offsets(str(p))) == [0, len(MSG_1.encode())]
+
+    second = list(iter_mbox(str(p)))[1]
+    assert second["id"] == "inbox-2"
+    assert second["cc"] == "ops@example.com"
+    assert second["body"] == "Login fails & times out"
+
+    # Pickles as a plain dict for process pools
+    assert pickle.loads(pickle.dumps(second))["subject"] == "Broken"
+
+
+def test_maildir_and_eml(tmp_path):
+    md = tmp_path / "Maildir"
+    (md / "new").mkdir(parents=True)
+    (md / "cur").mkdir()
+    (md / "new" / "1700000000.1.host").write_text(MSG_1.split("\n", 1)[1], encoding="utf-8")
+    (md / "cur" / "1700000001.2.host:2,S").write_text(MSG_2.split("\n", 1)[1], encoding="utf-8")
+
+    assert [e["subject"] for e in iter_emails(str(md))] == ["Pricing", "Broken"]
+
+    eml = tmp_path / "single.eml"
+    eml.write_text(MSG_2.split("\n", 1)[1], encoding="utf-8")
+    (only,) = list(iter_emails(str(eml)))
+    assert only["id"] == "single"
+    assert only["to"] == "support@example.com"
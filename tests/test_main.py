@@ -0,0 +1,121 @@
+"""Tests for the batch drivers in main (async batch mode, process-pool sharding)."""
+import asyncio
+import os
+import queue
+from collections import Counter
+from pathlib import Path
+
+import agent.graph as graph
+import main
+from agent.llm import reset_clients
+from benchmarks.fake_ollama import FakeOllamaServer
+
+
+CONFIG = str(Path(__file__).resolve().parents[1] / "config" / "company_config.json")
+
+
+class FakeGraph:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def ainvoke(self, state):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.001)
+            email = state["email"]
+            if email["id"] == "bad":
+                raise RuntimeError("boom")
+            return {"department_id": email["dept"], "confidence": 0.9, "draft": "ok"}
+        finally:
+            self.in_flight -= 1
+
+
+def test_run_batch_async_bounds_concurrency_and_survives_errors(monkeypatch, capsys):
+    tickets = []
+    monkeypatch.setattr(main, "route", lambda email, triage_result, draft: tickets.append(email["id"]) or "out")
+
+    emails = [{"id": f"e{i}", "dept": "sales" if i % 2 else "support"} for i in range(20)]
+    emails.insert(5, {"id": "bad", "dept": "sales"})
+    pulled = []
+
+    def stream():
+        for e in emails:
+            pulled.append(e["id"])
+            yield e
+
+    graph, counts = FakeGraph(), Counter()
+    asyncio.run(main.run_batch_async(graph, stream(), len(emails), "cfg.json", 3, 3, counts, {}))
+
+    assert graph.max_in_flight == 3  # concurrency (AAI_CONCURRENCY in main)
+    assert len(pulled) == 21 and sorted(tickets) == sorted(e["id"] for e in emails if e["id"] != "bad")
+    assert counts == Counter({"sales": 10, "support": 10})
+    out = capsys.readouterr().out
+    assert "bad failed: boom" in out
+    assert "(21/21)" in out and "(1/21)" in out  # progress shows the known total
+
+
+def test_budget_shares_give_the_remainder_to_the_first_workers(monkeypatch):
+    assert main._budget_shares(10, 4) == [3, 3, 2, 2]
+    assert main._budget_shares(1, 2) == [1, 0]
+    assert main._worker_budgets(3, 5, 2) == [
+        {"AAI_LLM_ROUTING_BUDGET": "2", "AAI_LLM_ROUTING_PER_MINUTE": "3"},
+        {"AAI_LLM_ROUTING_BUDGET": "1", "AAI_LLM_ROUTING_PER_MINUTE": "2"},
+    ]
+    assert main._worker_budgets(None, 4, 2) == [{"AAI_LLM_ROUTING_PER_MINUTE": "2"}] * 2
+
+    monkeypatch.setattr(main, "build_graph", lambda: None)
+    monkeypatch.setenv("AAI_LLM_ROUTING_BUDGET", "3")
+    monkeypatch.setenv("AAI_LLM_ROUTING_PER_MINUTE", "5")
+    shares = queue.Queue()
+    for env in main._worker_budgets(3, 5, 2):
+        shares.put(env)
+    seen = []
+    for _ in range(2):
+        main._init_worker(CONFIG, shares)
+        seen.append((os.environ["AAI_LLM_ROUTING_BUDGET"], os.environ["AAI_LLM_ROUTING_PER_MINUTE"]))
+    assert seen == [("2", "3"), ("1", "2")]
+
+    # A replacement worker finds the queue empty: no share, and it does not block
+    monkeypatch.setattr(shares, "get", lambda timeout=None: (_ for _ in ()).throw(queue.Empty()))
+    main._init_worker(CONFIG, shares)
+    assert (os.environ["AAI_LLM_ROUTING_BUDGET"], os.environ["AAI_LLM_ROUTING_PER_MINUTE"]) == ("0", "0")
+
+
+def test_run_sharded_merges_results_and_metrics(tmp_path, monkeypatch):
+    for key, value in {
+        "AAI_LLM_CACHE": "0", "AAI_MEMORY_PATH": str(tmp_path / "memory.sqlite"), "AAI_SENDER_MEMORY": "0",
+        "AAI_KNN_ROUTER": "0", "AAI_DEDUP": "0", "AAI_THREADS": "0", "AAI_ROUTER_BATCH_SIZE": "1",
+        "AAI_LLM_ROUTING_BUDGET": "3",
+    }.items():
+        monkeypatch.setenv(key, value)
+    tickets = []
+    monkeypatch.setattr(main, "route", lambda email, triage_result, draft: tickets.append(email["id"]) or "out")
+    main.REGISTRY.reset()
+    graph.reset_routing_budget()
+    reset_clients()
+
+    # 4 emails resolved by alias, 8 that only the (budgeted) LLM stage could route
+    emails = [{"id": f"a{i}", "from": "x@client.io", "to": "sales@example.com", "subject": f"Hi {i}", "body": "Hello"}
+              for i in range(4)]
+    emails += [{"id": f"q{i}", "from": "y@client.io", "to": "inbox@example.com", "subject": f"Quarterly widgets {i}",
+                "body": ""} for i in range(8)]
+    counts = Counter()
+    try:
+        with FakeOllamaServer() as srv:
+            monkeypatch.setenv("OLLAMA_BASE_URL", srv.base_url)
+            main.run_sharded(iter(emails), len(emails), CONFIG, 1, 2, 2, counts, {})
+
+        assert sorted(tickets) == sorted(e["id"] for e in emails)
+        assert sum(counts.values()) == 12 and counts["sales"] >= 4
+        stages = main.routing_stage_counts()
+        assert stages["alias"] == 4
+        assert stages.get("llm", 0) <= 3 and stages.get("llm", 0) + stages.get("budget", 0) == 8
+        nodes = [h for h in main.REGISTRY.snapshot()["histograms"] if h["name"] == "aai_node_seconds"]
+        assert {h["labels"]["node"] for h in nodes} >= {"load_config", "route_assign", "draft"}
+        assert all(h["count"] == 12 for h in nodes if h["labels"]["node"] == "route_assign")
+    finally:
+        main.REGISTRY.reset()
+        graph.reset_routing_budget()
+        reset_clients()
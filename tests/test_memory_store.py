@@ -0,0 +1,71 @@
+"""Tests for the sender memory (JSON dict and SQLite store)."""
+import json
+
+from memory.store import (
+    DEFAULT_MEMORY,
+    MemoryStore,
+    choose_owner_round_robin,
+    get_department_tone,
+    get_sender_department,
+    get_sender_owner,
+    load_memory,
+    open_memory_store,
+    set_sender_department,
+    set_sender_owner,
+)
+
+
+def test_load_memory_does_not_share_defaults(tmp_path):
+    mem = load_memory(str(tmp_path / "m.json"))
+    mem["department_tone"]["Sales"] = "changed"
+    set_sender_department(mem, "a@x.com", "Sales")
+
+    assert DEFAULT_MEMORY["department_tone"]["Sales"] != "changed"
+    assert DEFAULT_MEMORY["sender_department"] == {}
+
+
+def test_store_imports_legacy_json_and_persists_updates(tmp_path):
+    legacy = tmp_path / "memory_store.json"
+    legacy.write_text(json.dumps({"sender_department": {"Mila@Acme.com": "Sales"}}), encoding="utf-8")
+
+    store = open_memory_store(str(legacy))
+    assert open_memory_store(str(legacy)) is store
+    assert get_sender_department(store, "mila@acme.com") == "Sales"
+    assert get_department_tone(store, "Support") == DEFAULT_MEMORY["department_tone"]["Support"]
+
+    set_sender_department(store, "b@y.com", "Finance")
+    set_sender_department(store, "b@y.com", "Finance")
+    set_sender_department(store, "c@y.com", "Bogus")
+    set_sender_owner(store, "b@y.com", "Finance1@Triag3.com")
+    assert store.sender_department_hits("b@y.com") == 2
+    set_sender_department(store, "b@y.com", "Finance", reviewed=True)
+    assert store.sender_prior("b@y.com") == ("Finance", 3, 1, None)
+    set_sender_department(store, "b@y.com", "Sales")  # an unreviewed guess does not replace it
+    assert store.sender_prior("b@y.com")[:3] == ("Finance", 3, 1)
+    assert get_sender_department(store, "c@y.com") is None
+    assert get_sender_owner(store, "B@y.com") == "finance1@triag3.com"
+    store.close()
+
+    # Updates went straight to the database; the JSON file was never rewritten
+    assert "b@y.com" not in legacy.read_text(encoding="utf-8")
+    reopened = MemoryStore(str(tmp_path / "memory_store.sqlite"))
+    try:
+        assert get_sender_department(reopened, "b@y.com") == "Finance"
+        assert reopened.counts() == {"sender_department": 2, "sender_owner": 1}
+    finally:
+        reopened.close()
+
+
+def test_round_robin_is_shared_across_store_instances(tmp_path):
+    db = str(tmp_path / "m.sqlite")
+    a, b = MemoryStore(db), MemoryStore(db)
+    try:
+        owners = {"department_owners": {"Sales": ["s1@x.com", "s2@x.com", "s3@x.com"]}}
+        a.set_section("department_owners", owners["department_owners"])
+        b.set_section("department_owners", owners["department_owners"])
+
+        picks = [choose_owner_round_robin(m, "Sales") for m in (a, b, a, b)]
+        assert picks == ["s1@x.com", "s2@x.com", "s3@x.com", "s1@x.com"]
+    finally:
+        a.close()
+        b.close()
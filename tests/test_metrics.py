@@ -0,0 +1,39 @@
+"""Tests for the metrics registry and exporters."""
+import json
+
+from utils.metrics import Metrics, REGISTRY, prometheus_text, timed_node, write_json_report
+
+
+def test_histogram_percentiles_and_merge():
+    a, b = Metrics(), Metrics()
+    for v in range(1, 101):
+        a.observe("lat", v / 100.0, {"node": "draft"})
+    b.observe("lat", 5.0, {"node": "draft"})
+    b.inc("calls", {"model": "m"}, 3)
+
+    a.merge_state(b.export_state())
+    snap = a.snapshot()
+    (h,) = snap["histograms"]
+
+    assert h["count"] == 101 and h["max"] == 5.0
+    assert 0.45 <= h["p50"] <= 0.55
+    assert h["buckets"]["+Inf"] == 101 and h["buckets"]["0.5"] == 50
+    assert snap["counters"] == [{"name": "calls", "labels": {"model": "m"}, "value": 3.0}]
+
+
+def test_timed_node_and_exports(tmp_path):
+    REGISTRY.reset()
+    node = timed_node("route_assign", lambda state: dict(state, done=True))
+    assert node({"x": 1}) == {"x": 1, "done": True}
+    REGISTRY.inc("aai_routing_decisions_total", {"stage": "alias"})
+
+    text = prometheus_text()
+    assert "# TYPE aai_node_seconds histogram" in text
+    assert 'aai_node_seconds_count{node="route_assign"} 1' in text
+    assert 'aai_routing_decisions_total{stage="alias"} 1' in text
+
+    path = tmp_path / "metrics.json"
+    write_json_report(str(path), {"extra": 1})
+    report = json.loads(path.read_text(encoding="utf-8"))
+    assert report["extra"] == 1 and report["histograms"][0]["labels"] == {"node": "route_assign"}
+    REGISTRY.reset()
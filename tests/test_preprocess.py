@@ -0,0 +1,31 @@
+"""Tests for email cleaning and the prompt token budget."""
+import time
+
+from ingestion.preprocess import estimate_tokens, preprocess_email, truncate_to_tokens
+
+
+def test_preprocess_strips_quotes_signature_and_extra_whitespace():
+    email = {"id": 1, "subject": "  Hi ", "body": "Hello  there\r\n\r\n\r\n\r\nCan you help?\r\n--\r\nBob\r\n"}
+    assert preprocess_email(email) == {"id": "1", "from": "", "subject": "Hi", "body": "Hello there\n\nCan you help?"}
+
+    reply = preprocess_email({"body": "Sure.\nOn Tue, Jan 2, Bob <bob@x.com> wrote:\n> Can you help?"})
+    assert reply["body"] == "Sure."
+    # A leading "On ..." sentence is the message itself, not a quote header
+    assert preprocess_email({"body": "On Monday the app crashed."})["body"] == "On Monday the app crashed."
+
+    # Linear on pathological input (many unterminated quote headers)
+    start = time.perf_counter()
+    preprocess_email({"body": "\nOn " * 50000})
+    assert time.perf_counter() - start < 1.0
+
+
+def test_truncate_keeps_head_and_tail_within_budget():
+    text = " ".join(f"w{i}" for i in range(2000))
+    assert truncate_to_tokens("short text", 100) == ("short text", False)
+    assert truncate_to_tokens(text, 0) == (text, False)
+
+    out, truncated = truncate_to_tokens(text, 100)
+    assert truncated
+    assert out.startswith("w0 w1 ") and out.endswith(" w1999")
+    assert "tokens omitted ...]" in out
+    assert estimate_tokens(out) <= 100 + 10  # budget plus the marker
@@ -0,0 +1,45 @@
+"""Tests for the prefetching review queue."""
+import threading
+import time
+
+from agent.review_queue import ReviewQueue
+
+
+def test_yields_in_order_and_prefetches_ahead():
+    started = []
+    lock = threading.Lock()
+
+    def prepare(email):
+        with lock:
+            started.append(email["id"])
+        time.sleep(0.05 if email["id"] == 1 else 0.0)
+        return {"id": email["id"]}
+
+    emails = ({"id": n} for n in range(1, 7))
+    queue = ReviewQueue(emails, prepare, depth=2)
+
+    seen = []
+    for i, email, state, err in queue:
+        assert err is None and state["id"] == email["id"] == i
+        if i == 1:
+            # While email 1 is "under review", exactly `depth` more are in flight
+            time.sleep(0.05)
+            assert sorted(started) == [1, 2, 3]
+        seen.append(i)
+
+    assert seen == [1, 2, 3, 4, 5, 6]
+    stats = queue.stats()
+    assert stats["ready"] + stats["waited"] == 6
+
+
+def test_prepare_errors_are_passed_through():
+    def prepare(email):
+        if email["id"] == 2:
+            raise RuntimeError("boom")
+        return dict(email)
+
+    out = [(i, state, err) for i, _, state, err in ReviewQueue([{"id": 1}, {"id": 2}, {"id": 3}], prepare, depth=1)]
+
+    assert [i for i, _, _ in out] == [1, 2, 3]
+    assert out[1][1] is None and str(out[1][2]) == "boom"
+    assert out[2][2] is None
@@ -22,7 +22,7 @@ def test_route_creates_file():
         assert Path(path).exists()
         with open(path) as f:
             data = json.load(f)
-        assert data["ticket_id"] == "test-123"
+        assert data["ticket_id"].startswith("test-123_")
         assert data["department"] == "Support"
         assert data["draft_reply"] == draft
     finally:
@@ -0,0 +1,34 @@
+"""Tests for ticket sinks."""
+import gzip
+import json
+
+from routing.router import route
+from routing.sinks import JsonlTicketSink, new_ticket_id
+
+
+EMAIL = {"id": "e1", "from": "a@example.com", "subject": "S", "body": "B"}
+
+
+def test_ticket_ids_are_unique():
+    ids = {new_ticket_id("e1") for _ in range(1000)}
+    assert len(ids) == 1000
+
+
+def test_jsonl_sink_buffers_rotates_and_compresses(tmp_path):
+    sink = JsonlTicketSink(str(tmp_path), flush_every=2, flush_interval=0, rotate_bytes=1, compress=True)
+    try:
+        p1 = route(EMAIL, {"department": "sales", "confidence": 0.9}, "draft 1", sink=sink)
+        assert sink._buffered == 1
+
+        route(EMAIL, {"department": "sales", "confidence": 0.8}, "draft 2", sink=sink)  # flush + rotate
+        p3 = route(EMAIL, {"department": "sales", "confidence": 0.7}, "draft 3", sink=sink)
+    finally:
+        sink.close()
+
+    assert p3 != p1
+    segments = sorted((tmp_path / "sales").glob("tickets-*.jsonl.gz"))
+    assert len(segments) == 2
+
+    tickets = [json.loads(line) for seg in segments for line in gzip.open(seg, "rt", encoding="utf-8")]
+    assert [t["draft_reply"] for t in tickets] == ["draft 1", "draft 2", "draft 3"]
+    assert all(t["ticket_id"].startswith("e1_") for t in tickets)
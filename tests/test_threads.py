@@ -0,0 +1,101 @@
+"""Tests for the conversation thread index."""
+from pathlib import Path
+
+import agent.graph as graph
+from memory.threads import ThreadIndex, new_text, subject_key
+
+
+# Absolute: an older test leaves the working directory elsewhere
+CONFIG = str(Path(__file__).resolve().parents[1] / "config" / "company_config.json")
+
+FIRST = {
+    "id": "m1", "message_id": "<m1@client.io>", "from": "Ann <ann@client.io>", "to": "inbox@example.com",
+    "subject": "Export keeps failing",
+    "body": "Hi, the nightly export keeps failing since Monday. Can you check? Ann",
+}
+REPLY = {
+    "id": "m3", "message_id": "<m3@client.io>", "in_reply_to": "<m2@example.com>",
+    "references": "<m1@client.io> <m2@example.com>", "from": "ann@client.io", "to": "inbox@example.com",
+    "subject": "RE: Export keeps failing",
+    "body": "Still broken today, same error code.\n\nOn Tue, Julia wrote:\n> Could you send the error code?\n> Julia",
+}
+
+
+def test_find_by_headers_and_subject(tmp_path):
+    index = ThreadIndex(str(tmp_path / "threads.sqlite"))
+    assert index.find(FIRST) is None
+
+    tid = index.record(FIRST, "support", owner_email="julia@example.com", reply="Could you send the error code? Thanks.")
+    assert index.find(REPLY)["thread_id"] == tid  # via References
+
+    # No headers, but "Re:" + same subject from the same sender
+    bare = {"from": "Ann <ANN@client.io>", "subject": "Re: export keeps  failing", "body": "Any news?"}
+    assert index.find(bare)["department_id"] == "support"
+    assert index.find(dict(bare, subject="Export keeps failing")) is None  # not a reply
+    # Another customer on the same domain never lands in Ann's thread
+    assert index.find(dict(bare, **{"from": "bob@client.io"})) is None
+    assert index.find(dict(bare, **{"from": "eve@other.org"})) is None
+
+    index.record(REPLY, "support", owner_email="julia@example.com")
+    thread = index.find(REPLY)
+    assert thread["messages"] == 2
+    assert thread["summary"].splitlines() == [
+        "- ann@client.io: Hi, the nightly export keeps failing since Monday. Can you check? Ann",
+        "- julia@example.com: Could you send the error code? Thanks.",
+        "- ann@client.io: Still broken today, same error code.",
+    ]
+    assert index.counts() == (1, 3)
+
+
+def test_forwards_and_reprocessed_messages_are_not_replies(tmp_path):
+    index = ThreadIndex(str(tmp_path / "threads.sqlite"))
+    tid = index.record(FIRST, "support", owner_email="julia@example.com")
+
+    # Reprocessing the same Message-ID is not a reply to itself, and records no second thread
+    assert index.find(FIRST) is None
+    assert index.record(FIRST, "support") == tid and index.counts()[0] == 1
+
+    fwd = {"message_id": "<f1@client.io>", "references": "<m1@client.io>", "from": "ann@client.io",
+           "subject": "Fwd: Export keeps failing", "body": "FYI, see below."}
+    assert index.find(fwd) is None
+    assert index.find(dict(fwd, message_id="<f2@client.io>", references="", subject="FW: Export keeps failing")) is None
+    assert index.find(dict(fwd, message_id="<r1@client.io>", subject="Re: Fwd: Export keeps failing"))["thread_id"] == tid
+
+
+def test_new_text_and_subject_key():
+    assert new_text(REPLY) == "Still broken today, same error code."
+    assert subject_key(REPLY) == subject_key({"from": "Ann@Client.io", "subject": "Fwd: Re: Export keeps failing"})
+    assert subject_key(REPLY) != subject_key({"from": "bob@client.io", "subject": "Re: Export keeps failing"})
+
+
+def test_reply_inherits_route_and_drafts_from_new_text(tmp_path, monkeypatch):
+    monkeypatch.setenv("AAI_MEMORY_PATH", str(tmp_path / "memory.sqlite"))
+    monkeypatch.setenv("AAI_SENDER_MEMORY", "0")
+    monkeypatch.setenv("AAI_KNN_ROUTER", "0")
+    monkeypatch.setenv("AAI_DEDUP", "0")
+
+    prompts = []
+
+    def fake_run_draft(messages, on_token=None, stats=None):
+        prompts.append(messages[-1][1])
+        return "Thanks, we are looking into it."
+
+    monkeypatch.setattr(graph, "run_draft", fake_run_draft)
+    monkeypatch.setattr(graph, "llm_route_department", lambda cfg, email: {"department_id": "support", "confidence": 0.65, "stage": "llm"})
+    g = graph.build_graph()
+
+    def run(email):
+        return g.invoke({"email": email, "config_path": CONFIG, "interactive": False})
+
+    first = run(FIRST)
+    reply = run(dict(REPLY, subject="RE: Export keeps failing (billing?)", in_reply_to="<m1@client.io>", references=""))
+
+    assert reply["routing_stage"] == "thread"
+    assert reply["department_id"] == first["department_id"] and reply["owner_email"] == first["owner_email"]
+    assert "CONVERSATION SO FAR" in prompts[1] and "nightly export keeps failing" in prompts[1]
+    assert "Could you send the error code" not in prompts[1].split("=== NEW MESSAGE ===")[1]
+
+    # Replying to a department alias overrides the thread's route, but keeps its summary
+    aliased = run(dict(REPLY, message_id="<m4@client.io>", to="sales@example.com", in_reply_to="<m1@client.io>"))
+    assert aliased["routing_stage"] == "alias" and aliased["department_id"] == "sales"
+    assert aliased["thread_id"] == reply["thread_id"]
@@ -0,0 +1,20 @@
+"""Tests for triage_batch parity with triage."""
+import json
+from pathlib import Path
+
+from agent.triage_agent import triage, triage_batch
+from ingestion.loader import load_emails
+
+
+def test_triage_batch_matches_triage():
+    emails = load_emails(str(Path(__file__).resolve().parents[1] / "data" / "sample_emails.json"))
+    emails += [
+        {"subject": "", "body": ""},
+        {"subject": "Reference check", "body": "Please confirm employment dates."},
+        {"subject": "Hello", "body": "Just saying hi."},
+        {"subject": "Invoice INV-2 wrong", "body": "Login error 500 when paying, pricing demo?"},
+        {"subject": "", "body": "x" * 200},
+    ]
+
+    assert triage_batch(emails) == [triage(e) for e in emails]
+    assert triage_batch([]) == []
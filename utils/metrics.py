@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import bisect
+import functools
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Latency buckets in seconds (Prometheus-style upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+# Samples kept per histogram for percentiles (uniform reservoir, so memory stays bounded)
+RESERVOIR_SIZE = 2048
+
+_Labels = Tuple[Tuple[str, str], ...]
+_Key = Tuple[str, _Labels]
+
+
+def _labels(labels: Optional[Dict[str, Any]]) -> _Labels:
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum", "max", "samples", "_seen")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples: List[float] = []
+        self._seen = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self._keep(value)
+
+    def _keep(self, value: float) -> None:
+        self._seen += 1
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            j = random.randrange(self._seen)
+            if j < RESERVOIR_SIZE:
+                self.samples[j] = value
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+        return ordered[idx]
+
+    def merge(self, other: Dict[str, Any]) -> None:
+        for i, c in enumerate(other["counts"]):
+            self.counts[i] += c
+        self.count += other["count"]
+        self.sum += other["sum"]
+        self.max = max(self.max, other["max"])
+        for v in other["samples"]:
+            self._keep(v)
+
+    def state(self) -> Dict[str, Any]:
+        return {"counts": list(self.counts), "count": self.count, "sum": self.sum, "max": self.max, "samples": list(self.samples)}
+
+
+class Metrics:
+    """Thread-safe registry of labelled histograms and counters."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms: Dict[_Key, Histogram] = {}
+        self._counters: Dict[_Key, float] = {}
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(float(value))
+
+    def inc(self, name: str, labels: Optional[Dict[str, Any]] = None, amount: float = 1.0) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def export_state(self) -> Dict[str, Any]:
+        """Picklable raw state, e.g. to ship a worker process's metrics back to the parent."""
+        with self._lock:
+            return {
+                "histograms": [(n, list(lb), h.state()) for (n, lb), h in self._histograms.items()],
+                "counters": [(n, list(lb), v) for (n, lb), v in self._counters.items()],
+            }
+
+    def merge_state(self, state: Dict[str, Any]) -> None:
+        with self._lock:
+            for name, labels, hstate in state.get("histograms", []):
+                key = (name, tuple(tuple(x) for x in labels))
+                hist = self._histograms.get(key)
+                if hist is None:
+                    hist = self._histograms[key] = Histogram()
+                hist.merge(hstate)
+            for name, labels, value in state.get("counters", []):
+                key = (name, tuple(tuple(x) for x in labels))
+                self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary per series: count, sum, mean, max, p50/p90/p95/p99 and cumulative buckets."""
+        with self._lock:
+            hists = list(self._histograms.items())
+            counters = list(self._counters.items())
+
+        out_h = []
+        for (name, labels), h in sorted(hists, key=lambda kv: kv[0]):
+            cumulative, running = {}, 0
+            for bound, c in zip(list(h.buckets) + [float("inf")], h.counts):
+                running += c
+                cumulative["+Inf" if bound == float("inf") else repr(bound)] = running
+            out_h.append({
+                "name": name,
+                "labels": dict(labels),
+                "count": h.count,
+                "sum": h.sum,
+                "mean": (h.sum / h.count) if h.count else 0.0,
+                "max": h.max,
+                "p50": h.percentile(50),
+                "p90": h.percentile(90),
+                "p95": h.percentile(95),
+                "p99": h.percentile(99),
+                "buckets": cumulative,
+            })
+
+        out_c = [{"name": n, "labels": dict(lb), "value": v} for (n, lb), v in sorted(counters)]
+        return {"histograms": out_h, "counters": out_c}
+
+
+REGISTRY = Metrics()
+
+
+# ----------------------------
+# Instrumentation helpers
+# ----------------------------
+
+def timed_node(name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a graph node so its wall time is recorded as aai_node_seconds{node=name}."""
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            REGISTRY.observe("aai_node_seconds", time.perf_counter() - started, {"node": name})
+
+    return wrapper
+
+
+def record_llm_call(
+    model: str,
+    latency_s: float,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+    cached: bool = False,
+) -> None:
+    labels = {"model": model, "cached": "true" if cached else "false"}
+    REGISTRY.inc("aai_llm_calls_total", labels)
+    REGISTRY.observe("aai_llm_call_seconds", latency_s, labels)
+    if prompt_tokens:
+        REGISTRY.inc("aai_llm_prompt_tokens_total", {"model": model}, prompt_tokens)
+    if completion_tokens:
+        REGISTRY.inc("aai_llm_completion_tokens_total", {"model": model}, completion_tokens)
+
+
+def record_llm_error(model: str) -> None:
+    REGISTRY.inc("aai_llm_errors_total", {"model": model})
+
+
+def record_routing_stage(stage: str) -> None:
+    REGISTRY.inc("aai_routing_decisions_total", {"stage": stage or "unknown"})
+
+
+# ----------------------------
+# Export
+# ----------------------------
+
+def _atomic_write(path: str, text: str) -> None:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def write_json_report(path: str, extra: Optional[Dict[str, Any]] = None) -> None:
+    report: Dict[str, Any] = {"generated_at": datetime.now(timezone.utc).isoformat()}
+    report.update(REGISTRY.snapshot())
+    if extra:
+        report.update(extra)
+    _atomic_write(path, json.dumps(report, indent=2, ensure_ascii=False, default=str))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(labels: Dict[str, str], **more: str) -> str:
+    items = list(labels.items()) + list(more.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in items) + "}"
+
+
+def prometheus_text() -> str:
+    snap = REGISTRY.snapshot()
+    lines: List[str] = []
+
+    typed = set()
+    for h in snap["histograms"]:
+        name = h["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        for le, c in h["buckets"].items():
+            lines.append(f"{name}_bucket{_prom_labels(h['labels'], le=le)} {c}")
+        lines.append(f"{name}_sum{_prom_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{name}_count{_prom_labels(h['labels'])} {h['count']}")
+
+    for c in snap["counters"]:
+        name = c["name"]
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_prom_labels(c['labels'])} {c['value']:g}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str) -> None:
+    """Prometheus textfile-collector format, written atomically."""
+    _atomic_write(path, prometheus_text())